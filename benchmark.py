@@ -0,0 +1,374 @@
+import argparse  # for the command line
+import json  # for the results
+import math  # for the polygons of the flexible areas
+import os  # for the temporary files
+import random  # for the synthetic data
+import sys  # for the exit code
+import tempfile  # for the generated NeTEx files and the zips
+import time  # for the timers
+from concurrent.futures import ProcessPoolExecutor  # for a fresh process (and peak memory) per scale
+from multiprocessing import get_context
+from typing import TextIO
+
+# The converter stages that are timed (their time includes the stages they call: the FPLAN loop (convert_flexible_line)
+# includes create_region_and_bfkoord, which includes write_as_ac_stops). The FPLAN is rendered once all flexible lines
+# are converted (FplanTable.write_to)
+BENCHMARK_STAGES = ["read_netex", "create_and_return_bitfields", "convert_flexible_line", "create_region_and_bfkoord",
+                    "write_as_ac_stops", "FplanTable.write_to"]
+
+# The scales of the benchmark: flexible lines, service journeys per line, availability conditions per line, vertices per
+# polygon of a flexible area, stop places and operators
+BENCHMARK_SCALES = {
+    'small': {'flexible_lines': 10, 'service_journeys': 10, 'availability_conditions': 3, 'polygon_vertices': 16,
+              'stop_places': 2000, 'operators': 3},
+    'medium': {'flexible_lines': 50, 'service_journeys': 40, 'availability_conditions': 5, 'polygon_vertices': 64,
+               'stop_places': 10000, 'operators': 10},
+    'large': {'flexible_lines': 200, 'service_journeys': 100, 'availability_conditions': 8, 'polygon_vertices': 256,
+              'stop_places': 40000, 'operators': 30},
+}
+
+# The PrivateCodes of the first operators are known in the resources/betrieb_de file, the others are not
+KNOWN_OPERATOR_CODES = ["813", "38", "128"]
+
+
+######### Synthetic NeTEx #############
+# write a synthetic NeTEx ODV export with the given numbers of records to the given path. The same parameters (and seed)
+# always result in the same file
+def generate_netex(netex_file_path: str, flexible_lines: int = 10, service_journeys: int = 10,
+                   availability_conditions: int = 3, polygon_vertices: int = 16, stop_places: int = 2000,
+                   operators: int = 3, seed: int = 1):
+    rnd = random.Random(seed)
+
+    with open(netex_file_path, "w", encoding="utf-8") as netex_file:
+        netex_file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                         '<PublicationDelivery xmlns="http://www.netex.org.uk/netex" '
+                         'xmlns:gml="http://www.opengis.net/gml/3.2" xmlns:siri="http://www.siri.org.uk/siri" '
+                         'version="1.0">\n'
+                         '<PublicationTimestamp>2025-01-01T00:00:00</PublicationTimestamp>\n<dataObjects>\n'
+                         '<CompositeFrame id="ch:1:CompositeFrame:1" version="1">\n'
+                         '<validityConditions><ValidBetween><FromDate>2024-12-15T00:00:00</FromDate>'
+                         '<ToDate>2025-12-13T00:00:00</ToDate></ValidBetween></validityConditions>\n<frames>\n')
+
+        write_resource_frame(netex_file, operators)
+        write_site_frame(netex_file, rnd, flexible_lines, polygon_vertices, stop_places)
+        write_service_frame(netex_file, flexible_lines, operators)
+        write_timetable_frame(netex_file, rnd, flexible_lines, service_journeys, availability_conditions)
+
+        netex_file.write('</frames>\n</CompositeFrame>\n</dataObjects>\n</PublicationDelivery>\n')
+
+
+# write the operators
+def write_resource_frame(netex_file: TextIO, operators: int):
+    netex_file.write('<ResourceFrame id="ch:1:ResourceFrame:1" version="1"><organisations>\n')
+
+    for operator in range(operators):
+        private_code = KNOWN_OPERATOR_CODES[operator] if operator < len(KNOWN_OPERATOR_CODES) \
+            else str(990000 + operator)
+        netex_file.write(f'<Operator id="ch:1:Operator:{operator}" version="1">'
+                         f'<PrivateCode>{private_code}</PrivateCode><Name>Operator {operator}</Name>'
+                         f'<ShortName>OP{operator}</ShortName>'
+                         f'<Description>Operator {operator} description</Description></Operator>\n')
+
+    netex_file.write('</organisations></ResourceFrame>\n')
+
+
+# write the stop places (mostly regular stops) and two flexible areas per flexible line
+def write_site_frame(netex_file: TextIO, rnd: random.Random, flexible_lines: int, polygon_vertices: int,
+                     stop_places: int):
+    netex_file.write('<SiteFrame id="ch:1:SiteFrame:1" version="1"><stopPlaces>\n')
+
+    for stop_place in range(stop_places):
+        longitude = round(rnd.uniform(6.0, 10.0), rnd.choice([4, 5, 6]))
+        latitude = round(rnd.uniform(45.8, 47.8), rnd.choice([4, 5, 6]))
+        type_of_place = "regularStop" if rnd.random() < 0.9 else "flexibleStop"
+        netex_file.write(f'<StopPlace id="ch:1:StopPlace:{stop_place}" version="1">'
+                         f'<Name>Stop {stop_place} &amp; Co</Name><Centroid><Location>'
+                         f'<Longitude>{longitude}</Longitude><Latitude>{latitude}</Latitude></Location></Centroid>'
+                         f'<PublicCode>{8500000 + stop_place}</PublicCode>'
+                         f'<TypeOfPlaceRef ref="ch:1:TypeOfPlace:{type_of_place}"/></StopPlace>\n')
+
+    netex_file.write('</stopPlaces><flexibleStopPlaces>\n')
+
+    for flexible_area in range(flexible_lines * 2):
+        center_longitude, center_latitude = rnd.uniform(6.5, 9.5), rnd.uniform(46.0, 47.5)
+        radius = rnd.uniform(0.1, 0.6)
+
+        positions = []
+        for vertex in range(polygon_vertices):
+            angle = 2 * math.pi * vertex / polygon_vertices
+            vertex_radius = radius * rnd.uniform(0.6, 1.0)
+            positions.append(f'<gml:pos>{round(center_longitude + vertex_radius * math.cos(angle), 6)} '
+                             f'{round(center_latitude + vertex_radius * math.sin(angle), 6)}</gml:pos>')
+        positions.append(positions[0])  # close the ring
+
+        netex_file.write(f'<FlexibleStopPlace id="ch:1:FlexibleStopPlace:{flexible_area}" version="1"><areas>'
+                         f'<FlexibleArea id="ch:1:FlexibleArea:{flexible_area}" version="1">'
+                         f'<Name>Area {flexible_area}</Name><gml:Polygon gml:id="p{flexible_area}"><gml:exterior>'
+                         f'<gml:LinearRing>{"".join(positions)}</gml:LinearRing></gml:exterior></gml:Polygon>'
+                         f'</FlexibleArea></areas></FlexibleStopPlace>\n')
+
+    netex_file.write('</flexibleStopPlaces></SiteFrame>\n')
+
+
+# write the flexible lines (with booking arrangements), two service journey patterns per line and their assignments
+def write_service_frame(netex_file: TextIO, flexible_lines: int, operators: int):
+    netex_file.write('<ServiceFrame id="ch:1:ServiceFrame:1" version="1"><lines>\n')
+
+    for flexible_line in range(flexible_lines):
+        netex_file.write(f'<FlexibleLine id="ch:1:FlexibleLine:{flexible_line}" version="1">'
+                         f'<Name>Offer {flexible_line}</Name>'
+                         f'<OperatorRef ref="ch:1:Operator:{flexible_line % operators}"/><bookingArrangements>'
+                         f'<BookingArrangement id="ch:1:BookingArrangement:TA_{flexible_line}">'
+                         f'<BookingNote>Call {flexible_line}</BookingNote></BookingArrangement>'
+                         f'<BookingArrangement id="ch:1:BookingArrangement:QQ_{flexible_line}">'
+                         f'<BookingNote>Book online {flexible_line}</BookingNote></BookingArrangement>'
+                         f'</bookingArrangements></FlexibleLine>\n')
+
+    netex_file.write('</lines><journeyPatterns>\n')
+
+    for flexible_line in range(flexible_lines):
+        for pattern in range(2):
+            netex_file.write(f'<ServiceJourneyPattern id="ch:1:ServiceJourneyPattern:{flexible_line}_{pattern}" '
+                             f'version="1"><pointsInSequence><StopPointInJourneyPattern '
+                             f'id="ch:1:StopPointInJourneyPattern:{flexible_line}_{pattern}" order="1">'
+                             f'<ScheduledStopPointRef ref="ch:1:ScheduledStopPoint:{flexible_line}_{pattern}"/>'
+                             f'</StopPointInJourneyPattern></pointsInSequence></ServiceJourneyPattern>\n')
+
+    netex_file.write('</journeyPatterns><stopAssignments>\n')
+
+    for flexible_line in range(flexible_lines):
+        for pattern in range(2):
+            flexible_area = flexible_line * 2 + pattern
+            netex_file.write(f'<FlexibleStopAssignment id="ch:1:FlexibleStopAssignment:{flexible_line}_{pattern}" '
+                             f'version="1" order="1">'
+                             f'<ScheduledStopPointRef ref="ch:1:ScheduledStopPoint:{flexible_line}_{pattern}"/>'
+                             f'<FlexibleStopPlaceRef ref="ch:1:FlexibleStopPlace:{flexible_area}"/>'
+                             f'<FlexibleAreaRef ref="ch:1:FlexibleArea:{flexible_area}"/></FlexibleStopAssignment>\n')
+
+    netex_file.write('</stopAssignments></ServiceFrame>\n')
+
+
+# write the availability conditions and the service journeys, each referencing a random condition and pattern of its
+# line (thus some triples of line, pattern and condition repeat)
+def write_timetable_frame(netex_file: TextIO, rnd: random.Random, flexible_lines: int, service_journeys: int,
+                          availability_conditions: int):
+    netex_file.write('<TimetableFrame id="ch:1:TimetableFrame:1" version="1"><contentValidityConditions>\n')
+
+    valid_day_bits = ["".join(rnd.choice("01") for _ in range(363))
+                      for _ in range(max(1, availability_conditions // 2))]
+
+    for availability_condition in range(availability_conditions * flexible_lines):
+        start_time = f'{rnd.randint(5, 9):02d}:{rnd.choice([0, 15, 30]):02d}:00'
+        end_time = f'{rnd.randint(18, 23):02d}:{rnd.choice([0, 30, 45]):02d}:00'
+        if availability_condition % 7 == 3:
+            end_time = '01:30:00'  # over midnight
+
+        netex_file.write(f'<AvailabilityCondition id="ch:1:AvailabilityCondition:{availability_condition}" '
+                         f'version="1"><FromDate>2024-12-15T00:00:00</FromDate><ToDate>2025-12-13T00:00:00</ToDate>'
+                         f'<ValidDayBits>{rnd.choice(valid_day_bits)}</ValidDayBits><timebands>'
+                         f'<Timeband id="ch:1:Timeband:{availability_condition}" version="1">'
+                         f'<StartTime>{start_time}</StartTime><EndTime>{end_time}</EndTime></Timeband></timebands>'
+                         f'</AvailabilityCondition>\n')
+
+    netex_file.write('</contentValidityConditions><vehicleJourneys>\n')
+
+    service_journey = 0
+    for flexible_line in range(flexible_lines):
+        for _ in range(service_journeys):
+            availability_condition = flexible_line * availability_conditions + rnd.randrange(availability_conditions)
+            pattern = rnd.randrange(2)
+            netex_file.write(f'<ServiceJourney id="ch:1:ServiceJourney:{service_journey}" version="1">'
+                             f'<validityConditions><AvailabilityConditionRef '
+                             f'ref="ch:1:AvailabilityCondition:{availability_condition}"/></validityConditions>'
+                             f'<ServiceJourneyPatternRef ref="ch:1:ServiceJourneyPattern:{flexible_line}_{pattern}"/>'
+                             f'<FlexibleLineRef ref="ch:1:FlexibleLine:{flexible_line}"/></ServiceJourney>\n')
+            service_journey += 1
+
+    netex_file.write('</vehicleJourneys></TimetableFrame>\n')
+
+
+######### Benchmark #############
+# replace the given functions (or methods, e.g., "FplanTable.write_to") of the converter module with ones adding their
+# (inclusive) time to the timings
+def time_stages(converter_module, stages: list[str], timings: dict[str, float]):
+    for stage in stages:
+        owner = converter_module
+        *owner_names, function_name = stage.split(".")
+        for owner_name in owner_names:
+            owner = getattr(owner, owner_name)
+
+        function = getattr(owner, function_name)
+
+        def timed_function(*args, timed=function, stage_name=stage, **kwargs):
+            started = time.perf_counter()
+            try:
+                return timed(*args, **kwargs)
+            finally:
+                timings[stage_name] = timings.get(stage_name, 0.0) + time.perf_counter() - started
+
+        setattr(owner, function_name, timed_function)
+
+
+# convert the given NeTEx file (serially, to a zip in the given folder) and return the time of each stage, the total
+# time and the peak memory of this process. Run in a fresh process per scale (see run_benchmark)
+def run_conversion(netex_file_path: str, zip_folder: str, netex_parser: str) -> dict:
+    import contextlib
+    import main as converter_module
+
+    timings = {}
+    time_stages(converter_module, BENCHMARK_STAGES, timings)
+
+    started = time.perf_counter()
+
+    # the log of the converter is not part of the benchmark
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        resources = converter_module.ConversionResources("utf-8")
+
+        with converter_module.HrdfWriter(None, "utf-8") as hrdf_writer:
+            context = converter_module.ConversionContext(hrdf_writer, resources)
+            converter_module.init_hrdf(context)
+            converter_module.convert_from_netex([], netex_file_path, context, netex_parser)
+
+            zip_started = time.perf_counter()
+            hrdf_writer.write_to_zip(os.path.join(zip_folder, "hrdf.zip"))
+            timings["zip"] = time.perf_counter() - zip_started
+
+    timings["total"] = time.perf_counter() - started
+
+    return {'seconds': timings, 'peak_memory_mb': converter_module.get_peak_memory_mb()}
+
+
+# generate the NeTEx file of each scale and convert it (the given number of times, keeping the fastest run of each
+# stage) in a fresh process, then return the results by scale
+def run_benchmark(scales: list[str], repeat: int = 1, netex_parser: str = "stream", seed: int = 1) -> dict:
+    results = {}
+
+    with tempfile.TemporaryDirectory() as benchmark_folder:
+        for scale in scales:
+            parameters = BENCHMARK_SCALES[scale]
+            netex_file_path = os.path.join(benchmark_folder, f"{scale}.xml")
+            generate_netex(netex_file_path, seed=seed, **parameters)
+
+            runs = []
+            for _ in range(repeat):
+                # a new process per run, thus the peak memory is the one of this scale (and not warmed up)
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                    runs.append(executor.submit(run_conversion, netex_file_path, benchmark_folder,
+                                                netex_parser).result())
+
+            results[scale] = {
+                'parameters': parameters,
+                'netex_mb': os.path.getsize(netex_file_path) / (1024 * 1024),
+                'seconds': {stage: min(run['seconds'].get(stage, 0.0) for run in runs)
+                            for stage in BENCHMARK_STAGES + ["zip", "total"]},
+                'peak_memory_mb': max((run['peak_memory_mb'] or 0.0) for run in runs)
+            }
+
+            print(f"  # {scale}: {results[scale]['seconds']['total']:.2f} s, "
+                  f"{results[scale]['peak_memory_mb']:.1f} MB", file=sys.stderr)
+
+    return results
+
+
+# print a table of the results, one row per scale
+def print_results(results: dict):
+    columns = ["netex MB"] + BENCHMARK_STAGES + ["zip", "total", "peak MB"]
+    print("scale".ljust(8) + "".join(column.rjust(max(12, len(column) + 2)) for column in columns))
+
+    for scale, result in results.items():
+        values = ([result['netex_mb']] + [result['seconds'][stage] for stage in BENCHMARK_STAGES + ["zip", "total"]]
+                  + [result['peak_memory_mb']])
+        print(scale.ljust(8) + "".join(f"{value:.2f}".rjust(max(12, len(column) + 2))
+                                       for column, value in zip(columns, values)))
+
+
+# compare the results to the results of an earlier run and return the regressions, i.e., the stages (and peak memory)
+# that are more than the tolerance (a fraction) above the baseline. Short stages are ignored (they are mostly noise)
+def find_regressions(results: dict, baseline: dict, tolerance: float, min_seconds: float = 0.1) -> list[str]:
+    regressions = []
+
+    for scale, result in results.items():
+        if scale not in baseline:
+            continue
+
+        for stage, seconds in result['seconds'].items():
+            baseline_seconds = baseline[scale]['seconds'].get(stage)
+
+            if baseline_seconds is not None and seconds > min_seconds and \
+                    seconds > baseline_seconds * (1 + tolerance):
+                regressions.append(f"{scale} {stage}: {seconds:.2f} s instead of {baseline_seconds:.2f} s")
+
+        baseline_memory = baseline[scale].get('peak_memory_mb')
+        if baseline_memory and result['peak_memory_mb'] > baseline_memory * (1 + tolerance):
+            regressions.append(f"{scale} peak memory: {result['peak_memory_mb']:.1f} MB instead of "
+                               f"{baseline_memory:.1f} MB")
+
+    return regressions
+
+
+######### MAIN #############
+def parse_scales(scales_parameter: str) -> list[str]:
+    scales = [scale.strip() for scale in scales_parameter.split(",") if scale.strip()]
+
+    for scale in scales:
+        if scale not in BENCHMARK_SCALES:
+            raise ValueError(f"!ERROR! Unknown scale: {scale}. Use {', '.join(BENCHMARK_SCALES)}.")
+
+    return scales
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate synthetic NeTEx ODV files and benchmark the conversion '
+                                                 'stages at several scales')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate_parser = commands.add_parser('generate', help='Write a synthetic NeTEx file')
+    generate_parser.add_argument('netex_file', type=str, help='The path of the NeTEx file to write')
+    generate_parser.add_argument('--scale', type=str, choices=list(BENCHMARK_SCALES),
+                                 help='The scale to take the numbers from (the numbers given below override it)')
+    for name in BENCHMARK_SCALES['small']:
+        generate_parser.add_argument(f'--{name}', type=int, help=f'The number of {name.replace("_", " ")}')
+    generate_parser.add_argument('--seed', type=int, help='The seed of the random data. Default: 1', default=1)
+
+    run_parser = commands.add_parser('run', help='Benchmark the conversion stages')
+    run_parser.add_argument('--scales', type=str,
+                            help=f'The scales to benchmark, of {", ".join(BENCHMARK_SCALES)}. Default: small,medium',
+                            default="small,medium")
+    run_parser.add_argument('--repeat', type=int, help='The runs per scale (the fastest counts). Default: 1', default=1)
+    run_parser.add_argument('--netex_parser', type=str, help='The NeTEx parser, stream or dom. Default: stream',
+                            default="stream")
+    run_parser.add_argument('--seed', type=int, help='The seed of the random data. Default: 1', default=1)
+    run_parser.add_argument('--output', type=str, help='The JSON file to write the results to')
+    run_parser.add_argument('--baseline', type=str, help='The JSON results of an earlier run to compare to, exits '
+                                                         'with 1 if a stage regressed')
+    run_parser.add_argument('--tolerance', type=float,
+                            help='The fraction a stage may be slower than the baseline. Default: 0.2', default=0.2)
+
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        generate_parameters = dict(BENCHMARK_SCALES[args.scale or 'small'])
+        for name in generate_parameters:
+            if getattr(args, name) is not None:
+                generate_parameters[name] = getattr(args, name)
+
+        generate_netex(args.netex_file, seed=args.seed, **generate_parameters)
+        print(f"Generated '{args.netex_file}' ({os.path.getsize(args.netex_file) / (1024 * 1024):.1f} MB)")
+    else:
+        benchmark_results = run_benchmark(parse_scales(args.scales), args.repeat, args.netex_parser, args.seed)
+        print_results(benchmark_results)
+
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as output_file:
+                json.dump(benchmark_results, output_file, indent=2)
+
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+                benchmark_baseline = json.load(baseline_file)
+
+            benchmark_regressions = find_regressions(benchmark_results, benchmark_baseline, args.tolerance)
+            for regression in benchmark_regressions:
+                print(f"REGRESSION: {regression}")
+
+            if benchmark_regressions:
+                sys.exit(1)
@@ -1,29 +1,18 @@
+import hashlib  # for the content hash of the NeTEx file
+import json  # for the state file
+import math  # for the grid of the stop geometry
 import os  # Import the os module for interacting with the operating system
 import shutil  # for moving files
+import sys  # for the platform and the pyinstaller handling
+import time  # for the metrics of a run
 import xml.etree.ElementTree as xml_etree  # Import xml.etree.ElementTree for XML parsing
+from array import array  # for the compact fragments of the HRDF files
+from contextlib import contextmanager  # for the stage timers
+from dataclasses import dataclass, field  # for the NeTEx records
 from datetime import timedelta, date, datetime  # Import datetime and timedelta for handling date and time
-from typing import List, Tuple, Union  # for functions' parameter typing
-from xml.etree.ElementTree import ElementTree, Element
-
-import pandas as pd  # Import pandas for data manipulation and analysis
-
-# Declare an iterator to iterate through journeys/trips in fplan
-fplan_trip_iterator = 0
-
-# To avoid crossing the "normal" bitfield numbers, we start with the id 900000
-bitfeld_starting_number = 900000
-
-# Booking rule iterator
-infotext_id = 900000000
-
-# Region iterator
-region_id = 1
-
-# Pseudo stop ("virtuelle haltestelle") id iterator
-pseudo_stop_id = 9500000
-
-# Booking rule iterator storage
-info_text_ids = [str]
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # for the conversion service
+from typing import BinaryIO, List, NamedTuple, Optional, Tuple, Union  # for functions' parameter typing
+from xml.etree.ElementTree import Element
 
 # List of different stop types
 hrdf_stop_types = ['SSI', 'SDI', 'SSS', 'SDS', 'SSD', 'SDD']
@@ -43,17 +32,20 @@ namespace = {'siri': 'http://www.siri.org.uk/siri', 'gml': 'http://www.opengis.n
 INPUT_FOLDER_NAME = "input"
 PREVIOUS_FOLDER_NAME = "previous"
 
-# To contain the content of ATTRIBUT file
-attribut_content = []
-
-# To contain the content of BETRIEB file
-betrieb_content = []
+# The file (in the working folder) keeping the content hash of the last converted NeTEx file and the validators (ETag,
+# Last-Modified) of its download
+STATE_FILE_NAME = "netex_state.json"
 
-# To ensure that stops to not occur multiple times in bahnhof and bfkoord
-bahnhof_bfkoord_stop_ids = []
+# The data shared by the flexible lines converted in a worker process (see convert_flexible_lines_in_parallel), these
+# are only set in the worker processes
+worker_netex_index = None
+worker_stop_geometry = None
+worker_bitfields = None
+worker_resources = None
 
-# to keep track which operators were taken into the export "betrieb"
-operators_added = []
+# The encoding of the HRDF files converted in a process of the conversion service (see ConversionService), only set in
+# these processes
+service_worker_output_format = None
 
 
 ######### FILE I/O Operations #############
@@ -78,13 +70,6 @@ def move_file(file_path: str, destination_folder: str):
     print(f"File moved successfully from {file_path} to {destination_path}")
 
 
-# copy file from to path
-def copy_file(source_path: str, destination_path: str):
-    shutil.copy(source_path, destination_path)
-
-    print(f"File copied from {source_path} to {destination_path}.")
-
-
 # delete a directory and all of its contents
 def remove_directory(directory_path: str):
     try:
@@ -109,53 +94,508 @@ def remove_directory(directory_path: str):
         raise NotADirectoryError(f"!ERROR! Error occurred while trying to delete directory: {e}")
 
 
-# unzips the given zip-file to the given folder
-def unzip_to_folder(file_path: str, output_folder: str):
+# open the NeTEx XML of the given file for reading. If the file is a ZIP, the XML member is streamed out of the archive
+# without extracting it: the given member or, if none is given, the single XML file in the archive
+def open_netex_file(netex_file_path: str, netex_member: Optional[str] = None) -> BinaryIO:
     import zipfile
 
-    # Create the output folder if it doesn't exist
-    os.makedirs(output_folder, exist_ok=True)
+    if not zipfile.is_zipfile(netex_file_path):
+        return open(netex_file_path, 'rb')
 
-    # Open the zip file
-    with zipfile.ZipFile(file_path, 'r') as zip_ref:
-        # Extract all the contents into the output folder
-        zip_ref.extractall(output_folder)
+    # the opened member keeps the archive file open after the ZipFile is closed
+    with zipfile.ZipFile(netex_file_path, 'r') as zip_file:
+        if netex_member is None:
+            xml_members = [name for name in zip_file.namelist() if name.lower().endswith(".xml")]
 
+            if len(xml_members) != 1:
+                raise ValueError(f"!ERROR! Expected a single XML file in {netex_file_path}, found {xml_members}. "
+                                 f"Select one with netex_member.")
+
+            netex_member = xml_members[0]
+        elif netex_member not in zip_file.namelist():
+            raise ValueError(f"!ERROR! {netex_member} is not in {netex_file_path}.")
+
+        print(f"  # Reading {netex_member} from {os.path.basename(netex_file_path)}")
+
+        return zip_file.open(netex_member, 'r')
+
+
+# raised if the member of a zip cannot be read from the local file headers while the zip is read sequentially
+class ZipNotStreamableError(ValueError):
+    pass
+
+
+# reads the XML member (the given one or the first XML file) out of a zip that is read sequentially from the source,
+# e.g., while it is downloaded, by following the local file headers instead of the central directory at the end.
+# This works if the member is deflated or its size is in the local header, and if the members before it have their
+# sizes in the local header, otherwise ZipNotStreamableError is raised before anything was read from the member
+class ZipMemberStream:
+    def __init__(self, source, netex_member: Optional[str] = None, chunk_size: int = 1 << 16):
+        self.source = source
+        self.netex_member = netex_member
+        self.chunk_size = chunk_size
+        self.decompressor = None  # None for a stored member
+        self.remaining_size = 0  # the bytes left of a stored member
+
+        self.member = self.find_member()
+        print(f"  # Reading {self.member} while downloading")
+
+    # read exactly the given number of bytes from the source
+    def read_exactly(self, size: int) -> bytes:
+        data = b""
+
+        while len(data) < size:
+            chunk = self.source.read(size - len(data))
+
+            if not chunk:
+                raise ValueError("!ERROR! The zip ended unexpectedly.")
+
+            data += chunk
+
+        return data
+
+    # skip the local file headers (and data) up to the one of the member to read
+    def find_member(self) -> str:
+        import struct
+        import zlib
+
+        while True:
+            if self.read_exactly(4) != b"PK\x03\x04":
+                raise ZipNotStreamableError("no local file header of an XML member")
+
+            (_, flags, method, _, _, _, compressed_size, _, name_length,
+             extra_length) = struct.unpack("<HHHHHIIIHH", self.read_exactly(26))
+            name = self.read_exactly(name_length).decode("utf-8" if flags & 0x800 else "cp437")
+            self.read_exactly(extra_length)
+
+            # the sizes are only in the data descriptor after the data (or in the zip64 extra field)
+            size_unknown = flags & 0x8 or compressed_size == 0xFFFFFFFF
+
+            if self.netex_member is None:
+                selected = name.lower().endswith(".xml")
+            else:
+                selected = name == self.netex_member
+
+            if flags & 0x1 or method not in [0, 8]:
+                raise ZipNotStreamableError(f"{name} is encrypted or uses compression method {method}")
+
+            if selected:
+                # a deflate stream knows its end, stored data does not
+                if method == 8:
+                    self.decompressor = zlib.decompressobj(-15)
+                elif size_unknown:
+                    raise ZipNotStreamableError(f"{name} is stored without its size")
+                else:
+                    self.remaining_size = compressed_size
+
+                return name
+
+            if size_unknown:
+                raise ZipNotStreamableError(f"{name} (before the XML) has no size in its local header")
+
+            # skip the data of the member
+            while compressed_size > 0:
+                compressed_size -= len(self.read_exactly(min(compressed_size, self.chunk_size)))
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = 0  # no limit for the decompressor
+
+        # stored member
+        if self.decompressor is None:
+            if self.remaining_size == 0:
+                return b""
+
+            chunk = self.read_exactly(self.remaining_size if size == 0 else min(size, self.remaining_size))
+            self.remaining_size -= len(chunk)
+
+            return chunk
+
+        # deflated member, until the end of the deflate stream
+        while True:
+            if self.decompressor.unconsumed_tail:
+                data = self.decompressor.decompress(self.decompressor.unconsumed_tail, size)
+            elif self.decompressor.eof:
+                return b""
+            else:
+                compressed = self.source.read(self.chunk_size)
+
+                if not compressed:
+                    raise ValueError(f"!ERROR! The zip ended within {self.member}.")
+
+                data = self.decompressor.decompress(compressed, size)
+
+            if data or self.decompressor.eof:
+                return data
+
+
+# keeps one long-lived handle per HRDF file in the given folder and buffers the lines written to it, which are flushed
+# in bulk. Without a folder the files are spooled (in memory, spilling to temporary files on disk beyond spool_size)
+# and only written into the zip (see write_to_zip). Use it as context manager, then all files are flushed and closed on
+# success as well as on failure.
+class HrdfWriter:
+    def __init__(self, to_folder: Optional[str], encoding: str, buffer_size: int = 1 << 20,
+                 spool_size: int = 1 << 24):
+        self.to_folder = to_folder
+        self.encoding = encoding
+        self.buffer_size = buffer_size  # Number of buffered characters (per file) that triggers a flush
+        self.spool_size = spool_size  # Number of bytes (per file) kept in memory without a folder
+        self.handles = {}  # HRDF file name -> binary file handle
+        self.buffers = {}  # HRDF file name -> list of lines not yet written
+        self.buffered_sizes = {}  # HRDF file name -> number of characters in the buffer
+        self.written_keys = {}  # HRDF file name -> keys of the entries written with write_once
+        self.line_counts = {}  # HRDF file name -> number of lines written (flushed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False  # Do not suppress any exception
+
+    # open the handle of the given HRDF file (if not yet open) either appending or truncating
+    def get_handle(self, hrdf_file: str, append: bool):
+        handle = self.handles.get(hrdf_file)
+
+        if handle is None:
+            if self.to_folder is None:
+                import tempfile
+
+                handle = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+            else:
+                file_path = self.to_folder + "/" + hrdf_file
+                handle = open(file_path, 'a+b' if append else 'w+b')  # readable for write_to_zip
+
+            self.handles[hrdf_file] = handle
+            self.buffers[hrdf_file] = []
+            self.buffered_sizes[hrdf_file] = 0
+            self.line_counts.setdefault(hrdf_file, 0)
+
+        return handle
+
+    # write the content followed by a carriage return and line feed, if not append the file is truncated first
+    def write(self, hrdf_file: str, content: str, append: bool):
+        if append:
+            self.get_handle(hrdf_file, True)
+        else:
+            self.truncate(hrdf_file)
+
+        self.buffers[hrdf_file].append(content)
+        self.buffered_sizes[hrdf_file] += len(content) + 2
+
+        if self.buffered_sizes[hrdf_file] >= self.buffer_size:
+            self.flush(hrdf_file)
+
+    # append the given lines (each followed by a carriage return and line feed), the tag is only kept by fragments (see
+    # HrdfFragmentWriter)
+    def write_lines(self, hrdf_file: str, lines: list[str], tag: Optional[str] = None):
+        self.get_handle(hrdf_file, True)
+
+        self.buffers[hrdf_file].extend(lines)
+        self.buffered_sizes[hrdf_file] += sum(map(len, lines)) + 2 * len(lines)
+
+        if self.buffered_sizes[hrdf_file] >= self.buffer_size:
+            self.flush(hrdf_file)
+
+    # write the lines of an entry (e.g., an operator or a stop) identified by the given key, but only the first time
+    def write_once(self, hrdf_file: str, key: str, lines: list[str]):
+        written_keys = self.written_keys.setdefault(hrdf_file, set())
+
+        if key not in written_keys:
+            written_keys.add(key)
+
+            for line in lines:
+                self.write(hrdf_file, line, True)
+
+    # drop everything written to the given HRDF file so far
+    def truncate(self, hrdf_file: str):
+        handle = self.get_handle(hrdf_file, False)
+
+        self.buffers[hrdf_file] = []
+        self.buffered_sizes[hrdf_file] = 0
+        self.line_counts[hrdf_file] = 0
+
+        handle.seek(0)
+        handle.truncate()
+
+    # replace the content of the given HRDF file with a byte copy of the given source file
+    def copy_from(self, hrdf_file: str, source_path: str):
+        self.truncate(hrdf_file)
+
+        with open(source_path, 'rb') as source:
+            for chunk in iter(lambda: source.read(1 << 20), b""):
+                self.handles[hrdf_file].write(chunk)
+                self.line_counts[hrdf_file] += chunk.count(b"\n")
+
+        target = hrdf_file if self.to_folder is None else self.to_folder + '/' + hrdf_file
+        print(f"File copied from {source_path} to {target}.")
+
+    # write the buffered lines of the given HRDF file (or all files) to disk
+    def flush(self, hrdf_file: str = None):
+        for file_name in ([hrdf_file] if hrdf_file is not None else list(self.buffers)):
+            buffer = self.buffers[file_name]
+
+            if buffer:
+                self.handles[file_name].write(('\r\n'.join(buffer) + '\r\n').encode(self.encoding))
+                self.line_counts[file_name] += len(buffer)
+                self.buffers[file_name] = []
+                self.buffered_sizes[file_name] = 0
+
+    # the number of lines and bytes written to each HRDF file (the handles must be open)
+    def get_file_statistics(self) -> dict[str, dict[str, int]]:
+        self.flush()
+
+        file_statistics = {}
+
+        for hrdf_file in sorted(self.handles):
+            handle = self.handles[hrdf_file]
+            handle.seek(0, os.SEEK_END)
+            file_statistics[hrdf_file] = {'lines': self.line_counts[hrdf_file], 'bytes': handle.tell()}
+
+        return file_statistics
+
+    # write all HRDF files into the zip at the given path (in a single pass, from the handles). The files are compressed
+    # with the given level (0 stores them) by the given number of threads, one file per thread. The zip only depends on
+    # the content of the files: the members are sorted by name and have a fixed timestamp (see write_zip)
+    def write_to_zip(self, zip_file_path: str, compression_level: int = 6, threads: int = 1):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.flush()
+
+        hrdf_file_names = sorted(self.handles)
+
+        # zlib releases the GIL while compressing, thus the files are compressed in parallel. The members are written
+        # in order, each as soon as it (and the ones before it) are compressed
+        with ThreadPoolExecutor(max_workers=threads) as executor, open(zip_file_path, 'wb') as zip_file:
+            zip_members = executor.map(lambda hrdf_file: compress_zip_member(hrdf_file, self.handles[hrdf_file],
+                                                                             compression_level),
+                                       hrdf_file_names)
+            write_zip(zip_file, zip_members)
+
+        print(f"HRDF files have been zipped into '{zip_file_path}'.")
+
+    # flush and close all handles, the writer can no longer be used afterwards
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            for handle in self.handles.values():
+                handle.close()
+
+            self.handles = {}
+            self.buffers = {}
+            self.buffered_sizes = {}
+
+
+# The fixed timestamp of the zip members: 1980-01-01 00:00 (the earliest date of the zip format) in MS-DOS date and time
+ZIP_DOS_DATE = (0 << 9) | (1 << 5) | 1
+ZIP_DOS_TIME = 0
+
+
+# a compressed member of a zip (see write_zip)
+@dataclass(slots=True)
+class ZipMember:
+    name: str
+    method: int  # 0 = stored, 8 = deflated
+    crc: int
+    size: int
+    compressed_size: int
+    data: list[bytes]  # the compressed data in chunks
+
+
+# compress the content of the given handle (from the start, the handle is at its end again afterwards) into a zip member
+def compress_zip_member(name: str, handle: BinaryIO, compression_level: int, chunk_size: int = 1 << 20) -> ZipMember:
+    import zlib
+
+    compressor = zlib.compressobj(compression_level, zlib.DEFLATED, -15) if compression_level > 0 else None
+    zip_member = ZipMember(name, 8 if compressor is not None else 0, 0, 0, 0, [])
+
+    handle.seek(0)
+
+    for chunk in iter(lambda: handle.read(chunk_size), b""):
+        zip_member.crc = zlib.crc32(chunk, zip_member.crc)
+        zip_member.size += len(chunk)
+        zip_member.data.append(compressor.compress(chunk) if compressor is not None else chunk)
+
+    if compressor is not None:
+        zip_member.data.append(compressor.flush())
+
+    handle.seek(0, os.SEEK_END)
+
+    zip_member.compressed_size = sum(len(data) for data in zip_member.data)
+
+    if zip_member.size > 0xFFFFFFFF or zip_member.compressed_size > 0xFFFFFFFF:
+        raise ValueError(f"!ERROR! {name} is too large for a zip without ZIP64.")
+
+    return zip_member
+
+
+# write the given members as zip to the given file: the local headers and data in the given order, then the central
+# directory. Apart from the content, nothing (e.g., no timestamps or file attributes) varies, thus the same members
+# always result in the same bytes
+def write_zip(zip_file: BinaryIO, zip_members):
+    import struct
+
+    central_directory = []
+    offset = 0
+
+    for zip_member in zip_members:
+        name = zip_member.name.encode("ascii")
+
+        local_header = struct.pack("<IHHHHHIIIHH", 0x04034b50, 20, 0, zip_member.method, ZIP_DOS_TIME, ZIP_DOS_DATE,
+                                   zip_member.crc, zip_member.compressed_size, zip_member.size, len(name), 0)
+        zip_file.write(local_header + name)
+
+        for data in zip_member.data:
+            zip_file.write(data)
+
+        central_directory.append(struct.pack("<IHHHHHHIIIHHHHHII", 0x02014b50, 20, 20, 0, zip_member.method,
+                                             ZIP_DOS_TIME, ZIP_DOS_DATE, zip_member.crc, zip_member.compressed_size,
+                                             zip_member.size, len(name), 0, 0, 0, 0, 0, offset) + name)
+
+        offset += len(local_header) + len(name) + zip_member.compressed_size
+
+        if offset > 0xFFFFFFFF:
+            raise ValueError("!ERROR! The zip is too large without ZIP64.")
+
+    central_directory_size = sum(len(entry) for entry in central_directory)
+
+    zip_file.write(b"".join(central_directory))
+    zip_file.write(struct.pack("<IHHHHIIH", 0x06054b50, 0, 0, len(central_directory), len(central_directory),
+                               central_directory_size, offset, 0))
+
+
+# keeps the lines written to the HRDF files in memory, e.g., the part of a single flexible line converted in a worker
+# process, to write them to an HrdfWriter later on (the entries written with write_once are only written there once).
+# The lines of each HRDF file are kept in one list and the entries written once as their position in it, their key and
+# their number of lines, thus a fragment is pickled (to the main process or to the fragment cache) as a few texts and
+# arrays instead of millions of small objects
+class HrdfFragmentWriter:
+    def __init__(self):
+        self.lines = {}  # HRDF file name -> all lines written to it, including the ones of the entries written once
+        self.entries = {}  # HRDF file name -> positions, keys and numbers of lines of the entries written once
+        self.written_keys = {}  # HRDF file name -> keys of the entries written once (only the first one is kept)
+        self.tagged_lines = {}  # HRDF file name -> tag -> indices of the lines written with the tag
+
+    def write(self, hrdf_file: str, content: str, append: bool):
+        if not append:
+            raise ValueError(f"!ERROR! Cannot truncate {hrdf_file} in a fragment.")
+
+        self.lines.setdefault(hrdf_file, []).append(content)
+
+    # append the given lines, the indices of the lines written with a tag are kept (e.g., to find the lines of the
+    # pseudo stops among the ones of the regular stops)
+    def write_lines(self, hrdf_file: str, lines: list[str], tag: Optional[str] = None):
+        file_lines = self.lines.setdefault(hrdf_file, [])
+
+        if tag is not None:
+            indices = self.tagged_lines.setdefault(hrdf_file, {}).setdefault(tag, array('L'))
+            indices.extend(range(len(file_lines), len(file_lines) + len(lines)))
+
+        file_lines.extend(lines)
+
+    def write_once(self, hrdf_file: str, key: str, lines: list[str]):
+        written_keys = self.written_keys.setdefault(hrdf_file, set())
+
+        if key not in written_keys:
+            written_keys.add(key)
+
+            file_lines = self.lines.setdefault(hrdf_file, [])
+            positions, keys, counts = self.entries.setdefault(hrdf_file, (array('L'), [], array('L')))
+            positions.append(len(file_lines))
+            keys.append(key)
+            counts.append(len(lines))
+            file_lines.extend(lines)
+
+    # write the fragment to the given writer (the lines between the entries written once at a time)
+    def write_to(self, hrdf_writer: HrdfWriter):
+        for hrdf_file, lines in self.lines.items():
+            start = 0
+
+            for position, key, count in zip(*self.entries.get(hrdf_file, ((), (), ()))):
+                if position > start:
+                    hrdf_writer.write_lines(hrdf_file, lines[start:position])
+
+                hrdf_writer.write_once(hrdf_file, key, lines[position:position + count])
+                start = position + count
+
+            if start < len(lines):
+                hrdf_writer.write_lines(hrdf_file, lines[start:])
+
+    # shift the ids the lines of the given HRDF file (only the ones written with the given tag, if any) start with
+    # (after the given prefix, written with the given width) by the offset, if they are in the given range. The other
+    # lines (e.g., headers, coordinates or the ids of other records) are kept as they are
+    def shift_line_ids(self, hrdf_file: str, ids: range, offset: int, prefix: str = "", width: int = 0,
+                       tag: Optional[str] = None):
+        lines = self.lines.get(hrdf_file, [])
+        indices = range(len(lines)) if tag is None else self.tagged_lines.get(hrdf_file, {}).get(tag, ())
+
+        for index in indices:
+            line = lines[index]
+
+            if line.startswith(prefix):
+                id_text, separator, rest = line[len(prefix):].partition(" ")
+
+                if id_text.isdecimal() and int(id_text) in ids:
+                    lines[index] = f"{prefix}{int(id_text) + offset:0{width}d}{separator}{rest}"
+
+    # the lines and keys of each HRDF file are pickled as a single text each, separated by NUL (which XML and thus the
+    # lines cannot contain)
+    def __getstate__(self) -> dict:
+        state = {}
+
+        for hrdf_file, lines in self.lines.items():
+            positions, keys, counts = self.entries.get(hrdf_file, (array('L'), [], array('L')))
+            state[hrdf_file] = ("\0".join(lines), len(lines), positions, "\0".join(keys), counts,
+                                self.tagged_lines.get(hrdf_file, {}))
+
+        return state
+
+    def __setstate__(self, state: dict):
+        self.lines = {}
+        self.entries = {}
+        self.written_keys = {}
+        self.tagged_lines = {}
+
+        for hrdf_file, (text, line_count, positions, keys_text, counts, tagged_lines) in state.items():
+            self.lines[hrdf_file] = text.split("\0") if line_count > 0 else []
+
+            if tagged_lines:
+                self.tagged_lines[hrdf_file] = tagged_lines
+
+            if len(positions) > 0:
+                keys = keys_text.split("\0")
+                self.entries[hrdf_file] = (positions, keys, counts)
+                self.written_keys[hrdf_file] = set(keys)
+
+
+# writes the content to the given HRDF file through the given writer, if it's valid
+def write_to_hrdf(hrdf_writer: Union[HrdfWriter, HrdfFragmentWriter], hrdf_file: str, content: str, append: bool):
+    # Check if the hrdf_file is valid
+    if hrdf_file in hrdf_files:
+        hrdf_writer.write(hrdf_file, content, append)  # Write content to the specified HRDF file
+    else:
+        raise ValueError(f"!ERROR! {hrdf_file} is not a known HRDF file.")
 
-# zip a given folder to the given path
-def zip_folder(folder_path: str, output_zip_path: str):
-    import zipfile
 
-    # Create a zip file
-    with zipfile.ZipFile(output_zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        # Walk through the folder and add files to the zip
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                # Create the complete file path
-                file_path = os.path.join(root, file)
-                # Add file to the zip file, using relative path from the folder_path
-                zipf.write(file_path, os.path.relpath(file_path, folder_path))
-    print(f"Folder '{folder_path}' has been zipped into '{output_zip_path}'.")
-
-
-# writes the content to the given file in the given folder
-def write_to_file(folder: str, file_name: str, content: str, append: bool):
-    # Open the specified file in append mode with given encoding
-    file_path = folder + "/" + file_name
-
-    if append:
-        with open(file_path, 'a', encoding=output_format, newline='') as file:
-            file.write(content + '\r\n')  # Write the content followed by a carriage return and line feed
+# appends the given lines to the given HRDF file through the given writer, if it's valid. A fragment keeps the lines
+# written with a tag (see HrdfFragmentWriter.write_lines)
+def write_lines_to_hrdf(hrdf_writer: Union[HrdfWriter, HrdfFragmentWriter], hrdf_file: str, lines: list[str],
+                        tag: Optional[str] = None):
+    # Check if the hrdf_file is valid
+    if hrdf_file in hrdf_files:
+        hrdf_writer.write_lines(hrdf_file, lines, tag)  # Write the lines to the specified HRDF file
     else:
-        with open(file_path, 'w', encoding=output_format, newline='') as file:
-            file.write(content + '\r\n')  # Write the content followed by a carriage return and line feed
+        raise ValueError(f"!ERROR! {hrdf_file} is not a known HRDF file.")
 
 
-# writes the content to the given HRDF file in the given folder, if it's valid
-def write_to_hrdf(to_folder: str, hrdf_file: str, content: str, append: bool):
+# writes the lines of an entry identified by the key to the given HRDF file, unless an entry with the key was already
+# written to it
+def write_once_to_hrdf(hrdf_writer: Union[HrdfWriter, HrdfFragmentWriter], hrdf_file: str, key: str,
+                       lines: list[str]):
     # Check if the hrdf_file is valid
     if hrdf_file in hrdf_files:
-        write_to_file(to_folder, hrdf_file, content, append)  # Write content to the specified HRDF file
+        hrdf_writer.write_once(hrdf_file, key, lines)  # Write the lines to the specified HRDF file
     else:
         raise ValueError(f"!ERROR! {hrdf_file} is not a known HRDF file.")
 
@@ -170,673 +610,2839 @@ def time_difference_in_minutes(from_time: str, to_time: str) -> int:
         # Normalize the time to a timedelta object
         return timedelta(hours=hours, minutes=minutes, seconds=seconds)
 
-    # Normalize the time strings into timedelta objects
-    time1 = normalize_time(from_time)
-    time2 = normalize_time(to_time)
+    # Normalize the time strings into timedelta objects
+    time1 = normalize_time(from_time)
+    time2 = normalize_time(to_time)
+
+    # Calculate the total minutes for each time
+    total_minutes1 = time1.total_seconds() / 60
+    total_minutes2 = time2.total_seconds() / 60
+
+    # Calculate the difference in minutes
+    difference = total_minutes2 - total_minutes1
+
+    # If the difference is negative, it means crossing over to the next day
+    if difference < 0:
+        difference += 24 * 60  # Add 24 hours in minutes
+
+    return int(difference)  # Return the difference as an integer
+
+
+# changes timestamps from hh:mm:ss to 0hhmm
+def time_to_compact_time(time: str) -> str:
+    # Remove seconds and replace ':' with ''
+    time = time[:-3].replace(':', '')
+
+    # Ensure the string has the right number of digits (5 digits)
+    time = prefix_with_zeros(time, 5)
+
+    return time  # Return the compact time string
+
+
+# transform the netex 2024-12-15T00:00:00 to hrdf 15.12.2024
+def netex_date_to_hrdf_date(date_str):
+    # Parse the date string into a datetime object
+    date_object = datetime.fromisoformat(date_str)
+
+    # Format the datetime object to the desired format
+    formatted_date = date_object.strftime("%d.%m.%Y")
+
+    return formatted_date
+
+
+# the day of the given NeTEx date (time), e.g., 2024-12-15T00:00:00
+def netex_date_to_date(date_str: str) -> date:
+    return datetime.fromisoformat(date_str).date()
+
+
+######### STRING Operations #############
+# empty check
+def is_nan_or_empty(value: str) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value)) or value == ""
+
+
+# ensure the given value has the given length and amends it at the beginning or end with the given string if not
+def ensure_width(value: str, length: int, amend: str, at_end: bool) -> str:
+    if len(value) >= length:
+        return value
+
+    # the number of times the string is amended (at least once, the value may get longer if it has several characters)
+    amend_count = -(-(length - len(value)) // len(amend))
+
+    return value + amend * amend_count if at_end else amend * amend_count + value
+
+
+######### Auxiliary functions #############
+# returns the peak resident set size of this process in MB, None if the platform does not provide it (e.g., windows)
+def get_peak_memory_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # linux reports kilobytes, macOS bytes
+    if sys.platform == 'darwin':
+        return peak_memory / (1024 * 1024)
+
+    return peak_memory / 1024
+
+
+# The stages that run once per run, with --profile memory the top allocation sites of each of them are reported (a
+# snapshot of the allocations per flexible line or region would take longer than the stage itself)
+MEMORY_PROFILE_STAGES = ["download", "parse", "eckdaten", "bitfeld", "index", "flexible_lines", "fplan", "zip",
+                         "upload"]
+
+
+# collects the metrics of a run: the seconds per stage (summed if a stage runs several times, e.g., per flexible line),
+# counters, the seconds per flexible line and the lines and bytes per HRDF file. The metrics of a worker process are
+# merged into the ones of the run, there the seconds of the stages are summed over the workers
+class RunMetrics:
+    def __init__(self):
+        self.started = time.time()
+        self.finished = None
+        self.status = "running"  # converted, unchanged (same content), not_modified (download), no_file or failed
+        self.error = None
+        self.netex_file_name = None
+        self.stage_seconds = {}
+        self.counters = {}
+        self.flexible_line_seconds = {}  # FlexibleLine id -> seconds
+        self.hrdf_files = {}  # HRDF file name -> lines and bytes
+        self.download = None  # the metrics of the download (see DownloadStream.finish)
+        self.uploads = []  # the report of the upload (see upload_to_ftp)
+        self.allocations = {}  # stage -> peak and top allocation sites, if the allocations are traced
+
+    # time the block as (part of) the given stage. If the allocations are traced (see Converter.profiling), the peak
+    # and the top allocation sites of the stages in MEMORY_PROFILE_STAGES are kept too
+    @contextmanager
+    def stage(self, name: str):
+        import tracemalloc
+
+        snapshot = None
+        if name in MEMORY_PROFILE_STAGES and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            snapshot = tracemalloc.take_snapshot()
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_seconds(name, time.perf_counter() - started)
+
+            if snapshot is not None and tracemalloc.is_tracing():
+                self.add_allocations(name, snapshot)
+
+    # keep the peak and the top allocation sites of the given stage, compared to the snapshot at its start
+    def add_allocations(self, name: str, snapshot, top: int = 15):
+        import tracemalloc
+
+        current, peak = tracemalloc.get_traced_memory()
+        ignored = (tracemalloc.Filter(False, tracemalloc.__file__),)
+        statistics = tracemalloc.take_snapshot().filter_traces(ignored).compare_to(snapshot.filter_traces(ignored),
+                                                                                   'lineno')
+
+        self.allocations[name] = {
+            'peak_mb': peak / (1024 * 1024),
+            'current_mb': current / (1024 * 1024),
+            'top': [{'site': f"{os.path.basename(statistic.traceback[0].filename)}:{statistic.traceback[0].lineno}",
+                     'size_diff_kb': statistic.size_diff / 1024, 'count_diff': statistic.count_diff}
+                    for statistic in statistics if statistic.size_diff != 0 or statistic.count_diff != 0][:top]
+        }
+
+    def add_seconds(self, name: str, seconds: float):
+        self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    # add the metrics of a part of the run, e.g., of the flexible lines converted in a worker process
+    def merge(self, other: "RunMetrics"):
+        for name, seconds in other.stage_seconds.items():
+            self.add_seconds(name, seconds)
+        for name, value in other.counters.items():
+            self.count(name, value)
+        self.flexible_line_seconds.update(other.flexible_line_seconds)
+
+    # finish the run with the given status (or as failed with the given error)
+    def finish(self, status: str, error: Optional[BaseException] = None):
+        self.finished = time.time()
+        self.status = status
+        self.error = None if error is None else str(error)
+
+    def to_report(self) -> dict:
+        finished = self.finished if self.finished is not None else time.time()
+        peak_memory = get_peak_memory_mb()
+
+        return {
+            'started': datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+            'finished': datetime.fromtimestamp(finished).isoformat(timespec="seconds"),
+            'status': self.status,
+            'error': self.error,
+            'netex_file': self.netex_file_name,
+            'seconds': dict(self.stage_seconds, total=finished - self.started),
+            'counters': self.counters,
+            'flexible_lines': self.flexible_line_seconds,
+            'hrdf_files': self.hrdf_files,
+            'download': self.download,
+            'uploads': self.uploads,
+            'peak_memory_mb': peak_memory,
+            'allocations': self.allocations
+        }
+
+    # write the top allocation sites per stage as text to the given path
+    def write_memory_profile(self, profile_path: str):
+        with open(profile_path, "w", encoding="utf-8") as profile_file:
+            for name, allocations in self.allocations.items():
+                profile_file.write(f"== {name}: peak {allocations['peak_mb']:.1f} MB, "
+                                   f"{self.stage_seconds.get(name, 0.0):.2f} s\n")
+
+                for site in allocations['top']:
+                    profile_file.write(f"  {site['size_diff_kb']:>12.1f} KB {site['count_diff']:>+9} blocks  "
+                                       f"{site['site']}\n")
+
+        print(f"Memory profile written to '{profile_path}'.")
+
+    # write the report as JSON to the given path (replacing the file at once)
+    def write_report(self, report_path: str):
+        with open(report_path + ".tmp", "w", encoding="utf-8") as report_file:
+            json.dump(self.to_report(), report_file, indent=2)
+
+        os.replace(report_path + ".tmp", report_path)
+
+    # write the metrics in the Prometheus text format to the given path (replacing the file at once, as required by
+    # the textfile collector of the node exporter)
+    def write_prometheus_textfile(self, textfile_path: str):
+        report = self.to_report()
+        lines = []
+
+        def add_metric(name: str, help_text: str, samples: list[Tuple[str, float]]):
+            lines.append(f"# HELP netex_hrdf_{name} {help_text}")
+            lines.append(f"# TYPE netex_hrdf_{name} gauge")
+            for labels, value in samples:
+                lines.append(f"netex_hrdf_{name}{labels} {value}")
+
+        add_metric("last_run_timestamp_seconds", "The end of the last run (unix time).", [("", self.finished or 0)])
+        add_metric("last_run_success", "Whether the last run succeeded.", [("", int(self.status != "failed"))])
+        add_metric("last_run_status", "The status of the last run.",
+                   [(f'{{status="{status}"}}', int(self.status == status))
+                    for status in ["converted", "unchanged", "not_modified", "no_file", "failed"]])
+        add_metric("stage_seconds", "The seconds per stage of the last run.",
+                   [(f'{{stage="{stage}"}}', round(seconds, 6)) for stage, seconds in report['seconds'].items()])
+        add_metric("count", "The counters of the last run.",
+                   [(f'{{counter="{name}"}}', value) for name, value in self.counters.items()])
+        add_metric("file_lines", "The lines per HRDF file of the last run.",
+                   [(f'{{file="{name}"}}', statistics['lines']) for name, statistics in self.hrdf_files.items()])
+        add_metric("file_bytes", "The bytes per HRDF file of the last run.",
+                   [(f'{{file="{name}"}}', statistics['bytes']) for name, statistics in self.hrdf_files.items()])
+        if report['peak_memory_mb'] is not None:
+            add_metric("peak_memory_bytes", "The peak resident set size of the process.",
+                       [("", int(report['peak_memory_mb'] * 1024 * 1024))])
+
+        with open(textfile_path + ".tmp", "w", encoding="utf-8") as textfile:
+            textfile.write("\n".join(lines) + "\n")
+
+        os.replace(textfile_path + ".tmp", textfile_path)
+
+
+# get the names of the "previous files" that were transformed. If the folder (and files) does not exist, create folder.
+# return the names or an empty list.
+def get_previous_file_names(working_folder: str) -> list[str]:
+    previous_folder = os.path.join(working_folder, PREVIOUS_FOLDER_NAME)
+
+    # if previous folder exists and is folder
+    previous_netex_file_names = []
+
+    if os.path.exists(previous_folder) and os.path.isdir(previous_folder):
+        # get the files in it (several if several NeTEx files were converted together)
+        previous_netex_file_names = sorted(os.listdir(previous_folder))
+    else:
+        os.makedirs(previous_folder, exist_ok=False)
+
+    return previous_netex_file_names
+
+
+# returns the SHA-256 (hex) of the given file's content, read in chunks to not keep the whole file in memory
+def get_file_sha256(file_path: str, chunk_size: int = 1 << 20) -> str:
+    sha256 = hashlib.sha256()
+
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+# returns the SHA-256 of the given file's content, or for several files the SHA-256 of their names and content hashes
+def get_files_sha256(file_paths: list[str]) -> str:
+    if len(file_paths) == 1:
+        return get_file_sha256(file_paths[0])
+
+    sha256 = hashlib.sha256()
+
+    for file_path in sorted(file_paths, key=os.path.basename):
+        sha256.update(f"{os.path.basename(file_path)} {get_file_sha256(file_path)}\n".encode('utf-8'))
+
+    return sha256.hexdigest()
+
+
+# read the state of the last conversion from the state file in the working folder, empty if there is none (yet)
+def read_conversion_state(working_folder: str) -> dict:
+    state_file_path = os.path.join(working_folder, STATE_FILE_NAME)
+
+    if not os.path.isfile(state_file_path):
+        return {}
+
+    with open(state_file_path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+# write the state of the conversion to the state file in the working folder (replacing the old one at once)
+def write_conversion_state(working_folder: str, state: dict):
+    state_file_path = os.path.join(working_folder, STATE_FILE_NAME)
+
+    with open(state_file_path + ".tmp", 'w', encoding='utf-8') as file:
+        json.dump(state, file, indent=2)
+
+    os.replace(state_file_path + ".tmp", state_file_path)
+
+
+# get the path of the given file in the resources folder
+def get_resource_file_path(file_name: str) -> str:
+    # handling for the case that the code was written to an exe using pyinstaller
+    if getattr(sys, 'frozen', False):
+        # If the application is frozen (running as an executable)
+        base_path: Optional[str] = getattr(sys, '_MEIPASS', None)  # Type hint to suppress warning
+    else:
+        # If the application is running in a normal Python environment
+        base_path = os.path.dirname(__file__)
+
+    source_file = os.path.join(base_path, "resources", file_name)
+
+    if not os.path.exists(source_file):
+        # if the resources were not where we expected (or not within the exe), we try the relative path
+        source_file = "resources/" + file_name
+
+        if not os.path.exists(source_file):
+            raise FileNotFoundError(f"!ERROR! {file_name.upper()} file does not exist: {source_file}")
+
+    return source_file
+
+
+# the headers to only ask for the changes since the last download (its validators ETag, Last-Modified) of the same url
+def get_conditional_headers(url: str, download_validators: Optional[dict] = None) -> dict[str, str]:
+    headers = {}
+
+    if download_validators is not None and download_validators.get("url") == url:
+        if download_validators.get("etag"):
+            headers["If-None-Match"] = download_validators["etag"]
+        if download_validators.get("last_modified"):
+            headers["If-Modified-Since"] = download_validators["last_modified"]
+
+    return headers
+
+
+# get the name of the downloaded file from the response
+def get_file_name_from_response(response) -> str:
+    # Try to read the header for the "Location"
+    if 'content-disposition' in response.headers:
+        return response.headers['content-disposition'].split("filename=")[1]
+    else:
+        raise ValueError("!ERROR! The response header did not contain the 'content-disposition'")
+
+
+# the validators of the response to make the next download of the url conditional
+def get_download_validators(url: str, response) -> dict:
+    return {
+        'url': url,
+        'etag': response.headers.get('etag'),
+        'last_modified': response.headers.get('last-modified')
+    }
+
+
+# downloads over a pooled requests.Session (the connections are reused by all downloads of the downloader). Failed
+# requests and interrupted transfers are retried with a bounded exponential backoff, an interrupted transfer (also of an
+# earlier run) is resumed with an HTTP Range request and the downloaded size is verified against the Content-Length
+class Downloader:
+    def __init__(self, retries: int = 5, backoff: float = 1.0, max_backoff: float = 30.0,
+                 timeout: Tuple[float, float] = (10.0, 60.0)):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.retries = retries  # the retries of a request and of a transfer
+        self.backoff = backoff  # the seconds to wait before the first retry, doubled for every further one
+        self.max_backoff = max_backoff
+        self.timeout = timeout  # the connect and read timeout in seconds
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.latency = None  # the seconds until the headers of the last response arrived
+        self.request_retries = 0  # the retries of the last request
+        self.metrics = []  # the metrics of the finished downloads
+
+    def close(self):
+        self.session.close()
+
+    # wait before the given retry
+    def wait_before_retry(self, retry: int, error):
+        delay = min(self.max_backoff, self.backoff * 2 ** (retry - 1))
+        print(f"  # Download failed ({error}), retry {retry}/{self.retries} in {delay:.1f} s")
+        time.sleep(delay)
+
+    # send the GET request, retrying on connection errors, timeouts and on the HTTP codes of temporary failures
+    def get(self, url: str, headers: dict[str, str]):
+        import requests
+
+        retry = 0
+
+        while True:
+            try:
+                started = time.perf_counter()
+                response = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+                self.latency = time.perf_counter() - started
+                self.request_retries = retry
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if retry >= self.retries:
+                    raise
+                retry += 1
+                self.wait_before_retry(retry, e)
+                continue
+
+            if response.status_code in [429, 500, 502, 503, 504] and retry < self.retries:
+                response.close()
+                retry += 1
+                self.wait_before_retry(retry, f"HTTP-Code: {response.status_code}")
+                continue
+
+            return response
+
+    # request the data of the url to download it into the given folder. The request is conditional on the given
+    # validators of the last download, and a partial download of an earlier run in the folder is resumed.
+    # Return the stream to read the data with, None if it was not modified since the last download
+    def open(self, url: str, folder: str, download_validators: Optional[dict] = None) -> Optional["DownloadStream"]:
+        import requests
+
+        headers = get_conditional_headers(url, download_validators)
+        headers["Accept-Encoding"] = "gzip, deflate"  # a compressed transfer, if the server supports it
+
+        # the partial download of an earlier run
+        partial_download = read_partial_download(folder, url)
+
+        if partial_download is not None:
+            headers.update(get_range_headers(partial_download["size"], partial_download))
+
+        response = self.get(url, headers)
+
+        if response.status_code == 304:
+            response.close()
+            print("Not modified since the last download")
+
+            return None
+
+        # Check if the request was successful
+        if response.status_code not in [200, 206]:
+            response.close()
+            raise requests.exceptions.HTTPError(f"!ERROR! Failed to download file HTTP-Code: {response.status_code}")
+
+        return DownloadStream(self, url, folder, response, partial_download)
+
+
+# the file keeping url, file name and validators of a partial download in the download folder
+PARTIAL_DOWNLOAD_FILE_NAME = ".download.json"
+
+
+# whether the file in the download folder belongs to a partial download (and is not a downloaded file)
+def is_partial_download_file(file_name: str) -> bool:
+    return file_name == PARTIAL_DOWNLOAD_FILE_NAME or file_name.endswith(".part")
+
+
+# remove the partial download of an earlier run from the given folder, if it is not resumed
+def remove_partial_download(folder: str):
+    partial_download_path = os.path.join(folder, PARTIAL_DOWNLOAD_FILE_NAME)
+
+    if not os.path.isfile(partial_download_path):
+        return
+
+    with open(partial_download_path, 'r', encoding='utf-8') as file:
+        part_path = os.path.join(folder, json.load(file)["file_name"] + ".part")
+
+    if os.path.isfile(part_path):
+        os.remove(part_path)
+    os.remove(partial_download_path)
+
+
+# read the partial download of the url in the given folder (with the size downloaded), None if there is none
+def read_partial_download(folder: str, url: str) -> Optional[dict]:
+    partial_download_path = os.path.join(folder, PARTIAL_DOWNLOAD_FILE_NAME)
+
+    if not os.path.isfile(partial_download_path):
+        return None
+
+    with open(partial_download_path, 'r', encoding='utf-8') as file:
+        partial_download = json.load(file)
+
+    part_path = os.path.join(folder, partial_download["file_name"] + ".part")
+
+    if partial_download["url"] != url or not os.path.isfile(part_path) or os.path.getsize(part_path) == 0:
+        return None
+
+    # only resume the same version of the data
+    if not partial_download.get("etag") and not partial_download.get("last_modified"):
+        return None
+
+    partial_download["size"] = os.path.getsize(part_path)
+
+    return partial_download
+
+
+# the headers to request the data from the given offset on, if it's still the version of the given validators (without
+# compression, thus the offset is the one of the data itself)
+def get_range_headers(offset: int, download_validators: dict) -> dict[str, str]:
+    return {
+        "Range": f"bytes={offset}-",
+        "If-Range": download_validators.get("etag") or download_validators.get("last_modified"),
+        "Accept-Encoding": "identity"
+    }
+
+
+# reads the data of a download (decoding the transfer compression) and writes everything read to a partial file in the
+# download folder, which is renamed to the file name once the download is complete, thus the data can be parsed while
+# it is downloaded and stored. If the transfer is interrupted, it is resumed with a Range request
+class DownloadStream:
+    def __init__(self, downloader: Downloader, url: str, folder: str, response, partial_download: Optional[dict]):
+        self.downloader = downloader
+        self.url = url
+        self.folder = folder
+        self.retries = downloader.request_retries
+
+        # the data of an earlier run is replayed to the reader before the rest is read from the response
+        self.replay = None
+        self.data_read = False  # whether data was given to the reader, then the download cannot restart anymore
+
+        os.makedirs(folder, exist_ok=True)
+
+        if response.status_code == 206:
+            self.file_name = partial_download["file_name"]
+            self.validators = partial_download
+            self.size = partial_download["size"]
+            self.file = open(self.get_part_path(), 'ab')
+            self.replay = open(self.get_part_path(), 'rb')
+            print(f"Resuming the download of {self.file_name} at {self.size} bytes")
+        else:
+            # the partial download of an earlier run (of another url or version, or with another file name) is not
+            # resumed, it would otherwise be left in the folder
+            remove_partial_download(folder)
+
+            self.file_name = get_file_name_from_response(response)
+            self.validators = get_download_validators(url, response)
+            self.size = 0
+            self.file = open(self.get_part_path(), 'wb')
+
+        self.resumed_size = self.size
+
+        # keep the partial download to resume it in a later run, if this one fails
+        with open(os.path.join(folder, PARTIAL_DOWNLOAD_FILE_NAME), 'w', encoding='utf-8') as file:
+            json.dump({'url': url, 'file_name': self.file_name, 'etag': self.validators.get("etag"),
+                       'last_modified': self.validators.get("last_modified")}, file)
+
+        self.latency = downloader.latency
+        self.started = time.perf_counter()
+        self.set_response(response)
+
+    def get_part_path(self) -> str:
+        return os.path.join(self.folder, self.file_name + ".part")
+
+    # read the data from the given response (from the current size on)
+    def set_response(self, response):
+        self.response = response
+
+        # the size of the whole data is only known without compression
+        self.encoded = response.headers.get("content-encoding", "identity").lower() != "identity"
+        self.total_size = None
+
+        if response.status_code == 206:
+            # Content-Range: bytes <first>-<last>/<total>
+            content_range = response.headers.get("content-range", "")
+            first_byte = content_range.split(" ")[-1].split("-")[0]
+
+            if first_byte != str(self.size):
+                raise ValueError(f"!ERROR! The download was resumed at {content_range}, not at {self.size}.")
+
+            if "/" in content_range and content_range.split("/")[1] != "*":
+                self.total_size = int(content_range.split("/")[1])
+        elif not self.encoded and response.headers.get("content-length") is not None:
+            self.total_size = int(response.headers["content-length"])
+
+    def read(self, size: int = -1) -> bytes:
+        self.data_read = True
+
+        # first the data of the earlier run
+        if self.replay is not None:
+            data = self.replay.read(size if size is not None and size > 0 else -1)
+
+            if data:
+                return data
+
+            self.replay.close()
+            self.replay = None
+
+        return self.read_from_response(size)
+
+    # read up to the given size from the response, in chunks of at most chunk_size, thus an interrupted transfer only
+    # loses the chunk being read
+    def read_from_response(self, size: int = -1, chunk_size: int = 1 << 16) -> bytes:
+        import requests
+        import urllib3
+
+        if size is None or size < 0:
+            return b"".join(iter(lambda: self.read_from_response(chunk_size), b""))
+
+        while True:
+            try:
+                chunk = self.response.raw.read(min(size, chunk_size), decode_content=True)
+            except (urllib3.exceptions.HTTPError, requests.exceptions.RequestException, OSError) as e:
+                self.resume(e)
+                continue
+
+            if chunk:
+                self.file.write(chunk)
+                self.size += len(chunk)
+
+                return chunk
+
+            # the end of the data, unless the transfer stopped early
+            if self.total_size is not None and self.size < self.total_size:
+                self.resume(f"received {self.size} of {self.total_size} bytes")
+                continue
+
+            return b""
+
+    # continue the interrupted transfer with a Range request, or restart it if the data was not read yet
+    def resume(self, error):
+        import requests
+
+        self.retries += 1
+
+        if self.retries > self.downloader.retries:
+            raise ConnectionError(f"!ERROR! The download of {self.url} failed after {self.downloader.retries} "
+                                  f"retries: {error}")
+
+        self.response.close()
+        self.downloader.wait_before_retry(self.retries, error)
+
+        headers = {"Accept-Encoding": "identity"}
+
+        if self.size > 0 and (self.validators.get("etag") or self.validators.get("last_modified")):
+            headers.update(get_range_headers(self.size, self.validators))
+
+        response = self.downloader.get(self.url, headers)
+        self.retries += self.downloader.request_retries
+
+        if response.status_code == 206:
+            print(f"Resuming the download of {self.file_name} at {self.size} bytes")
+        elif response.status_code == 200:
+            # the server did not resume (e.g., the data changed), start from the beginning again
+            if self.size > 0 and self.data_read:
+                response.close()
+                raise ConnectionError(f"!ERROR! The download of {self.url} could not be resumed.")
+
+            self.file.seek(0)
+            self.file.truncate()
+            self.size = 0
+            self.validators = get_download_validators(self.url, response)
+        else:
+            response.close()
+            raise requests.exceptions.HTTPError(f"!ERROR! Failed to download file HTTP-Code: {response.status_code}")
+
+        self.set_response(response)
+
+    # read (and store) the rest of the data
+    def drain(self, chunk_size: int = 1 << 16):
+        # the data of the earlier run is already stored
+        if self.replay is not None:
+            self.replay.close()
+            self.replay = None
+
+        while self.read_from_response(chunk_size):
+            pass
+
+    # read the rest of the data, verify its size and move the file to its name. Return the file path
+    def finish(self) -> str:
+        self.drain()
+        self.close()
+
+        # verify the size against the Content-Length
+        if self.total_size is not None and self.size != self.total_size:
+            raise ValueError(f"!ERROR! Downloaded {self.size} bytes of {self.file_name}, expected {self.total_size}.")
+
+        file_path = os.path.join(self.folder, self.file_name)
+        os.replace(self.get_part_path(), file_path)
+        os.remove(os.path.join(self.folder, PARTIAL_DOWNLOAD_FILE_NAME))
+
+        seconds = time.perf_counter() - self.started
+        downloaded_size = self.size - self.resumed_size
+
+        metrics = {
+            'url': self.url,
+            'file_name': self.file_name,
+            'bytes': downloaded_size,
+            'resumed_bytes': self.resumed_size,
+            'seconds': seconds,
+            'throughput_mb_per_s': downloaded_size / (1024 * 1024) / seconds if seconds > 0 else None,
+            'latency_ms': None if self.latency is None else self.latency * 1000,
+            'retries': self.retries,
+            'compressed_transfer': self.encoded
+        }
+        self.downloader.metrics.append(metrics)
+
+        throughput = "-" if metrics['throughput_mb_per_s'] is None else f"{metrics['throughput_mb_per_s']:.1f}"
+        latency = "-" if metrics['latency_ms'] is None else f"{metrics['latency_ms']:.0f}"
+        print(f"  # Downloaded {downloaded_size / (1024 * 1024):.1f} MB in {seconds:.1f} s ({throughput} MB/s), "
+              f"latency {latency} ms, {self.retries} retries")
+
+        return file_path
+
+    # close the response and the files, a partial download is kept to resume it later
+    def close(self):
+        self.response.close()
+        self.file.close()
+
+        if self.replay is not None:
+            self.replay.close()
+            self.replay = None
+
+
+# load the data from the url and put into a tmp folder of the working folder (by default the current working directory),
+# a zip is not extracted (see open_netex_file). The download is conditional on the given validators of the last download
+# (see Downloader.open).
+# Return the file path (None if the data was not modified since the last download) and the validators of the download
+def load_from_url(url: str, download_validators: Optional[dict] = None, downloader: Optional[Downloader] = None,
+                  working_folder: Optional[str] = None) -> Tuple[Optional[str], dict]:
+    print(f"[[[[[Loading from url {url}")
+
+    temp_folder = os.path.join(os.getcwd() if working_folder is None else working_folder, INPUT_FOLDER_NAME)
+    own_downloader = downloader is None
+
+    if own_downloader:
+        downloader = Downloader()
+
+    try:
+        download_stream = downloader.open(url, temp_folder, download_validators)
+
+        if download_stream is None:
+            print("]]]]]")
+
+            return None, download_validators
+
+        print(f"Created {INPUT_FOLDER_NAME} folder (will be removed)")
+
+        # Write the file to the tmp folder
+        try:
+            download_stream.finish()
+        finally:
+            download_stream.close()
+
+        print(f"File downloaded successfully: {download_stream.file_name}")
+        print("]]]]]")
+
+        return temp_folder, download_stream.validators
+    finally:
+        if own_downloader:
+            downloader.close()
+
+
+# load the data from the url into a tmp folder like load_from_url, but read the NeTEx records while the data is still
+# arriving: the data is written to the file and at the same time fed into the parser (through the decompressor of the
+# XML member, if it's a zip). If the layout of the zip does not allow this, the records are read after the download.
+# Return the file path (None if the data was not modified since the last download), the records and the validators
+def load_and_read_from_url(url: str, netex_parser: str, netex_member: Optional[str] = None,
+                           download_validators: Optional[dict] = None,
+                           downloader: Optional[Downloader] = None, working_folder: Optional[str] = None
+                           ) -> Tuple[Optional[str], Optional["NetexData"], dict]:
+    print(f"[[[[[Loading and reading from url {url}")
+
+    temp_folder = os.path.join(os.getcwd() if working_folder is None else working_folder, INPUT_FOLDER_NAME)
+    own_downloader = downloader is None
+
+    if own_downloader:
+        downloader = Downloader()
+
+    try:
+        download_stream = downloader.open(url, temp_folder, download_validators)
+
+        if download_stream is None:
+            print("]]]]]")
+
+            return None, None, download_validators
+
+        print(f"Created {INPUT_FOLDER_NAME} folder (will be removed)")
+
+        netex_data = None
+
+        try:
+            try:
+                if os.path.splitext(download_stream.file_name)[1].lower() == '.zip':
+                    netex_data = read_netex(ZipMemberStream(download_stream, netex_member), netex_parser)
+                else:
+                    netex_data = read_netex(download_stream, netex_parser)
+            except ZipNotStreamableError as e:
+                print(f"  # Cannot read the zip while downloading it ({e}), reading it after the download")
+
+            # the rest of the data (e.g., the other members of the zip)
+            file_path = download_stream.finish()
+        finally:
+            download_stream.close()
+
+        print(f"File downloaded successfully: {download_stream.file_name}")
+
+        if netex_data is None:
+            with open_netex_file(file_path, netex_member) as netex_source:
+                netex_data = read_netex(netex_source, netex_parser)
+
+        print("]]]]]")
+
+        return temp_folder, netex_data, download_stream.validators
+    finally:
+        if own_downloader:
+            downloader.close()
+
+
+# uploads files to SFTP and FTPS servers (and copies them to local folders). The connections to a server (and user) are
+# kept for the next uploads, an upload uses one of them at a time, thus several files can be uploaded concurrently. A
+# file is uploaded to a temporary name next to its remote path and only renamed to it once the size on the server
+# matches. A failed transfer is retried with an exponential backoff on a new connection and resumed from the size of the
+# temporary file on the server. If all retries fail, the upload raises
+class Uploader:
+    def __init__(self, retries: int = 5, backoff: float = 1.0, max_backoff: float = 30.0, timeout: float = 60.0,
+                 chunk_size: int = 1 << 20, window_size: int = 1 << 26):
+        import threading
+
+        self.retries = retries  # the retries of an upload
+        self.backoff = backoff  # the seconds to wait before the first retry, doubled for every further one
+        self.max_backoff = max_backoff
+        self.timeout = timeout  # the timeout of the connection in seconds
+        self.chunk_size = chunk_size  # the bytes read from the file per write
+        self.window_size = window_size  # the SSH window, the writes of SFTP are pipelined up to it
+
+        self.connections = {}  # the idle open connections by protocol, url, port and user
+        self.lock = threading.Lock()
+        self.metrics = []  # the metrics of the finished uploads
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        with self.lock:
+            for key, connections in self.connections.items():
+                for connection in connections:
+                    self.close_connection(key[0], connection)
+
+            self.connections.clear()
+
+    # take an idle open connection to the server of the given ftp, a new one if there is none (or they were closed by
+    # the server). Give it back with release_connection once the upload is done
+    def acquire_connection(self, ftp: dict[str, str]):
+        key = (ftp['protocol'].lower(), ftp['url'], int(ftp['port']), ftp['user'])
+
+        with self.lock:
+            connections = self.connections.setdefault(key, [])
+
+            while connections:
+                connection = connections.pop()
+
+                if self.is_connected(key[0], connection):
+                    return key, connection
+
+                self.close_connection(key[0], connection)
+
+        return key, self.connect(ftp)
+
+    # keep the given connection for the next uploads
+    def release_connection(self, key, connection):
+        with self.lock:
+            self.connections.setdefault(key, []).append(connection)
+
+    # connect and log in to the server of the given ftp
+    def connect(self, ftp: dict[str, str]):
+        import socket
+
+        protocol = ftp['protocol'].lower()
+
+        if protocol == 'ftps':
+            from ftplib import FTP_TLS
+
+            ftps = FTP_TLS(timeout=self.timeout)
+            ftps.connect(ftp['url'], int(ftp['port']))
+            ftps.login(user=ftp['user'], passwd=ftp['password'])
+            ftps.prot_p()  # Set the data connection to be secure
+            ftps.voidcmd("TYPE I")  # binary, also for the SIZE of the files
+
+            return ftps
+        elif protocol == 'sftp':
+            import paramiko
+
+            sock = socket.create_connection((ftp['url'], int(ftp['port'])), self.timeout)
+            transport = paramiko.Transport(sock, default_window_size=self.window_size)
+            try:
+                transport.connect(username=ftp['user'], password=ftp['password'])
+                sftp = paramiko.SFTPClient.from_transport(transport, window_size=self.window_size)
+            except Exception:
+                transport.close()
+                raise
+
+            if sftp is None:
+                transport.close()
+                raise ConnectionError("!ERROR! Failed to create SFTP client.")
+
+            return sftp
+        else:
+            raise ValueError(f"!ERROR! Unsupported protocol: {ftp['protocol']}. Please use 'ftps' or 'sftp'.")
+
+    # whether the given connection is still open
+    @staticmethod
+    def is_connected(protocol: str, connection) -> bool:
+        if protocol == 'sftp':
+            return connection.get_channel().get_transport().is_active()
+
+        try:
+            connection.voidcmd("NOOP")
+            return True
+        except Exception:
+            return False
+
+    # close the given connection (ignoring errors, e.g., of an already closed connection)
+    @staticmethod
+    def close_connection(protocol: str, connection):
+        try:
+            if protocol == 'sftp':
+                transport = connection.get_channel().get_transport()
+                connection.close()
+                transport.close()
+            else:
+                connection.close()
+        except Exception:
+            pass
+
+    # upload the file to the path of the given ftp, see Uploader, and return the metrics of the upload
+    def upload(self, file_path: str, ftp: dict[str, str]) -> dict:
+        import ftplib
+        import paramiko
+
+        remote_path = ftp['path'] + os.path.basename(file_path)
+        partial_remote_path = remote_path + ".part"
+        file_size = os.path.getsize(file_path)
+
+        started = time.perf_counter()
+        resumed_size = 0  # the size on the server the successful transfer resumed from
+        retry = 0
+
+        while True:
+            key = None
+            connection = None
+
+            try:
+                if ftp['protocol'].lower() == 'file':
+                    resumed_size = self.copy_to_folder(file_path, file_size, remote_path, partial_remote_path)
+                    break
+
+                key, connection = self.acquire_connection(ftp)
+
+                with open(file_path, 'rb') as file:
+                    if key[0] == 'sftp':
+                        resumed_size = self.upload_with_sftp(connection, file, file_size, remote_path,
+                                                             partial_remote_path)
+                    else:
+                        resumed_size = self.upload_with_ftps(connection, file, file_size, remote_path,
+                                                             partial_remote_path)
+
+                self.release_connection(key, connection)
+                break
+            except (paramiko.AuthenticationException, FileNotFoundError, PermissionError, ftplib.error_perm) as e:
+                if connection is not None:
+                    self.close_connection(key[0], connection)
+
+                # retrying does not help if the login or path is wrong
+                raise ConnectionError(f"!ERROR! Upload of '{file_path}' to '{ftp['url']}' failed: {e}") from e
+            except (OSError, EOFError, paramiko.SSHException, ftplib.Error) as e:
+                if connection is not None:
+                    self.close_connection(key[0], connection)
+
+                if retry >= self.retries:
+                    raise ConnectionError(f"!ERROR! Upload of '{file_path}' to '{ftp['url']}' failed after {retry} "
+                                          f"retries: {e}") from e
+
+                retry += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** (retry - 1))
+                error = str(e) or type(e).__name__
+                print(f"  # Upload failed ({error}), retry {retry}/{self.retries} in {delay:.1f} s")
+                time.sleep(delay)
+
+        seconds = time.perf_counter() - started
+        metrics = {
+            'file': file_path,
+            'url': ftp['url'],
+            'path': remote_path,
+            'bytes': file_size,
+            'resumed_bytes': resumed_size,
+            'seconds': seconds,
+            'retries': retry
+        }
+        self.metrics.append(metrics)
+
+        size_mb = file_size / (1024 * 1024)
+        throughput = size_mb / seconds if seconds > 0 else 0.0
+        resumed = f", resumed at {resumed_size / (1024 * 1024):.1f} MB" if resumed_size > 0 else ""
+        print(f"Uploaded '{file_path}' to '{remote_path}' via {ftp['protocol'].upper()}.")
+        print(f"  # Uploaded {size_mb:.1f} MB in {seconds:.2f} s ({throughput:.1f} MB/s), {retry} retries{resumed}")
+
+        return metrics
+
+    # the size of the temporary file on the server to resume from. If it is larger than the file, the upload restarts
+    @staticmethod
+    def get_resume_offset(remote_size: Optional[int], file_size: int) -> int:
+        if remote_size is None or remote_size > file_size:
+            return 0
+
+        return remote_size
+
+    # upload with pipelined writes (not waiting for each write to be acknowledged), returns the size resumed from
+    def upload_with_sftp(self, sftp, file: BinaryIO, file_size: int, remote_path: str,
+                         partial_remote_path: str) -> int:
+        try:
+            remote_size = sftp.stat(partial_remote_path).st_size
+        except IOError:
+            remote_size = None
+
+        offset = self.get_resume_offset(remote_size, file_size)
+
+        # a failed write of the interrupted upload may have left a gap anywhere before later (pipelined) writes, thus
+        # the whole temporary file must match the start of the file to resume from it. The writes of this upload are
+        # all acknowledged before the file is closed, thus they cannot leave a gap
+        if offset > 0 and not self.has_remote_prefix(sftp, file, partial_remote_path, offset):
+            print("  # The partial upload on the server differs from the file, restarting the upload")
+            offset = 0
+
+        file.seek(offset)
+
+        with sftp.open(partial_remote_path, 'r+b' if offset > 0 else 'wb') as remote_file:
+            remote_file.seek(offset)
+            remote_file.set_pipelined(True)
+
+            for chunk in iter(lambda: file.read(self.chunk_size), b""):
+                remote_file.write(chunk)
+
+        # closing the file waited for the acknowledgements of all writes
+        remote_size = sftp.stat(partial_remote_path).st_size
+        if remote_size != file_size:
+            raise ConnectionError(f"The size on the server is {remote_size} bytes instead of {file_size} bytes.")
+
+        try:
+            sftp.posix_rename(partial_remote_path, remote_path)
+        except IOError:
+            # the server does not support the atomic rename (replacing the file), the plain rename of SFTP fails if
+            # the file already exists
+            try:
+                sftp.remove(remote_path)
+            except IOError:
+                pass
+            sftp.rename(partial_remote_path, remote_path)
+
+        return offset
+
+    # whether the first size bytes of the temporary file on the server are the ones of the file, compared by their
+    # SHA-256: hashed by the server if it supports the check-file extension, otherwise read back
+    def has_remote_prefix(self, sftp, file: BinaryIO, partial_remote_path: str, size: int) -> bool:
+        local_sha256 = self.get_prefix_sha256(file, size)
+        if local_sha256 is None:
+            return False
+
+        with sftp.open(partial_remote_path, 'rb') as remote_file:
+            try:
+                return remote_file.check('sha256', 0, size) == local_sha256.digest()
+            except IOError:
+                pass  # most servers do not support check-file
+
+            remote_sha256 = hashlib.sha256()
+            remote_file.prefetch(size)  # pipelined reads
+
+            remaining = size
+            while remaining > 0:
+                chunk = remote_file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    return False
+                remote_sha256.update(chunk)
+                remaining -= len(chunk)
+
+        return remote_sha256.digest() == local_sha256.digest()
+
+    # the SHA-256 of the first size bytes of the file, None if the file is shorter
+    def get_prefix_sha256(self, file: BinaryIO, size: int):
+        local_sha256 = hashlib.sha256()
+        file.seek(0)
+
+        remaining = size
+        while remaining > 0:
+            chunk = file.read(min(self.chunk_size, remaining))
+            if not chunk:
+                return None
+            local_sha256.update(chunk)
+            remaining -= len(chunk)
+
+        return local_sha256
+
+    # copy to a local folder (e.g., for testing), returns the size resumed from (always 0)
+    @staticmethod
+    def copy_to_folder(file_path: str, file_size: int, remote_path: str, partial_remote_path: str) -> int:
+        # the zip is removed after the upload, thus it must not be its own copy
+        if os.path.abspath(file_path) == os.path.abspath(remote_path):
+            raise ValueError(f"!ERROR! The local folder to copy '{file_path}' to is the folder of the zip itself.")
+
+        shutil.copyfile(file_path, partial_remote_path)
+
+        remote_size = os.path.getsize(partial_remote_path)
+        if remote_size != file_size:
+            raise ConnectionError(f"The size of the copy is {remote_size} bytes instead of {file_size} bytes.")
+
+        os.replace(partial_remote_path, remote_path)
+
+        return 0
+
+    # upload with STOR (and REST to resume), returns the size resumed from
+    def upload_with_ftps(self, ftps, file: BinaryIO, file_size: int, remote_path: str,
+                         partial_remote_path: str) -> int:
+        offset = self.get_resume_offset(self.get_ftps_size(ftps, partial_remote_path), file_size)
+
+        # the temporary file may be left by the upload of another file (or a version of it) with the same name
+        if offset > 0 and not self.has_remote_ftps_prefix(ftps, file, partial_remote_path, offset):
+            print("  # The partial upload on the server differs from the file, restarting the upload")
+            offset = 0
+
+        file.seek(offset)
+
+        ftps.storbinary(f"STOR {partial_remote_path}", file, self.chunk_size, rest=offset if offset > 0 else None)
+
+        remote_size = ftps.size(partial_remote_path)
+        if remote_size != file_size:
+            raise ConnectionError(f"The size on the server is {remote_size} bytes instead of {file_size} bytes.")
+
+        from ftplib import error_perm
+
+        try:
+            ftps.rename(partial_remote_path, remote_path)
+        except error_perm:
+            # some servers do not replace an existing file, other failures are not solved by removing it
+            if self.get_ftps_size(ftps, remote_path) is None:
+                raise
+            ftps.delete(remote_path)
+            ftps.rename(partial_remote_path, remote_path)
+
+        return offset
+
+    # the size of the file on the FTPS server, None if it does not exist
+    @staticmethod
+    def get_ftps_size(ftps, remote_path: str) -> Optional[int]:
+        from ftplib import error_perm
+
+        try:
+            return ftps.size(remote_path)
+        except error_perm:
+            return None
+
+    # whether the temporary file on the server (of the given size) is the start of the file, compared by their SHA-256:
+    # hashed by the server if it supports HASH or XSHA256, otherwise downloaded
+    def has_remote_ftps_prefix(self, ftps, file: BinaryIO, partial_remote_path: str, size: int) -> bool:
+        from ftplib import error_perm, error_reply
+
+        local_sha256 = self.get_prefix_sha256(file, size)
+        if local_sha256 is None:
+            return False
+
+        # HASH (with the algorithm selected by OPTS) replies "213 SHA-256 0-<end> <hash> <path>", XSHA256 "250 <hash>"
+        for commands in (["OPTS HASH SHA-256", f"HASH {partial_remote_path}"], [f"XSHA256 {partial_remote_path}"]):
+            try:
+                for command in commands:
+                    response = ftps.sendcmd(command)
+            except (error_perm, error_reply):
+                continue  # most servers support neither
+
+            remote_hashes = [token.lower() for token in response.split()[1:] if len(token) == 64]
+            if remote_hashes:
+                return remote_hashes[0] == local_sha256.hexdigest()
+
+        remote_sha256 = hashlib.sha256()
+        remote_size = 0
+
+        def update(chunk: bytes):
+            nonlocal remote_size
+            remote_sha256.update(chunk)
+            remote_size += len(chunk)
+
+        ftps.retrbinary(f"RETR {partial_remote_path}", update, self.chunk_size)
+
+        return remote_size == size and remote_sha256.digest() == local_sha256.digest()
+
+
+# the name of the given ftp in logs and reports (without the user and password)
+def get_ftp_name(ftp: dict[str, str]) -> str:
+    if ftp['protocol'].lower() == 'file':
+        return f"file://{ftp['path']}"
+
+    return f"{ftp['protocol'].lower()}://{ftp['url']}:{ftp['port']}/{ftp['path']}"
+
+
+# upload a given file to the given ftp(s) (see Uploader), with the given uploader (and its connections) or a new one.
+# Several ftps are uploaded to concurrently (one thread each), thus the upload takes as long as the slowest of them. A
+# report of the status and time per ftp is printed and returned, if any upload failed it raises afterwards
+def upload_to_ftp(file_path: str, ftp: Union[dict[str, str], list[dict[str, str]]],
+                  uploader: Optional[Uploader] = None) -> list[dict]:
+    from concurrent.futures import ThreadPoolExecutor
+
+    ftps = [ftp] if isinstance(ftp, dict) else ftp
+
+    if uploader is None:
+        with Uploader() as new_uploader:
+            return upload_to_ftp(file_path, ftps, new_uploader)
+
+    # upload to one ftp, the failure is part of the report
+    def upload_to_one_ftp(one_ftp: dict[str, str]) -> dict:
+        started = time.perf_counter()
+
+        try:
+            metrics = uploader.upload(file_path, one_ftp)
+            return {'ftp': get_ftp_name(one_ftp), 'status': "ok", 'seconds': metrics['seconds'],
+                    'bytes': metrics['bytes'], 'retries': metrics['retries'], 'error': None}
+        except Exception as e:
+            return {'ftp': get_ftp_name(one_ftp), 'status': "failed", 'seconds': time.perf_counter() - started,
+                    'bytes': 0, 'retries': None, 'error': str(e)}
+
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, len(ftps))) as executor:
+        report = list(executor.map(upload_to_one_ftp, ftps))
+
+    seconds = time.perf_counter() - started
+
+    print(f"Upload report ({len(ftps)} destinations in {seconds:.2f} s):")
+    for entry in report:
+        if entry['status'] == "ok":
+            print(f"  # {entry['ftp']}: ok in {entry['seconds']:.2f} s, {entry['retries']} retries")
+        else:
+            print(f"  # {entry['ftp']}: FAILED after {entry['seconds']:.2f} s: {entry['error']}")
+
+    failed = [entry['ftp'] for entry in report if entry['status'] != "ok"]
+    if failed:
+        raise ConnectionError(f"!ERROR! Upload of '{file_path}' failed for: {', '.join(failed)}")
+
+    return report
+
+
+# parse an ftp given as "<protocol>://<url>[:<port>],<user>,<password>,<path>" (SFTP or FTPS) or as
+# "file://<folder>" (a local folder, e.g., for testing)
+def parse_ftp(ftp_parameter: str) -> dict[str, str]:
+    if ftp_parameter.strip().lower().startswith("file://"):
+        folder = ftp_parameter.strip()[len("file://"):]
+
+        # make sure the path ends with "/"
+        if not folder.endswith("/"):
+            folder = folder + "/"
+
+        return {'url': "", 'user': "", 'password': "", 'path': folder, 'protocol': "file", 'port': "0"}
+
+    ftp_params = ftp_parameter.split(",")
+    if len(ftp_params) != 4:
+        raise ValueError(f"!ERROR! The ftp must be a quadruple of url,user,password,path, not {len(ftp_params)} "
+                         f"values.")
+
+    ftp_url = ftp_params[0]
+    ftp_user = ftp_params[1]
+    ftp_password = ftp_params[2]
+    ftp_path = ftp_params[3]
+
+    # make sure the path ends with "/"
+    if not ftp_path.endswith("/"):
+        ftp_path = (ftp_path + "/")
+
+    # parse protocol and port (if given)
+    ftp_url_components = ftp_url.split(":")
+    ftp_protocol = ftp_url_components[0]
+    if ftp_protocol.lower() == "sftp":
+        ftp_port = "22"
+    elif ftp_protocol.lower() == "ftps":
+        ftp_port = "21"
+    else:
+        raise TypeError(f"Unsupported protocol: {ftp_protocol}")
+
+    if len(ftp_url_components) == 3:
+        ftp_port = ftp_url_components[2]
+        ftp_url = ftp_url_components[1].split("//")[1]
+    else:
+        ftp_url = ftp_url_components[1].split("//")[1]
+
+    return {
+        'url': ftp_url.strip(),
+        'user': ftp_user.strip(),
+        'password': ftp_password.strip(),
+        'path': ftp_path.strip(),
+        'protocol': ftp_protocol.strip(),
+        'port': ftp_port.strip()
+    }
+
+
+# takes an int or str and prefixes its absolute value with "0" until length is reached
+def prefix_with_zeros(value_to_prefix: Union[int, str], length: int) -> str:
+    # Ensure value_to_prefix is positive
+    if type(value_to_prefix) is int:
+        return f"{abs(value_to_prefix):0{length}d}"
+
+    # Prefix with zeros until the desired length is reached
+    return str(value_to_prefix).rjust(length, "0")
+
+
+# converts an integer string to its hex representation
+def binary_to_hex(binary: str) -> str:
+    # Convert binary to integer - add the prefixing 11 as per requirements for HRDF
+    integer_value = int("11" + binary, 2)
+
+    # Convert integer to hexadecimal string, removing the '0x' prefix
+    hex_value = hex(integer_value)[2:]  # Get hex representation without '0x'
+
+    # Convert to uppercase
+    hex_value = hex_value.upper()
+
+    # Convert integer to hex string and return it
+    return hex_value
+
+
+# checks if point-tuple is in polygon (list of tuples)
+def is_point_in_polygon(point: Tuple[float, float], polygon: List[Tuple[float, float]]) -> bool:
+    x, y = point
+    n = len(polygon)
+    inside = False
+
+    p1x, p1y = polygon[0]
+    for i in range(n + 1):
+        p2x, p2y = polygon[i % n]
+        xinters = 0.0
+        if y > min(p1y, p2y):
+            if y <= max(p1y, p2y):
+                if x <= max(p1x, p2x):
+                    if p1y != p2y:
+                        xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+                    if p1x == p2x or x <= xinters:
+                        inside = not inside  # Toggle the inside status
+        p1x, p1y = p2x, p2y
+
+    return inside  # Return whether the point is inside the polygon
+
+
+######### Conversion context #############
+# The resources of the conversion: the recycled ATTRIBUT file and the BETRIEB entries of the betrieb_de file. They are
+# loaded once and only read afterwards, thus they can be shared by several conversions (also in threads)
+class ConversionResources:
+    def __init__(self, encoding: str):
+        # we use the pre-loaded attribut file in the resources folder, which originates from the HRDF-export (23.05.2025)
+        self.attribut_file = get_resource_file_path("attribut")
+
+        # load the content of the ATTRIBUT file
+        with open(self.attribut_file, 'r', encoding=encoding) as file:
+            self.attribut_content = file.readlines()  # Read all lines into a list
+
+        # the betrieb_de file, which we need to look up the transport operator data to include in the betrieb export
+        # (originally from hrdf export 17.06.2025)
+        with open(get_resource_file_path("betrieb_de"), 'r', encoding=encoding) as file:
+            betrieb_content = file.readlines()  # Read all lines into a list
+
+        # index the entries by operator id, lines in betrieb are triples and the third one contains the id
+        self.betrieb_entries_by_id = {}  # operator id -> the three lines of the operator
+
+        for i in range(0, len(betrieb_content) - 2, 3):
+            betrieb_id = betrieb_content[i + 2].split(":")[1].strip()
+            self.betrieb_entries_by_id.setdefault(betrieb_id, (betrieb_content[i], betrieb_content[i + 1],
+                                                               betrieb_content[i + 2]))
+
+
+# The state of a single conversion: the writer of the HRDF files, the id iterators and the resources. Every conversion
+# gets its own context
+class ConversionContext:
+    def __init__(self, hrdf_writer: Union[HrdfWriter, HrdfFragmentWriter], resources: ConversionResources,
+                 run_metrics: Optional[RunMetrics] = None):
+        self.hrdf_writer = hrdf_writer
+        self.resources = resources
+        self.metrics = RunMetrics() if run_metrics is None else run_metrics
+
+        # Declare an iterator to iterate through journeys/trips in fplan
+        self.fplan_trip_iterator = 0
+
+        # To avoid crossing the "normal" bitfield numbers, we start with the id 900000
+        self.bitfeld_starting_number = 900000
+
+        # Booking rule iterator
+        self.infotext_id = 900000000
+
+        # Region iterator
+        self.region_id = 1
+
+        # Pseudo stop ("virtuelle haltestelle") id iterator
+        self.pseudo_stop_id = 9500000
+
+        # The trips of the FPLAN, written once all flexible lines are converted
+        self.fplan_table = FplanTable()
+
+
+######### HRDF records #############
+# Typed records of the lines the converter writes to the HRDF files. The fixed-width layout of each line is defined
+# once, with the fields of its record type referenced by name (see hrdf_layout), and the records are rendered in bulk
+# with render_hrdf_records. The hot loops render a line from the values of the fields directly, without creating the
+# record, e.g., BahnhofRecord.render(stop_id, name). The lines of the FPLAN are closed at column 60 (see
+# close_fplan_line) and rendered from the columns of the FplanTable
+
+# compiles the given layout with the fields referenced by name (e.g., "{stop_id} {longitude:0<11}") into the format
+# function of the values of the fields in the given order (e.g., "{0} {1:0<11}".format), thus a record renders without
+# looking up its fields
+def compile_hrdf_layout(layout: str, fields: Tuple[str, ...]):
+    import string
+
+    parts = []
+
+    for literal_text, field_name, format_spec, conversion in string.Formatter().parse(layout):
+        parts.append(literal_text.replace("{", "{{").replace("}", "}}"))
+
+        if field_name is not None:
+            if field_name not in fields:
+                raise ValueError(f"!ERROR! The layout {layout} refers to the unknown field {field_name}.")
+
+            parts.append("{" + str(fields.index(field_name)) + ("!" + conversion if conversion else "") +
+                         (":" + format_spec if format_spec else "") + "}")
+
+    return "".join(parts).format
+
+
+# sets the layout of an HRDF record type (a NamedTuple) and its compiled format function (render, see
+# compile_hrdf_layout)
+def hrdf_layout(layout: str):
+    def set_layout(record_type):
+        record_type.layout = layout
+        record_type.render = compile_hrdf_layout(layout, record_type._fields)
+
+        return record_type
+
+    return set_layout
+
+
+# FPLAN: a comment of a trip, e.g., "% Offer 0 0_0 SSI"
+@hrdf_layout("% {text}")
+class FplanCommentRecord(NamedTuple):
+    text: str
+
+
+# FPLAN: the trip ("*T"), its number, operator and duration in minutes (the period in which it can be booked)
+@hrdf_layout("*T {trip_number:06d} {operator_id} {duration:04d} 0060")
+class FplanTripRecord(NamedTuple):
+    trip_number: int
+    operator_id: str
+    duration: int
+
+
+# FPLAN: the days of the trip ("*A VE"), i.e., the id of its bitfield
+@hrdf_layout("*A VE                 {bitfield_id}")
+class FplanBitfieldRecord(NamedTuple):
+    bitfield_id: int
+
+
+# FPLAN: the category of the trip ("*G")
+@hrdf_layout("*G {category}")
+class FplanCategoryRecord(NamedTuple):
+    category: str
+
+
+# FPLAN: an attribute of the trip ("*A")
+@hrdf_layout("*A {code}")
+class FplanAttributeRecord(NamedTuple):
+    code: str
+
+
+# FPLAN: an infotext of the trip ("*I"), its code and id
+@hrdf_layout("*I {code}                        {infotext_id}")
+class FplanInfotextRecord(NamedTuple):
+    code: str
+    infotext_id: int
+
+
+# FPLAN: the first stop of the trip with its departure (compact time, see time_to_compact_time)
+@hrdf_layout("{stop_id} {stop_type}                          {departure}")
+class FplanDepartureRecord(NamedTuple):
+    stop_id: str
+    stop_type: str
+    departure: str
+
+
+# FPLAN: the last stop of the trip with its arrival (compact time, see time_to_compact_time)
+@hrdf_layout("{stop_id} {stop_type}                   {arrival}")
+class FplanArrivalRecord(NamedTuple):
+    stop_id: str
+    stop_type: str
+    arrival: str
+
+
+# BAHNHOF: a (pseudo) stop and its name
+@hrdf_layout("{stop_id}     {name}")
+class BahnhofRecord(NamedTuple):
+    stop_id: str
+    name: str
+
+
+# REGION: the header of a region ("*R")
+@hrdf_layout("*R {region_id:08d} {name}")
+class RegionRecord(NamedTuple):
+    region_id: int
+    name: str
+
+
+# REGION: a vertex of the polygon of a region, the coordinates are filled up with zeros to 10 characters
+@hrdf_layout("{longitude:0<10} {latitude:0<10}")
+class RegionCoordinateRecord(NamedTuple):
+    longitude: str
+    latitude: str
+
+
+# BFKOORD: the coordinates of a (pseudo) stop, filled up with zeros to 11 characters
+@hrdf_layout("{stop_id} {longitude:0<11} {latitude:0<11}        % {name}")
+class BfkoordRecord(NamedTuple):
+    stop_id: str
+    longitude: str
+    latitude: str
+    name: str
+
+
+# BHFART: the type of a pseudo stop ("B")
+@hrdf_layout("{stop_id} B  7  0 {name}")
+class BhfartTypeRecord(NamedTuple):
+    stop_id: str
+    name: str
+
+
+# BHFART: the priority of a (pseudo) stop ("P")
+@hrdf_layout("{stop_id} P % {name}")
+class BhfartPriorityRecord(NamedTuple):
+    stop_id: str
+    name: str
+
+
+# BHFART: the exclusion of a pseudo stop ("E")
+@hrdf_layout("{stop_id} E T % {name}")
+class BhfartExclusionRecord(NamedTuple):
+    stop_id: str
+    name: str
+
+
+# renders the given records to their lines
+def render_hrdf_records(records: list) -> list[str]:
+    return [record.render(*record) for record in records]
+
+
+# ensures appropriate flplan line width and closure with %
+def close_fplan_line(line_to_close: str) -> str:
+    # If the line is shorter than 60 characters, pad it with spaces
+    if len(line_to_close) < 60:
+        line_to_close = line_to_close.ljust(60)  # Pad with spaces on the right
+
+    # Insert '%' at position 60
+    return line_to_close[:59] + '%' + line_to_close[59:]
+
+
+# The trips of the FPLAN as columns: filled while converting the flexible lines and written in a single pass at the end
+# (see write_to). The trips of an availability condition (of an FPLAN triple) share its period, duration, bitfield and
+# time, and the conditions of a flexible line share its operator, attributes and infotexts, thus these are looked up,
+# computed and rendered once, not once per line of the FPLAN
+class FplanTable:
+    def __init__(self):
+        # per flexible line
+        self.line_operator_ids = []
+        self.line_attribute_codes = []  # the codes of the *A lines
+        self.line_infotext_ids = []  # the (code, id) of the *I lines
+
+        # per availability condition of an FPLAN triple
+        self.condition_lines = []  # the index of the flexible line
+        self.condition_pattern_names = []  # the flexible line name and the service journey pattern, e.g., "Offer 0_1"
+        self.condition_periods = []  # the start and end time, e.g., "08:00-21:45"
+        self.condition_durations = []  # in minutes
+        self.condition_bitfield_ids = []
+        self.condition_times = []  # the departure and arrival (compact time, see time_to_compact_time)
+
+        # per trip
+        self.trip_numbers = []
+        self.trip_conditions = []  # the index of the availability condition
+        self.trip_stop_types = []  # the index of the type of the first stop in hrdf_stop_types (the last one follows)
+        self.trip_departure_stop_ids = []
+        self.trip_arrival_stop_ids = []
+
+    def __len__(self):
+        return len(self.trip_numbers)
+
+    # add a flexible line and return its index
+    def add_flexible_line(self, operator_id: str, attribute_codes: list[str],
+                          infotext_ids: list[Tuple[str, int]]) -> int:
+        self.line_operator_ids.append(operator_id)
+        self.line_attribute_codes.append(attribute_codes)
+        self.line_infotext_ids.append(infotext_ids)
+
+        return len(self.line_operator_ids) - 1
+
+    # add an availability condition of an FPLAN triple of the flexible line with the given index and return its index
+    def add_condition(self, line: int, pattern_name: str, period: str, duration: int, bitfield_id: int,
+                      time: str) -> int:
+        self.condition_lines.append(line)
+        self.condition_pattern_names.append(pattern_name)
+        self.condition_periods.append(period)
+        self.condition_durations.append(duration)
+        self.condition_bitfield_ids.append(bitfield_id)
+        self.condition_times.append(time)
+
+        return len(self.condition_lines) - 1
+
+    # add a trip of the availability condition with the given index
+    def add_trip(self, trip_number: int, condition: int, stop_type: int, departure_stop_id: str,
+                 arrival_stop_id: str):
+        self.trip_numbers.append(trip_number)
+        self.trip_conditions.append(condition)
+        self.trip_stop_types.append(stop_type)
+        self.trip_departure_stop_ids.append(departure_stop_id)
+        self.trip_arrival_stop_ids.append(arrival_stop_id)
+
+    # append the trips of the given table (e.g., of a flexible line converted in a worker process)
+    def extend(self, other: "FplanTable"):
+        line_offset = len(self.line_operator_ids)
+        condition_offset = len(self.condition_lines)
+
+        self.line_operator_ids.extend(other.line_operator_ids)
+        self.line_attribute_codes.extend(other.line_attribute_codes)
+        self.line_infotext_ids.extend(other.line_infotext_ids)
+
+        self.condition_lines.extend(line + line_offset for line in other.condition_lines)
+        self.condition_pattern_names.extend(other.condition_pattern_names)
+        self.condition_periods.extend(other.condition_periods)
+        self.condition_durations.extend(other.condition_durations)
+        self.condition_bitfield_ids.extend(other.condition_bitfield_ids)
+        self.condition_times.extend(other.condition_times)
+
+        self.trip_numbers.extend(other.trip_numbers)
+        self.trip_conditions.extend(condition + condition_offset for condition in other.trip_conditions)
+        self.trip_stop_types.extend(other.trip_stop_types)
+        self.trip_departure_stop_ids.extend(other.trip_departure_stop_ids)
+        self.trip_arrival_stop_ids.extend(other.trip_arrival_stop_ids)
+
+    # render the trips to the FPLAN in a single pass, written in batches of the given number of lines
+    def write_to(self, hrdf_writer: Union[HrdfWriter, HrdfFragmentWriter], batch_size: int = 1 << 16):
+        render_comment = FplanCommentRecord.render
+        render_trip = FplanTripRecord.render
+        render_departure = FplanDepartureRecord.render
+        render_arrival = FplanArrivalRecord.render
+
+        # the lines each trip of a flexible line has: the category, attributes and infotexts
+        category_line = close_fplan_line(FplanCategoryRecord.render("TEL"))
+        line_lines = []
+
+        for attribute_codes, infotext_ids in zip(self.line_attribute_codes, self.line_infotext_ids):
+            lines = [category_line]
+            lines.extend(close_fplan_line(FplanAttributeRecord.render(code)) for code in attribute_codes)
+            lines.extend(close_fplan_line(FplanInfotextRecord.render(code, infotext_id))
+                         for code, infotext_id in infotext_ids)
+            line_lines.append(lines)
+
+        fplan_lines = []
+        current_condition = None
+
+        for trip_number, condition, stop_type, departure_stop_id, arrival_stop_id in zip(
+                self.trip_numbers, self.trip_conditions, self.trip_stop_types, self.trip_departure_stop_ids,
+                self.trip_arrival_stop_ids):
+            # the lines the trips of the availability condition have in common
+            if condition != current_condition:
+                current_condition = condition
+                line = self.condition_lines[condition]
+                pattern_name = self.condition_pattern_names[condition]
+                operator_id = self.line_operator_ids[line]
+                duration = self.condition_durations[condition]
+                time = self.condition_times[condition]
+                period_line = close_fplan_line(render_comment(self.condition_periods[condition] + " Uhr"))
+                shared_lines = [close_fplan_line(FplanBitfieldRecord.render(self.condition_bitfield_ids[condition]))]
+                shared_lines.extend(line_lines[line])
+
+            first_stop_type = hrdf_stop_types[stop_type]
+            last_stop_type = hrdf_stop_types[stop_type + 1]
+
+            ## FPLAN - comment and journey
+            fplan_lines.append(close_fplan_line(render_comment(pattern_name + " " + first_stop_type)))
+            fplan_lines.append(period_line)
+            fplan_lines.append(close_fplan_line(render_trip(trip_number, operator_id, duration)))
+
+            ## FPLAN - bitfield/cal, attributes and infotexts
+            fplan_lines.extend(shared_lines)
+
+            # FPLAN - start/stop pseudo stop: only react to the starts and add also ends
+            fplan_lines.append(close_fplan_line(render_departure(departure_stop_id, first_stop_type, time)))
+            fplan_lines.append(close_fplan_line(render_arrival(arrival_stop_id, last_stop_type, time)))
+            fplan_lines.append("%")  # Newline
+
+            if len(fplan_lines) >= batch_size:
+                write_lines_to_hrdf(hrdf_writer, "fplan", fplan_lines)
+                fplan_lines = []
+
+        if fplan_lines:
+            write_lines_to_hrdf(hrdf_writer, "fplan", fplan_lines)
+
+
+######### HRDF-handling functions #############
+# initialize all HRDF files to the given folder
+def init_hrdf(context: ConversionContext):
+    # Create a mapping dictionary for HRDF file headers
+    hrdf_files_headers = {
+        "attribut": "*F 09 1",
+        "bahnhof": "*F 01 1",
+        "betrieb": "*F 28 1",
+        "bfkoord": "*F 02 1",
+        "bhfart": "*F 30 1",
+        "bitfeld": "*F 05 1",
+        "eckdaten": "*F 04 1",
+        "fplan": "*F 03 1",
+        "infotext": "*F 11 1",
+        "region": "*F 45 1",
+        "zugart": "*F 06 1"
+    }
+
+    # Create HRDF files and write headers
+    for hrdf_file in hrdf_files:
+        write_to_hrdf(context.hrdf_writer, hrdf_file, hrdf_files_headers[hrdf_file], False)
+
+    print("zugart hardcoded")
+    init_zugart(context)  # Initialize zugart HRDF
+
+    print("attribut recycled (originally from hrdf export 23.05.2025)")
+    init_attribut(context)  # Initialize attribut HRDF
+
+    # the operators are written to betrieb while converting the flexible lines
+    print("betrieb (originally from hrdf export 17.06.2025)")
+
+    print("HRDF files initiated")  # Log completion message
+
+
+# init the hard-coded zugart file
+def init_zugart(context: ConversionContext):
+    hrdf_writer = context.hrdf_writer
+
+    # FIXME: This is currently hard coded
+    write_to_hrdf(hrdf_writer, "zugart", "TEL 10   1  DRT      0 T     #104", True)
+    write_to_hrdf(hrdf_writer, "zugart", "<text>", True)
+    write_to_hrdf(hrdf_writer, "zugart", "<Deutsch>", True)
+    write_to_hrdf(hrdf_writer, "zugart", "class6 Bus", True)
+    write_to_hrdf(hrdf_writer, "zugart", "category104 DRT", True)
+    write_to_hrdf(hrdf_writer, "zugart", "<Englisch>", True)
+    write_to_hrdf(hrdf_writer, "zugart", "class6 Bus", True)
+    write_to_hrdf(hrdf_writer, "zugart", "category104 DRT", True)
+    write_to_hrdf(hrdf_writer, "zugart", "<Franzoesisch>", True)
+    write_to_hrdf(hrdf_writer, "zugart", "class6 Bus", True)
+    write_to_hrdf(hrdf_writer, "zugart", "category104 DRT", True)
+    write_to_hrdf(hrdf_writer, "zugart", "<Italienisch>", True)
+    write_to_hrdf(hrdf_writer, "zugart", "class6 Bus", True)
+    write_to_hrdf(hrdf_writer, "zugart", "category104 DRT", True)
+
+
+# init the attribut by copying it through the writer from the resources.
+def init_attribut(context: ConversionContext):
+    context.hrdf_writer.copy_from("attribut", context.resources.attribut_file)
+
+
+######### NeTEx records #############
+# Compact records of the NeTEx elements the converter needs. They are filled either from the whole DOM or while
+# streaming through the file, afterward the XML elements are no longer needed.
+@dataclass(slots=True)
+class BookingArrangementRecord:
+    id: str
+    booking_note: Optional[str]
+
+
+@dataclass(slots=True)
+class FlexibleLineRecord:
+    id: str
+    name: str
+    operator_ref: Optional[str]
+    booking_arrangements: list[BookingArrangementRecord]
+
+
+@dataclass(slots=True)
+class ServiceJourneyRecord:
+    flexible_line_ref: str
+    availability_condition_ref: str
+    service_journey_pattern_ref: str
+
+
+@dataclass(slots=True)
+class AvailabilityConditionRecord:
+    id: str
+    start_time: str
+    end_time: str
+    valid_day_bits: str
+
+
+@dataclass(slots=True)
+class ServiceJourneyPatternRecord:
+    id: str
+    scheduled_stop_point_ref: str
+
+
+@dataclass(slots=True)
+class FlexibleStopAssignmentRecord:
+    scheduled_stop_point_ref: str
+    flexible_area_ref: str
+
+
+@dataclass(slots=True)
+class FlexibleAreaRecord:
+    id: str
+    name: str
+    coordinates: Optional[list[str]]  # the texts of the gml:pos of the polygon, None if the area has no polygon
+
+
+# only the regular stops are kept, as these are the only ones we use
+@dataclass(slots=True)
+class StopPlaceRecord:
+    public_code: str
+    name: str
+    longitude: str
+    latitude: str
+
+
+@dataclass(slots=True)
+class OperatorRecord:
+    id: str
+    private_code: str
+    short_name: Optional[str]
+    name: Optional[str]
+    description: Optional[str]
+
+
+# all the records of a NeTEx file (in document order)
+@dataclass(slots=True)
+class NetexData:
+    from_date: Optional[str] = None  # the FromDate of the ValidBetween of the CompositeFrame
+    to_date: Optional[str] = None  # the ToDate of the ValidBetween of the CompositeFrame
+    valid_day_bits: list[str] = field(default_factory=list)
+    flexible_lines: list[FlexibleLineRecord] = field(default_factory=list)
+    service_journeys: list[ServiceJourneyRecord] = field(default_factory=list)
+    availability_conditions: list[AvailabilityConditionRecord] = field(default_factory=list)
+    service_journey_patterns: list[ServiceJourneyPatternRecord] = field(default_factory=list)
+    flexible_stop_assignments: list[FlexibleStopAssignmentRecord] = field(default_factory=list)
+    flexible_areas: list[FlexibleAreaRecord] = field(default_factory=list)
+    stop_places: list[StopPlaceRecord] = field(default_factory=list)
+    operators: list[OperatorRecord] = field(default_factory=list)
+
+
+# the records keyed by the references they are joined with (records with the same key stay in document order)
+@dataclass(slots=True)
+class NetexIndex:
+    service_journeys_by_flexible_line_ref: dict[str, list[ServiceJourneyRecord]]
+    availability_conditions_by_id: dict[str, list[AvailabilityConditionRecord]]
+    service_journey_patterns_by_id: dict[str, list[ServiceJourneyPatternRecord]]
+    flexible_stop_assignments_by_scheduled_stop_point_ref: dict[str, list[FlexibleStopAssignmentRecord]]
+    flexible_areas_by_id: dict[str, list[FlexibleAreaRecord]]
+    operators_by_id: dict[str, OperatorRecord]  # the first operator with the given id
+
+
+# a BITFELD entry, i.e., the id used in the FPLAN for the given valid day bits
+@dataclass(slots=True)
+class Bitfield:
+    id: int
+    hex: str
+    bits: str
+
+
+# a pseudo stop ("virtuelle haltestelle") of a flexible line for one of the hrdf_stop_types
+@dataclass(slots=True)
+class PseudoStop:
+    flexible_line_name: str
+    id: str
+    type: str
+
+
+# the values of the id iterators a flexible line starts with (or the number of ids it takes from each of them)
+@dataclass(slots=True)
+class IdBlock:
+    fplan_trip_iterator: int
+    infotext_id: int
+    region_id: int
+    pseudo_stop_id: int
+
+
+######### NeTEx reading #############
+# returns the text of the first element matching the path, None if there is none
+def find_text(element: Element, path: str) -> Optional[str]:
+    found = element.find(path, namespaces=namespace)
+
+    return None if found is None else found.text
+
+
+# returns the ref attribute of the first element matching the path, None if there is none
+def find_ref(element: Element, path: str) -> Optional[str]:
+    found = element.find(path, namespaces=namespace)
+
+    return None if found is None else found.attrib.get('ref')
+
+
+def to_flexible_line_record(flexible_line: Element) -> FlexibleLineRecord:
+    booking_arrangements = [BookingArrangementRecord(booking_arrangement.attrib.get('id'),
+                                                     find_text(booking_arrangement, './/BookingNote'))
+                            for booking_arrangement in
+                            flexible_line.findall('.//BookingArrangement', namespaces=namespace)]
+
+    return FlexibleLineRecord(flexible_line.attrib.get('id'), find_text(flexible_line, './/Name'),
+                              find_ref(flexible_line, './/OperatorRef'), booking_arrangements)
+
+
+def to_service_journey_record(service_journey: Element) -> ServiceJourneyRecord:
+    return ServiceJourneyRecord(find_ref(service_journey, './/FlexibleLineRef'),
+                                find_ref(service_journey, './/AvailabilityConditionRef'),
+                                find_ref(service_journey, './/ServiceJourneyPatternRef'))
+
+
+def to_availability_condition_record(availability_condition: Element) -> AvailabilityConditionRecord:
+    return AvailabilityConditionRecord(availability_condition.attrib.get('id'),
+                                       find_text(availability_condition, './/StartTime'),
+                                       find_text(availability_condition, './/EndTime'),
+                                       find_text(availability_condition, './/ValidDayBits'))
+
+
+def to_service_journey_pattern_record(service_journey_pattern: Element) -> ServiceJourneyPatternRecord:
+    return ServiceJourneyPatternRecord(service_journey_pattern.attrib.get('id'),
+                                       find_ref(service_journey_pattern, './/ScheduledStopPointRef'))
+
+
+def to_flexible_stop_assignment_record(flexible_stop_assignment: Element) -> FlexibleStopAssignmentRecord:
+    return FlexibleStopAssignmentRecord(find_ref(flexible_stop_assignment, './/ScheduledStopPointRef'),
+                                        find_ref(flexible_stop_assignment, './/FlexibleAreaRef'))
+
+
+def to_flexible_area_record(flexible_area: Element) -> FlexibleAreaRecord:
+    polygon_element = flexible_area.find('.//gml:Polygon', namespaces=namespace)
+    coordinates = None
+
+    if polygon_element is not None:
+        coordinates = [coordinate.text for coordinate in polygon_element.findall('.//gml:pos', namespaces=namespace)]
+
+    return FlexibleAreaRecord(flexible_area.attrib.get('id'), find_text(flexible_area, './/Name'), coordinates)
+
+
+# returns None for all but the regular stops
+def to_stop_place_record(stop_place: Element) -> Optional[StopPlaceRecord]:
+    type_of_place_ref = find_ref(stop_place, './/TypeOfPlaceRef')
+
+    if type_of_place_ref is None or "regularStop" not in type_of_place_ref:
+        return None
+
+    return StopPlaceRecord(find_text(stop_place, './/PublicCode'), find_text(stop_place, './/Name'),
+                           find_text(stop_place, './/Longitude'), find_text(stop_place, './/Latitude'))
+
+
+def to_operator_record(operator: Element) -> OperatorRecord:
+    return OperatorRecord(operator.attrib.get('id'), find_text(operator, './/PrivateCode'),
+                          find_text(operator, './/ShortName'), find_text(operator, './/Name'),
+                          find_text(operator, './/Description'))
+
+
+# NeTEx element name -> (function creating the record, NetexData list the record is added to)
+netex_record_types = {
+    'FlexibleLine': (to_flexible_line_record, 'flexible_lines'),
+    'ServiceJourney': (to_service_journey_record, 'service_journeys'),
+    'AvailabilityCondition': (to_availability_condition_record, 'availability_conditions'),
+    'ServiceJourneyPattern': (to_service_journey_pattern_record, 'service_journey_patterns'),
+    'FlexibleStopAssignment': (to_flexible_stop_assignment_record, 'flexible_stop_assignments'),
+    'FlexibleArea': (to_flexible_area_record, 'flexible_areas'),
+    'StopPlace': (to_stop_place_record, 'stop_places'),
+    'Operator': (to_operator_record, 'operators')
+}
+
+
+# read the records from the whole NeTEx DOM, i.e., the complete file is kept in memory while reading
+def read_netex_dom(netex_source) -> NetexData:
+    root = xml_etree.parse(netex_source).getroot()  # Parse the XML file and get the root element
+    netex_data = NetexData()
+
+    validity_period = root.find('.//CompositeFrame//ValidBetween', namespaces=namespace)
+
+    if validity_period is not None:
+        netex_data.from_date = find_text(validity_period, './/FromDate')
+        netex_data.to_date = find_text(validity_period, './/ToDate')
+
+    netex_data.valid_day_bits = [valid_day_bits.text for valid_day_bits in
+                                 root.findall('.//ValidDayBits', namespaces=namespace)]
+
+    for element_name, (to_record, records_name) in netex_record_types.items():
+        records = getattr(netex_data, records_name)
+
+        for element in root.findall('.//' + element_name, namespaces=namespace):
+            record = to_record(element)
+
+            if record is not None:
+                records.append(record)
+
+    return netex_data
+
+
+# read the records while streaming through the NeTEx file with iterparse. Each subtree is dropped once its record was
+# created, so memory stays bounded by the records and the largest single element.
+def read_netex_stream(netex_source) -> NetexData:
+    netex_namespace = '{' + namespace[''] + '}'
+    record_types = {netex_namespace + element_name: record_type for element_name, record_type in
+                    netex_record_types.items()}
+    valid_day_bits_tag = netex_namespace + 'ValidDayBits'
+    valid_between_tag = netex_namespace + 'ValidBetween'
+    composite_frame_tag = netex_namespace + 'CompositeFrame'
+
+    netex_data = NetexData()
+    open_elements = []  # the elements currently being parsed, i.e., the path from the root
+    open_kept_elements = 0  # number of open elements whose subtree is still required to create a record
+    open_composite_frames = 0
+
+    for event, element in xml_etree.iterparse(netex_source, events=('start', 'end')):
+        tag = element.tag
+
+        if event == 'start':
+            open_elements.append(element)
+
+            if tag in record_types or tag == valid_between_tag:
+                open_kept_elements += 1
+            elif tag == composite_frame_tag:
+                open_composite_frames += 1
+
+            continue
+
+        open_elements.pop()
+
+        if tag in record_types:
+            to_record, records_name = record_types[tag]
+            record = to_record(element)
+
+            if record is not None:
+                getattr(netex_data, records_name).append(record)
+
+            open_kept_elements -= 1
+        elif tag == valid_day_bits_tag:
+            netex_data.valid_day_bits.append(element.text)
+        elif tag == valid_between_tag:
+            # only the first ValidBetween of a CompositeFrame defines the validity period
+            if open_composite_frames > 0 and netex_data.from_date is None and netex_data.to_date is None:
+                netex_data.from_date = find_text(element, './/FromDate')
+                netex_data.to_date = find_text(element, './/ToDate')
+
+            open_kept_elements -= 1
+        elif tag == composite_frame_tag:
+            open_composite_frames -= 1
+
+        # the element (and its already parsed siblings) has been consumed, remove them from the parent
+        if open_kept_elements == 0 and open_elements:
+            del open_elements[-1][:]
+
+    return netex_data
+
+
+# read the records from the NeTEx file with the given parser ("stream" or "dom") and report the peak memory
+def read_netex(netex_source, netex_parser: str) -> NetexData:
+    if netex_parser == "stream":
+        netex_data = read_netex_stream(netex_source)
+    elif netex_parser == "dom":
+        netex_data = read_netex_dom(netex_source)
+    else:
+        raise ValueError(f"!ERROR! Unsupported NeTEx parser: {netex_parser}")
+
+    peak_memory = get_peak_memory_mb()
+    print(f"  # Read NeTEx ({netex_parser}), peak memory: "
+          f"{'unknown' if peak_memory is None else f'{peak_memory:.1f} MB'}")
+
+    return netex_data
+
+
+# The version of the records in the NeTEx cache, to be increased whenever the records (see NetexData) change
+NETEX_CACHE_VERSION = 1
+
+
+# A cache of the records read from NeTEx files (see NetexData) in a folder, one file per content (the SHA-256 of the
+# NeTEx file, the XML member and the version of the records). A NeTEx file read before, e.g., converted again with other
+# offers or output format, or an unchanged file next to changed ones, is loaded instead of parsed. Only the most
+# recently used entries are kept. The entries are pickled, thus the folder must be trusted
+class NetexCache:
+    def __init__(self, folder: str, max_entries: int = 8):
+        self.folder = folder
+        self.max_entries = max_entries
+
+        os.makedirs(folder, exist_ok=True)
+
+    # the key of the records of the given NeTEx file (or of the XML in the ZIP)
+    def get_key(self, netex_file_path: str, netex_member: Optional[str] = None) -> str:
+        sha256 = hashlib.sha256()
+        sha256.update(f"{NETEX_CACHE_VERSION} {netex_member or ''} {get_file_sha256(netex_file_path)}".encode('utf-8'))
+
+        return sha256.hexdigest()
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.folder, key + ".pickle")
+
+    # the records with the given key, None if they are not (or no longer) in the cache
+    def load(self, key: str) -> Optional[NetexData]:
+        import pickle
+
+        path = self.get_path(key)
+
+        try:
+            with open(path, 'rb') as file:
+                netex_data = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # e.g., a truncated file, it is read anew and replaced
+            print(f"WARNING: Could not load {path} from the NeTEx cache: {str(e) or type(e).__name__}")
+            return None
+
+        if not isinstance(netex_data, NetexData):
+            return None
+
+        # the entry was used recently
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        return netex_data
+
+    # store the records with the given key (replacing the entry at once) and drop the least recently used entries. The
+    # conversion does not fail if the cache cannot be written
+    def store(self, key: str, netex_data: NetexData):
+        import pickle
+        import threading
+
+        path = self.get_path(key)
+        temporary_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # unique per thread
+
+        try:
+            with open(temporary_path, 'wb') as file:
+                pickle.dump(netex_data, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+            os.replace(temporary_path, path)
+            self.prune()
+        except OSError as e:
+            print(f"WARNING: Could not store {path} in the NeTEx cache: {str(e) or type(e).__name__}")
+
+            if os.path.isfile(temporary_path):
+                os.remove(temporary_path)
+
+    # remove the least recently used entries beyond the maximum number of entries
+    def prune(self):
+        entries = [entry for entry in os.scandir(self.folder) if entry.name.endswith(".pickle")]
+        entries.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+
+        for entry in entries[self.max_entries:]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass  # e.g., read by another process (Windows)
+
+
+# read the records of each NeTEx file (XML or ZIP) and merge them into the records of a single NeTEx file (see
+# merge_netex_data). The files are read in parallel by up to the given number of processes
+def read_netex_files(netex_file_paths: list[str], netex_parser: str, netex_member: Optional[str] = None,
+                     workers: int = 1, run_metrics: Optional[RunMetrics] = None,
+                     netex_cache_folder: Optional[str] = None) -> NetexData:
+    processes = min(workers, len(netex_file_paths))
+
+    print(f"  # Reading {len(netex_file_paths)} NeTEx files with {processes} processes")
+
+    if processes > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            netex_datas = list(executor.map(read_netex_file, netex_file_paths, [netex_parser] * len(netex_file_paths),
+                                            [netex_member] * len(netex_file_paths),
+                                            [netex_cache_folder] * len(netex_file_paths)))
+    else:
+        netex_datas = [read_netex_file(netex_file_path, netex_parser, netex_member, netex_cache_folder)
+                       for netex_file_path in netex_file_paths]
+
+    if run_metrics is not None:
+        run_metrics.count("netex_files", len(netex_file_paths))
+
+    return merge_netex_data(netex_datas, run_metrics)
+
+
+# read the records of the given NeTEx file (or of the XML in the ZIP). If a cache folder is given, the records are
+# loaded from the cache if the same content was read before, otherwise they are stored there (see NetexCache)
+def read_netex_file(netex_file_path: str, netex_parser: str, netex_member: Optional[str] = None,
+                    netex_cache_folder: Optional[str] = None) -> NetexData:
+    netex_cache = None
+
+    if netex_cache_folder is not None:
+        netex_cache = NetexCache(netex_cache_folder)
+        cache_key = netex_cache.get_key(netex_file_path, netex_member)
+        netex_data = netex_cache.load(cache_key)
+
+        if netex_data is not None:
+            print(f"  # Loaded the NeTEx records of {os.path.basename(netex_file_path)} from the cache")
+            return netex_data
+
+    with open_netex_file(netex_file_path, netex_member) as netex_source:
+        netex_data = read_netex(netex_source, netex_parser)
+
+    if netex_cache is not None:
+        netex_cache.store(cache_key, netex_data)
+
+    return netex_data
+
+
+# merge the records of several NeTEx files (e.g., the deliveries of several operators or regions) as if they were the
+# records of a single file, in the order of the files. The validity period spans the ones of all files and the valid day
+# bits of a file starting later are shifted to the start of the merged period (and cut at its end). The given records
+# are not changed, the shifted availability conditions are copies. A record an earlier file already delivered (the same
+# id, or the same content for records without an id, e.g., the same stop or operator) is dropped
+def merge_netex_data(netex_datas: list[NetexData], run_metrics: Optional[RunMetrics] = None) -> NetexData:
+    from dataclasses import replace
+
+    if len(netex_datas) == 1:
+        return netex_datas[0]
+
+    merged_netex_data = NetexData()
+
+    from_dates = [netex_data.from_date for netex_data in netex_datas if netex_data.from_date is not None]
+    to_dates = [netex_data.to_date for netex_data in netex_datas if netex_data.to_date is not None]
+    merged_netex_data.from_date = min(from_dates, key=netex_date_to_date) if from_dates else None
+    merged_netex_data.to_date = max(to_dates, key=netex_date_to_date) if to_dates else None
+
+    # the number of days of the merged period (the valid day bits cover at most these)
+    period_days = None
+    if merged_netex_data.from_date is not None and merged_netex_data.to_date is not None:
+        period_days = (netex_date_to_date(merged_netex_data.to_date) -
+                       netex_date_to_date(merged_netex_data.from_date)).days + 1
+
+    shifted_netex_datas = []
+
+    for netex_data in netex_datas:
+        # the days between the start of the merged period and the one of the file
+        shift = 0
+        if netex_data.from_date is not None:
+            shift = (netex_date_to_date(netex_data.from_date) - netex_date_to_date(merged_netex_data.from_date)).days
+
+        def shift_bits(valid_day_bits: str) -> str:
+            return ("0" * shift + valid_day_bits)[:period_days]
+
+        if shift > 0 or period_days is not None:
+            netex_data = replace(netex_data, valid_day_bits=list(map(shift_bits, netex_data.valid_day_bits)),
+                                 availability_conditions=[
+                                     replace(availability_condition,
+                                             valid_day_bits=shift_bits(availability_condition.valid_day_bits))
+                                     for availability_condition in netex_data.availability_conditions])
+
+        shifted_netex_datas.append(netex_data)
+        merged_netex_data.valid_day_bits.extend(netex_data.valid_day_bits)
+
+    netex_datas = shifted_netex_datas
+
+    record_keys = {
+        'flexible_lines': lambda record: record.id,
+        'service_journeys': lambda record: (record.flexible_line_ref, record.availability_condition_ref,
+                                            record.service_journey_pattern_ref),
+        'availability_conditions': lambda record: record.id,
+        'service_journey_patterns': lambda record: record.id,
+        'flexible_stop_assignments': lambda record: (record.scheduled_stop_point_ref, record.flexible_area_ref),
+        'flexible_areas': lambda record: record.id,
+        'stop_places': lambda record: record.public_code,
+        'operators': lambda record: record.id
+    }
+
+    for records_name, key in record_keys.items():
+        merged_records = getattr(merged_netex_data, records_name)
+        earlier_records = {}  # the records of the earlier files by their key
+        differing_keys = []  # the keys of the dropped records that differ from the kept ones
 
-    # Calculate the total minutes for each time
-    total_minutes1 = time1.total_seconds() / 60
-    total_minutes2 = time2.total_seconds() / 60
+        for netex_data in netex_datas:
+            records = {}
 
-    # Calculate the difference in minutes
-    difference = total_minutes2 - total_minutes1
+            for record in getattr(netex_data, records_name):
+                record_key = key(record)
+                earlier_record = earlier_records.get(record_key)
 
-    # If the difference is negative, it means crossing over to the next day
-    if difference < 0:
-        difference += 24 * 60  # Add 24 hours in minutes
+                if earlier_record is None:
+                    merged_records.append(record)
+                    records.setdefault(record_key, record)
+                    continue
 
-    return int(difference)  # Return the difference as an integer
+                if earlier_record != record:
+                    differing_keys.append(record_key)
 
+                if run_metrics is not None:
+                    run_metrics.count("duplicate_" + records_name)
 
-# changes timestamps from hh:mm:ss to 0hhmm
-def time_to_compact_time(time: str) -> str:
-    # Remove seconds and replace ':' with ''
-    time = time[:-3].replace(':', '')
+            for record_key, record in records.items():
+                earlier_records.setdefault(record_key, record)
 
-    # Ensure the string has the right number of digits (5 digits)
-    time = prefix_with_zeros(time, 5)
+        if differing_keys:
+            print(f"WARNING: {len(differing_keys)} {records_name} differ between the NeTEx files (e.g., "
+                  f"{differing_keys[0]}), keeping the ones of the first file")
 
-    return time  # Return the compact time string
+    print(f"  # Merged {len(netex_datas)} NeTEx files: {len(merged_netex_data.flexible_lines)} flexible lines, "
+          f"{len(merged_netex_data.stop_places)} stops, {len(merged_netex_data.operators)} operators")
 
+    return merged_netex_data
 
-# transform the netex 2024-12-15T00:00:00 to hrdf 15.12.2024
-def netex_date_to_hrdf_date(date_str):
-    # Parse the date string into a datetime object
-    date_object = datetime.fromisoformat(date_str)
 
-    # Format the datetime object to the desired format
-    formatted_date = date_object.strftime("%d.%m.%Y")
+# group the given records by the given key (keeping the document order)
+def group_records(records: list, key) -> dict:
+    groups = {}
 
-    return formatted_date
+    for record in records:
+        groups.setdefault(key(record), []).append(record)
 
+    return groups
 
-######### STRING Operations #############
-# empty check
-def is_nan_or_empty(value: str) -> bool:
-    return value is None or pd.isna(value) or value == ""
 
+# build the indexes used to join the records, all in a single pass over each record list
+def index_netex(netex_data: NetexData) -> NetexIndex:
+    operators_by_id = {}
 
-# ensure the given value has the given length and amends it at the beginning or end with the given string if not
-def ensure_width(value: str, length: int, amend: str, at_end: bool) -> str:
-    while len(value) < length:
-        if at_end:
-            value = (value + amend)
-        else:
-            value = (amend + value)
+    for operator in netex_data.operators:
+        operators_by_id.setdefault(operator.id, operator)
 
-    return value
+    return NetexIndex(
+        group_records(netex_data.service_journeys, lambda record: record.flexible_line_ref),
+        group_records(netex_data.availability_conditions, lambda record: record.id),
+        group_records(netex_data.service_journey_patterns, lambda record: record.id),
+        group_records(netex_data.flexible_stop_assignments, lambda record: record.scheduled_stop_point_ref),
+        group_records(netex_data.flexible_areas, lambda record: record.id),
+        operators_by_id)
 
 
-######### Auxiliary functions #############
-# get the path to the "previous file" that was transformed. If the folder (and file) does not exist, create folder.
-# return path or None.
-def get_previous_file_name() -> str:
-    previous_folder = os.path.join(os.getcwd(), PREVIOUS_FOLDER_NAME)
+######### Stop geometry #############
+# The coordinates of the regular stops, extracted once into arrays and indexed by a grid of cell_size degrees, such that
+# a point-in-polygon test only considers the stops within the bounding box of the polygon. The tests are vectorized with
+# numpy if it is installed (otherwise is_point_in_polygon is used), and the result for each polygon is cached.
+class StopGeometry:
+    def __init__(self, stop_places: list[StopPlaceRecord], cell_size: float = 0.05):
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+        self.stop_places = stop_places
+        self.cell_size = cell_size
+        self.numpy = numpy
+        self.longitudes = [float(stop_place.longitude) for stop_place in stop_places]
+        self.latitudes = [float(stop_place.latitude) for stop_place in stop_places]
+        self.grid = {}  # (column, row) -> indices of the stops in the cell (ascending)
+        self.stops_in_polygons = {}  # polygon (as tuple) -> stops in the polygon
+        self.tested_stops = 0  # the number of stops tested for being in a polygon
+
+        for index, (longitude, latitude) in enumerate(zip(self.longitudes, self.latitudes)):
+            # a stop without proper coordinates can never be in a polygon
+            if math.isfinite(longitude) and math.isfinite(latitude):
+                self.grid.setdefault(self.get_cell(longitude, latitude), []).append(index)
+
+        if numpy is not None:
+            self.longitudes = numpy.array(self.longitudes, dtype=numpy.float64)
+            self.latitudes = numpy.array(self.latitudes, dtype=numpy.float64)
+
+    # returns the (column, row) of the grid cell containing the given point
+    def get_cell(self, longitude: float, latitude: float) -> Tuple[int, int]:
+        return math.floor(longitude / self.cell_size), math.floor(latitude / self.cell_size)
+
+    # returns the indices (ascending) of the stops within the grid cells covering the given bounding box
+    def get_candidate_indices(self, min_longitude: float, min_latitude: float, max_longitude: float,
+                              max_latitude: float) -> list[int]:
+        first_column, first_row = self.get_cell(min_longitude, min_latitude)
+        last_column, last_row = self.get_cell(max_longitude, max_latitude)
+        candidate_indices = []
+
+        if (last_column - first_column + 1) * (last_row - first_row + 1) <= len(self.grid):
+            for column in range(first_column, last_column + 1):
+                for row in range(first_row, last_row + 1):
+                    candidate_indices.extend(self.grid.get((column, row), []))
+        else:
+            # the bounding box covers more cells than are occupied, only check the occupied ones
+            for (column, row), cell_indices in self.grid.items():
+                if first_column <= column <= last_column and first_row <= row <= last_row:
+                    candidate_indices.extend(cell_indices)
 
-    # if previous folder exists and is folder
-    previous_netex_file_name = None
+        candidate_indices.sort()
 
-    if os.path.exists(previous_folder) and os.path.isdir(previous_folder):
-        # get the single file in it
-        for filename in os.listdir(previous_folder):
-            previous_netex_file_name = filename  # Get the full file path
-    else:
-        os.makedirs(previous_folder, exist_ok=False)
+        return candidate_indices
 
-    return previous_netex_file_name
+    # returns the indices (ascending) of the stops that may be in the given polygon, i.e., the ones in the grid cells
+    # covering its bounding box
+    def get_candidate_indices_of_polygon(self, polygon: List[Tuple[float, float]]) -> list[int]:
+        if len(polygon) == 0:
+            return []
 
+        return self.get_candidate_indices(min(longitude for longitude, latitude in polygon),
+                                          min(latitude for longitude, latitude in polygon),
+                                          max(longitude for longitude, latitude in polygon),
+                                          max(latitude for longitude, latitude in polygon))
 
-# load the data from the url and put into a tmp folder, if it's a zip, then unzip to tmp folder
-# Return file path
-def load_and_unzip_from_url(url: str) -> str:
-    import requests
-    import os
+    # returns the stops (in their original order) that are in the given polygon
+    def get_stops_in_polygon(self, polygon: List[Tuple[float, float]]) -> list[StopPlaceRecord]:
+        polygon_key = tuple(polygon)
+        stops_in_polygon = self.stops_in_polygons.get(polygon_key)
 
-    print(f"[[[[[Loading and unzipping from url {url}")
+        if stops_in_polygon is None:
+            stops_in_polygon = [self.stop_places[index] for index in self.get_indices_in_polygon(polygon)]
+            self.stops_in_polygons[polygon_key] = stops_in_polygon
 
-    temp_folder = os.path.join(os.getcwd(), INPUT_FOLDER_NAME)
+        return stops_in_polygon
 
-    # Create a tmp folder to store and unzip the downloaded data
-    os.makedirs(temp_folder, exist_ok=True)
-    print(f"Created {INPUT_FOLDER_NAME} folder (will be removed)")
+    # returns the indices (ascending) of the stops that are in the given polygon
+    def get_indices_in_polygon(self, polygon: List[Tuple[float, float]]) -> list[int]:
+        if len(polygon) == 0:
+            return []
 
-    # Send a GET request to the URL
-    response = requests.get(url, stream=True)
+        min_longitude = min(longitude for longitude, latitude in polygon)
+        max_longitude = max(longitude for longitude, latitude in polygon)
+        min_latitude = min(latitude for longitude, latitude in polygon)
+        max_latitude = max(latitude for longitude, latitude in polygon)
 
-    # Check if the request was successful
-    if response.status_code == 200:
-        # Try to read the header for the "Location"
-        if 'content-disposition' in response.headers:
-            file_name = response.headers['content-disposition'].split("filename=")[1]
-            file_extension = os.path.splitext(file_name)[1]
-        else:
-            raise ValueError("!ERROR! The response header did not contain the 'content-disposition'")
+        candidate_indices = self.get_candidate_indices(min_longitude, min_latitude, max_longitude, max_latitude)
+        self.tested_stops += len(candidate_indices)
 
-        # Write the file to the tmp folder
-        file_path = os.path.join(temp_folder, file_name)
-        with open(file_path, 'wb') as file:
-            # Write the content to the file in chunks
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-        print(f"File downloaded successfully: {file_name}")
+        if self.numpy is None:
+            return [index for index in candidate_indices if
+                    is_point_in_polygon((self.longitudes[index], self.latitudes[index]), polygon)]
 
-        # if file extension is zip, unzip it
-        if file_extension == '.zip':
-            unzip_to_folder(file_path, temp_folder)
-            os.remove(file_path)
-            print(f"Successfully unzipped file to {temp_folder}")
-    else:
-        raise requests.exceptions.HTTPError(f"!ERROR! Failed to download file HTTP-Code: {response.status_code}")
-    print("]]]]]")
+        numpy = self.numpy
+        candidate_indices = numpy.array(candidate_indices, dtype=numpy.intp)
+        x = self.longitudes[candidate_indices]
+        y = self.latitudes[candidate_indices]
 
-    return temp_folder
+        # only the stops within the bounding box can be in the polygon
+        in_bounding_box = (x >= min_longitude) & (x <= max_longitude) & (y >= min_latitude) & (y <= max_latitude)
+        candidate_indices = candidate_indices[in_bounding_box]
+        x = x[in_bounding_box]
+        y = y[in_bounding_box]
 
+        # the same ray casting as in is_point_in_polygon, but for all candidates at once (edge by edge)
+        inside = numpy.zeros(len(candidate_indices), dtype=bool)
+        n = len(polygon)
 
-# upload a given file to the given ftp
-def upload_to_ftp(file_path: str, ftp: dict[str, str]):
-    from ftplib import FTP_TLS
-    import paramiko
+        p1x, p1y = polygon[0]
+        for i in range(n + 1):
+            p2x, p2y = polygon[i % n]
 
-    remote_path = ftp['path'] + os.path.basename(file_path)
+            # a horizontal edge is never crossed
+            if p1y != p2y:
+                crosses = (y > min(p1y, p2y)) & (y <= max(p1y, p2y)) & (x <= max(p1x, p2x))
 
-    if ftp['protocol'].lower() == 'ftps':
-        # FTPS upload
-        try:
-            ftps = FTP_TLS()
-            ftps.connect(ftp['url'], int(ftp['port']))
-            ftps.login(user=ftp['user'], passwd=ftp['password'])
-            ftps.prot_p()  # Set the data connection to be secure
+                if p1x != p2x:
+                    xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+                    crosses &= x <= xinters
 
-            with open(file_path, 'rb') as file:
-                ftps.storbinary(f'STOR {remote_path}', file)
-                print(f"Uploaded '{file_path}' to '{remote_path}' via FTPS.")
+                inside ^= crosses  # Toggle the inside status
+            p1x, p1y = p2x, p2y
 
-            ftps.quit()
-        except Exception as e:
-            print(f"FTPS upload error: {e}")
+        return candidate_indices[inside].tolist()
 
-    elif ftp['protocol'].lower() == 'sftp':
-        # SFTP upload
-        try:
-            transport = paramiko.Transport((ftp['url'], int(ftp['port'])))
-            transport.connect(username=ftp['user'], password=ftp['password'])
 
-            sftp = paramiko.SFTPClient.from_transport(transport)
+######### NeTEx-handling functions #############
+def convert_from_netex(offers: list[str], netex_file_path: Union[str, list[str]], context: ConversionContext,
+                       netex_parser: str = "stream", workers: int = 1, netex_member: Optional[str] = None,
+                       netex_data: Optional[NetexData] = None, netex_cache_folder: Optional[str] = None,
+                       fragment_cache_folder: Optional[str] = None):
+    print("Loading from NeTEx")  # Log loading message
+
+    run_metrics = context.metrics
 
-            if sftp is not None:
-                sftp.put(file_path, remote_path)  # Upload the file
-                print(f"Uploaded '{file_path}' to '{ftp['path']}' via SFTP.")
-                sftp.close()  # Close the SFTP client
+    # Read the records of the NeTEx file (or of the XML in the ZIP), unless they were read while downloading. Several
+    # NeTEx files are read in parallel and converted as one, thus all ids are unique across them
+    if netex_data is None:
+        with run_metrics.stage("parse"):
+            if isinstance(netex_file_path, str):
+                netex_data = read_netex_file(netex_file_path, netex_parser, netex_member, netex_cache_folder)
             else:
-                raise ConnectionError("!ERROR! Failed to create SFTP client.")
+                netex_data = read_netex_files(netex_file_path, netex_parser, netex_member, workers, run_metrics,
+                                              netex_cache_folder)
+    elif netex_cache_folder is not None and isinstance(netex_file_path, str):
+        # the records read while downloading are kept for the next conversions of the file
+        netex_cache = NetexCache(netex_cache_folder)
+        netex_cache.store(netex_cache.get_key(netex_file_path, netex_member), netex_data)
 
-            transport.close()
-        except Exception as e:
-            print(f"SFTP upload error: {e}")
+    print("  # Creating ECKDATEN")  # Log creation message
+    with run_metrics.stage("eckdaten"):
+        create_eckdaten(netex_data, context)
 
-    else:
-        print("Unsupported protocol. Please use 'ftps' or 'sftp'.")
+    print("  # Creating BITFELD")  # Log creation message
+    with run_metrics.stage("bitfeld"):
+        bitfields = create_and_return_bitfields(netex_data, context)  # Create bitfields
 
+    # Index the records by the references they are joined with
+    with run_metrics.stage("index"):
+        netex_index = index_netex(netex_data)
 
-# takes an int or str and prefixes its absolute value with "0" until length is reached
-def prefix_with_zeros(value_to_prefix: Union[int, str], length: int) -> str:
-    # Ensure value_to_prefix is positive and convert to string
-    if type(value_to_prefix) is int:
-        value_to_prefix = abs(value_to_prefix)
+    run_metrics.count("stop_places", len(netex_data.stop_places))
+    run_metrics.count("bitfields", len(bitfields))
 
-    value_length = len(str(value_to_prefix))
-    value_to_prefix_str = str(value_to_prefix)
+    # The FlexibleLines to convert, which contain the name and booking info
+    flexible_lines = []
 
-    # Prefix with zeros until the desired length is reached
-    while value_length < length:
-        value_to_prefix_str = "0" + value_to_prefix_str
-        value_length += 1
+    for flexible_line in netex_data.flexible_lines:
+        if len(offers) == 0 or (flexible_line.name in offers):
+            flexible_lines.append(flexible_line)
+        else:
+            print(f"Not loading: {flexible_line.name}")
 
-    return value_to_prefix_str  # Return the zero-padded string
+    run_metrics.count("flexible_lines", len(flexible_lines))
 
+    with run_metrics.stage("flexible_lines"):
+        if fragment_cache_folder is not None:
+            convert_flexible_lines_incrementally(flexible_lines, netex_data, netex_index, bitfields, context, workers,
+                                                 fragment_cache_folder)
+        elif workers > 1:
+            convert_flexible_lines_in_parallel(flexible_lines, netex_data, netex_index, bitfields, context, workers)
+        else:
+            # The coordinates of all (regular) StopPlaces, to find the stops in the regions
+            stop_geometry = StopGeometry(netex_data.stop_places)
+
+            for flexible_line in flexible_lines:
+                convert_flexible_line(flexible_line, netex_index, stop_geometry, bitfields, context)
 
-# converts an integer string to its hex representation
-def binary_to_hex(binary: str) -> str:
-    # Convert binary to integer - add the prefixing 11 as per requirements for HRDF
-    integer_value = int("11" + binary, 2)
+    # write the FPLAN of all flexible lines in a single pass
+    with run_metrics.stage("fplan"):
+        context.fplan_table.write_to(context.hrdf_writer)
 
-    # Convert integer to hexadecimal string, removing the '0x' prefix
-    hex_value = hex(integer_value)[2:]  # Get hex representation without '0x'
 
-    # Convert to uppercase
-    hex_value = hex_value.upper()
+# convert the given flexible line, i.e., write its BETRIEB, INFOTEXT, BAHNHOF, REGION, BFKOORD, BHFART and FPLAN entries.
+# This loop aims at finding unique triples of FlexibleLine + ServiceJourneyPattern + AvailabilityCondition
+def convert_flexible_line(flexible_line: FlexibleLineRecord, netex_index: NetexIndex, stop_geometry: StopGeometry,
+                          bitfields: dict[str, Bitfield], context: ConversionContext):
+    hrdf_writer = context.hrdf_writer
+    run_metrics = context.metrics
+    started = time.perf_counter()
 
-    # Convert integer to hex string and return it
-    return hex_value
+    flexible_line_id = flexible_line.id  # Get the ID of the flexible line
+    flexible_line_name = flexible_line.name  # Get the name
 
+    print(f"--- Loading flexible line: {flexible_line_name}")  # Log loading message
+    flexible_line_operator_betrieb_id = extract_betrieb_for_flexible_line_operator(
+        context, flexible_line, netex_index.operators_by_id)
 
-# checks if point-tuple is in polygon (list of tuples)
-def is_point_in_polygon(point: Tuple[float, float], polygon: List[Tuple[float, float]]) -> bool:
-    x, y = point
-    n = len(polygon)
-    inside = False
+    # the booking arrangements (CURRENTLY!) contain the attribut values
+    # -> FIXME: after changes to netex-odv. Then BookingArr. are "real" infotext and attributs are in "Notes"!
+    # ATTRIBUT - attributes for the given flexible line, these are aligned with the official "hints"
+    booking_arrangements = flexible_line.booking_arrangements
 
-    p1x, p1y = polygon[0]
-    for i in range(n + 1):
-        p2x, p2y = polygon[i % n]
-        xinters = 0.0
-        if y > min(p1y, p2y):
-            if y <= max(p1y, p2y):
-                if x <= max(p1x, p2x):
-                    if p1y != p2y:
-                        xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                    if p1x == p2x or x <= xinters:
-                        inside = not inside  # Toggle the inside status
-        p1x, p1y = p2x, p2y
+    attribute_codes = extract_attribute_codes(booking_arrangements, context)
 
-    return inside  # Return whether the point is inside the polygon
+    # INFOTEXT - infotexts for the given flexible line
+    print("  # Creating INFOTEXT")  # Log creation message
+    infotext_ids = create_and_return_infotexts(booking_arrangements, flexible_line_name, context)
 
+    # the trips are added to the FPLAN table of the context, which is written once all flexible lines are converted
+    fplan_table = context.fplan_table
+    fplan_line = fplan_table.add_flexible_line(flexible_line_operator_betrieb_id, attribute_codes, infotext_ids)
 
-######### HRDF-handling functions #############
-# initialize all HRDF files to the given folder
-def init_hrdf(to_folder: str):
-    # Create a mapping dictionary for HRDF file headers
-    hrdf_files_headers = {
-        "attribut": "*F 09 1",
-        "bahnhof": "*F 01 1",
-        "betrieb": "*F 28 1",
-        "bfkoord": "*F 02 1",
-        "bhfart": "*F 30 1",
-        "bitfeld": "*F 05 1",
-        "eckdaten": "*F 04 1",
-        "fplan": "*F 03 1",
-        "infotext": "*F 11 1",
-        "region": "*F 45 1",
-        "zugart": "*F 06 1"
-    }
+    # To store the triples and tuples
+    fplan_triples = set()
+    fplan_tuples = set()
 
-    # Create HRDF files and write headers
-    for hrdf_file in hrdf_files:
-        write_to_hrdf(to_folder, hrdf_file, hrdf_files_headers[hrdf_file], False)
+    # to store the pseudo stops
+    pseudo_stops = {}
 
-    print("zugart hardcoded")
-    init_zugart(to_folder)  # Initialize zugart HRDF
+    # FPLAN processing, only the service journeys of the flexible line
+    for service_journey in netex_index.service_journeys_by_flexible_line_ref.get(flexible_line_id, []):
+        service_flexible_line_ref = service_journey.flexible_line_ref
+        service_availability_condition_ref = service_journey.availability_condition_ref
+        service_journey_pattern_ref = service_journey.service_journey_pattern_ref
+        run_metrics.count("service_journeys")
 
-    print("attribut recycled (originally from hrdf export 23.05.2025)")
-    init_attribut(to_folder)  # Initialize attribut HRDF
+        # Check if the fplan triple is new, skip to the next iteration if it's not new
+        fplan_triple = (service_flexible_line_ref, service_availability_condition_ref,
+                        service_journey_pattern_ref)
 
-    print("betrieb (originally from hrdf export 17.06.2025)")
-    init_betrieb()  # Initialize betrieb HRDF
+        if fplan_triple in fplan_triples:
+            continue
 
-    print("HRDF files initiated")  # Log completion message
+        print(f"  # Creating FPLAN for {' '.join(fplan_triple)}")
+        fplan_triples.add(fplan_triple)  # Add the new triple
+        run_metrics.count("fplan_triples")
 
+        # Check if the fplan tuple is new
+        fplan_tuple = (service_flexible_line_ref, service_journey_pattern_ref)
 
-# init the hard-coded zugart file
-def init_zugart(to_folder: str):
-    # FIXME: This is currently hard coded
-    write_to_hrdf(to_folder, "zugart", "TEL 10   1  DRT      0 T     #104", True)
-    write_to_hrdf(to_folder, "zugart", "<text>", True)
-    write_to_hrdf(to_folder, "zugart", "<Deutsch>", True)
-    write_to_hrdf(to_folder, "zugart", "class6 Bus", True)
-    write_to_hrdf(to_folder, "zugart", "category104 DRT", True)
-    write_to_hrdf(to_folder, "zugart", "<Englisch>", True)
-    write_to_hrdf(to_folder, "zugart", "class6 Bus", True)
-    write_to_hrdf(to_folder, "zugart", "category104 DRT", True)
-    write_to_hrdf(to_folder, "zugart", "<Franzoesisch>", True)
-    write_to_hrdf(to_folder, "zugart", "class6 Bus", True)
-    write_to_hrdf(to_folder, "zugart", "category104 DRT", True)
-    write_to_hrdf(to_folder, "zugart", "<Italienisch>", True)
-    write_to_hrdf(to_folder, "zugart", "class6 Bus", True)
-    write_to_hrdf(to_folder, "zugart", "category104 DRT", True)
-
-
-# init the attribut by copying it to the to_folder from the resources.
-# we use the pre-loaded attribut file in the resources folder, which originates from the HRDF-export (23.05.2025)
-def init_attribut(to_folder: str):
-    import sys
-    from typing import Optional
+        if fplan_tuple not in fplan_tuples:
+            fplan_tuples.add(fplan_tuple)  # Add new tuple
 
-    # handling for the case that the code was written to an exe using pyinstaller
-    # Check if the source file exists before copying
-    destination_file = os.path.join(to_folder, "attribut")
+            print(f"    ## Creating BAHNHOF for {service_journey_pattern_ref}")  # Log creation message
+            pseudo_stops = create_and_return_bahnhof(flexible_line_name + " " +
+                                                     service_journey_pattern_ref.rsplit(':', 1)[-1],
+                                                     context)
+            print("    ## Creating REGION")  # Log creation message
+            with run_metrics.stage("region_bfkoord"):
+                create_region_and_bfkoord(service_journey_pattern_ref, pseudo_stops, stop_geometry, netex_index,
+                                          context)
 
-    if getattr(sys, 'frozen', False):
-        # If the application is frozen (running as an executable)
-        base_path: Optional[str] = getattr(sys, '_MEIPASS', None)  # Type hint to suppress warning
+        # only the availability conditions referenced by the service journey
+        for availability_condition in netex_index.availability_conditions_by_id.get(
+                service_availability_condition_ref, []):
+            availability_condition_from = availability_condition.start_time
+            availability_condition_to = availability_condition.end_time
+            availability_condition_bits = availability_condition.valid_day_bits
 
-        source_file = os.path.join(base_path, "resources", "attribut")
+            run_metrics.count("fplan_trips", 3)
 
-        if not os.path.exists(source_file):
-            # if the resources were not within the exe, we try the relative path
-            source_file = "resources/attribut"
+            # the period, duration, bitfield and time are the same for the three trips of the availability condition
+            fplan_condition = fplan_table.add_condition(
+                fplan_line, flexible_line_name + " " + service_journey_pattern_ref.rsplit(':', 1)[-1],
+                availability_condition_from[:-3] + "-" + availability_condition_to[:-3],
+                time_difference_in_minutes(availability_condition_from, availability_condition_to),
+                bitfields[availability_condition_bits].id, time_to_compact_time(availability_condition_from))
 
-            if not os.path.exists(source_file):
-                raise FileNotFoundError(f"!ERROR! ATTRIBUT file does not exist: {source_file}")
-    else:
-        # If the application is running in a normal Python environment
-        base_path = os.path.dirname(__file__)
+            for i in [0, 2, 4]:
+                context.fplan_trip_iterator = (context.fplan_trip_iterator + 1)
 
-        source_file = os.path.join(base_path, "resources", "attribut")
+                # FPLAN - start/stop pseudo stop: only react to the starts and add also ends
+                fplan_table.add_trip(context.fplan_trip_iterator, fplan_condition, i,
+                                     pseudo_stops[hrdf_stop_types[i]].id, pseudo_stops[hrdf_stop_types[i + 1]].id)
 
-        if not os.path.exists(source_file):
-            # if the resources were not where we expected, we try the relative path
-            source_file = "resources/attribut"
+    run_metrics.flexible_line_seconds[flexible_line_id] = time.perf_counter() - started
 
-            if not os.path.exists(source_file):
-                raise FileNotFoundError(f"!ERROR! ATTRIBUT file does not exist: {source_file}")
 
-    copy_file(source_file, destination_file)
+# count the ids the given flexible line takes from each id iterator when converted, following the same loop as
+# convert_flexible_line without writing anything
+def count_flexible_line_ids(flexible_line: FlexibleLineRecord, netex_index: NetexIndex,
+                            context: ConversionContext) -> IdBlock:
+    id_counts = IdBlock(0, 1, 0, 0)  # the flexible line name is always the first infotext
 
-    global attribut_content  # Declare the variable as global
+    for booking_arrangement in flexible_line.booking_arrangements:
+        code = extract_attribute_code_from_id(booking_arrangement.id)
 
-    # load the content into variable
-    with open(destination_file, 'r', encoding=output_format) as file:
-        attribut_content = file.readlines()  # Read all lines into a list
+        if not is_nan_or_empty(code) and not is_known_attribute_code(code, context):
+            id_counts.infotext_id += 1
 
+    fplan_triples = set()
+    fplan_tuples = set()
 
-# get the betrieb_de file which we need to look up the transport operator data to include in the later betrieb export.
-# store the content into the global variable
-def init_betrieb():
-    import sys
-    from typing import Optional
+    for service_journey in netex_index.service_journeys_by_flexible_line_ref.get(flexible_line.id, []):
+        fplan_triple = (service_journey.flexible_line_ref, service_journey.availability_condition_ref,
+                        service_journey.service_journey_pattern_ref)
 
-    # handling for the case that the code was written to an exe using pyinstaller
-    source_file = ""
+        if fplan_triple in fplan_triples:
+            continue
 
-    if getattr(sys, 'frozen', False):
-        # If the application is frozen (running as an executable)
-        base_path: Optional[str] = getattr(sys, '_MEIPASS', None)  # Type hint to suppress warning
+        fplan_triples.add(fplan_triple)
 
-        source_file = os.path.join(base_path, "resources", "betrieb_de")
+        fplan_tuple = (service_journey.flexible_line_ref, service_journey.service_journey_pattern_ref)
 
-        if not os.path.exists(source_file):
-            # if the resources were not within the exe, we try the relative path
-            source_file = "resources/betrieb_de"
+        if fplan_tuple not in fplan_tuples:
+            fplan_tuples.add(fplan_tuple)
 
-            if not os.path.exists(source_file):
-                raise FileNotFoundError(f"!ERROR! BETRIEB_DE file does not exist: {source_file}")
-    else:
-        # If the application is running in a normal Python environment
-        base_path = os.path.dirname(__file__)
+            id_counts.pseudo_stop_id += len(hrdf_stop_types)
 
-        source_file = os.path.join(base_path, "resources", "betrieb_de")
+            # a region for each flexible area (with coordinates) of the service journey pattern
+            for service_journey_pattern in netex_index.service_journey_patterns_by_id.get(
+                    service_journey.service_journey_pattern_ref, []):
+                for flexible_stop_assignment in netex_index.flexible_stop_assignments_by_scheduled_stop_point_ref.get(
+                        service_journey_pattern.scheduled_stop_point_ref, []):
+                    for flexible_area in netex_index.flexible_areas_by_id.get(
+                            flexible_stop_assignment.flexible_area_ref, []):
+                        if flexible_area.coordinates is not None:
+                            id_counts.region_id += 1
 
-        if not os.path.exists(source_file):
-            # if the resources were not where we expected, we try the relative path
-            source_file = "resources/betrieb_de"
+        # three trips per availability condition
+        id_counts.fplan_trip_iterator += 3 * len(netex_index.availability_conditions_by_id.get(
+            service_journey.availability_condition_ref, []))
 
-            if not os.path.exists(source_file):
-                raise FileNotFoundError(f"!ERROR! BETRIEB_DE file does not exist: {source_file}")
+    return id_counts
 
-    global betrieb_content  # Declare the variable as global
 
-    # load the content into variable
-    with open(source_file, 'r', encoding=output_format) as file:
-        betrieb_content = file.readlines()  # Read all lines into a list
+# returns the ids each of the given flexible lines starts with when converted in the given order (see
+# count_flexible_line_ids), the id iterators of the context are advanced past all of them
+def get_id_blocks(flexible_lines: list[FlexibleLineRecord], netex_index: NetexIndex,
+                  context: ConversionContext) -> list[IdBlock]:
+    id_blocks = []
 
+    for flexible_line in flexible_lines:
+        id_blocks.append(IdBlock(context.fplan_trip_iterator, context.infotext_id, context.region_id,
+                                 context.pseudo_stop_id))
 
-######### NeTEx-handling functions #############
-def convert_from_netex(offers: list[str], netex_file_path: str, to_folder: str):
-    global fplan_trip_iterator  # Make the trip iterator accessible globally
+        id_counts = count_flexible_line_ids(flexible_line, netex_index, context)
+        context.fplan_trip_iterator += id_counts.fplan_trip_iterator
+        context.infotext_id += id_counts.infotext_id
+        context.region_id += id_counts.region_id
+        context.pseudo_stop_id += id_counts.pseudo_stop_id
 
-    print("Loading from NeTEx")  # Log loading message
+    return id_blocks
 
-    tree = xml_etree.parse(netex_file_path)  # Parse the XML file
 
-    root = tree.getroot()  # Get the root element of the parsed XML
+# convert the flexible lines with a pool of worker processes. Each flexible line gets the block of ids it would get in
+# the serial conversion, and the parts written by the workers are merged in the order of the flexible lines, so that
+# the output is the same as with a single process
+def convert_flexible_lines_in_parallel(flexible_lines: list[FlexibleLineRecord], netex_data: NetexData,
+                                       netex_index: NetexIndex, bitfields: dict[str, Bitfield],
+                                       context: ConversionContext, workers: int):
+    # the ids each flexible line starts with
+    id_blocks = get_id_blocks(flexible_lines, netex_index, context)
 
-    print("  # Creating ECKDATEN")  # Log creation message
-    create_eckdaten(root, to_folder)
+    print(f"  # Converting {len(flexible_lines)} flexible lines with {workers} workers")
 
-    print("  # Creating BITFELD")  # Log creation message
-    bitfields = create_and_return_bitfields(root, to_folder)  # Create bitfields
+    # the operators and stops that occur in several flexible lines are only written once, in the order of the lines
+    for hrdf_fragment, fplan_table, run_metrics in convert_flexible_lines_in_workers(
+            flexible_lines, id_blocks, netex_data.stop_places, netex_index, bitfields, context.resources, workers):
+        hrdf_fragment.write_to(context.hrdf_writer)
+        context.fplan_table.extend(fplan_table)
+        context.metrics.merge(run_metrics)
 
-    # Find all FlexibleLine elements, which contain the name and booking info
-    flexible_lines = root.findall('.//FlexibleLine', namespaces=namespace)
 
-    # Find all AvailabilityCondition elements, containing time and date validity of a line/service
-    availability_conditions = root.findall('.//AvailabilityCondition', namespaces=namespace)
+# yields the fragment, the trips of the FPLAN and the metrics of each of the given flexible lines (in their order),
+# converted by a pool of worker processes starting with the ids of the given blocks
+def convert_flexible_lines_in_workers(flexible_lines: list[FlexibleLineRecord], id_blocks: list[IdBlock],
+                                      stop_places: list[StopPlaceRecord], netex_index: NetexIndex,
+                                      bitfields: dict[str, Bitfield], resources: ConversionResources, workers: int):
+    from concurrent.futures import ProcessPoolExecutor
 
-    # Find all ServiceJourney elements, which serve as join elements between different information
-    service_journeys = root.findall('.//ServiceJourney', namespaces=namespace)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_conversion_worker,
+                             initargs=(netex_index, stop_places, bitfields, resources)) as executor:
+        yield from executor.map(convert_flexible_line_in_worker, flexible_lines, id_blocks)
 
-    # Find all StopPlaces
-    stop_places = root.findall('.//StopPlace', namespaces=namespace)
 
-    # Find all operators
-    operators = root.findall('.//Operator', namespaces=namespace)
+# sets up the data shared by the flexible lines converted in a worker process
+def init_conversion_worker(netex_index: NetexIndex, stop_places: list[StopPlaceRecord], bitfields: dict[str, Bitfield],
+                           resources: ConversionResources):
+    global worker_netex_index, worker_stop_geometry, worker_bitfields, worker_resources
 
-    # This loop aims at finding unique triples of FlexibleLine + ServiceJourneyPattern + AvailabilityCondition
-    for flexible_line in flexible_lines:
-        flexible_line_id = flexible_line.attrib.get('id')  # Get the ID of the flexible line
-        flexible_line_name = flexible_line.find('.//Name', namespaces=namespace).text  # Get the name
-
-        if len(offers) == 0 or (flexible_line_name in offers):
-            print(f"--- Loading flexible line: {flexible_line_name}")  # Log loading message
-            flexible_line_operator_betrieb_id = extract_betrieb_for_flexible_line_operator(to_folder, flexible_line,
-                                                                                           operators)
-
-            # the booking arrangements (CURRENTLY!) contain the attribut values
-            # -> FIXME: after changes to netex-odv. Then BookingArr. are "real" infotext and attributs are in "Notes"!
-            # ATTRIBUT - attributes for the given flexible line, these are aligned with the official "hints"
-            booking_arrangements = flexible_line.findall('.//BookingArrangement', namespaces=namespace)
-
-            attribute_codes = extract_attribute_codes(booking_arrangements)
-
-            # INFOTEXT - infotexts for the given flexible line
-            print("  # Creating INFOTEXT")  # Log creation message
-            infotext_ids = create_and_return_infotexts(booking_arrangements, flexible_line_name, to_folder)
-
-            # To store the triples and tuples
-            fplan_triples = []
-            fplan_tuples = []
-
-            # to store the pseudo stops
-            pseudo_stops = pd.DataFrame()
-
-            # FPLAN processing
-            for service_journey in service_journeys:
-                service_flexible_line_ref = (service_journey.find('.//FlexibleLineRef', namespaces=namespace)
-                                             .attrib.get('ref'))
-                service_availability_condition_ref = service_journey.find('.//AvailabilityConditionRef',
-                                                                          namespaces=namespace).attrib.get('ref')
-                service_journey_pattern_ref = (service_journey.find('.//ServiceJourneyPatternRef', namespaces=namespace)
-                                               .attrib.get('ref'))
-
-                if service_flexible_line_ref == flexible_line_id:
-                    # Check if the fplan triple is new
-                    is_new_triple = True
-
-                    for fplan_triple in fplan_triples:
-                        if (fplan_triple[0] == service_flexible_line_ref and fplan_triple[1] ==
-                                service_availability_condition_ref and fplan_triple[2] ==
-                                service_journey_pattern_ref):
-                            is_new_triple = False  # Mark as not new if already exists
-                            break
-
-                    if not is_new_triple:
-                        continue  # Skip to the next iteration if it's not new
-                    else:
-                        print(
-                            f"  # Creating FPLAN for {service_flexible_line_ref + ' ' + service_availability_condition_ref + ' ' + service_journey_pattern_ref}")
-                        fplan_triples.append([service_flexible_line_ref, service_availability_condition_ref,
-                                              service_journey_pattern_ref])  # Append the new triple
-
-                    # Check if the fplan tuple is new
-                    is_new_tuple = True
-                    if len(fplan_tuples) == 0:
-                        fplan_tuples.append([service_flexible_line_ref, service_journey_pattern_ref])
-                    else:
-                        for fplan_tuple in fplan_tuples:
-                            if (fplan_tuple[0] == service_flexible_line_ref and fplan_tuple[1] ==
-                                    service_journey_pattern_ref):
-                                is_new_tuple = False  # Mark as not new if already exists
-                                break
-
-                    if is_new_tuple:
-                        fplan_tuples.append(
-                            [service_flexible_line_ref, service_journey_pattern_ref])  # Append new tuple
-
-                        print(f"    ## Creating BAHNHOF for {service_journey_pattern_ref}")  # Log creation message
-                        pseudo_stops = create_and_return_bahnhof(flexible_line_name +
-                                                                 " " + service_journey_pattern_ref.rsplit(':', 1)[
-                                                                     -1],
-                                                                 to_folder)
-                        print("    ## Creating REGION")  # Log creation message
-                        create_region_and_bfkoord(service_journey_pattern_ref, pseudo_stops, stop_places, root,
-                                                  to_folder)
-
-                    for availability_condition in availability_conditions:
-                        availability_condition_id = availability_condition.attrib.get('id')
-                        availability_condition_from = availability_condition.find('.//StartTime',
-                                                                                  namespaces=namespace).text
-                        availability_condition_to = availability_condition.find('.//EndTime',
-                                                                                namespaces=namespace).text
-                        availability_condition_bits = availability_condition.find('.//ValidDayBits',
-                                                                                  namespaces=namespace).text
-
-                        if service_availability_condition_ref == availability_condition_id:
-                            for i in [0, 2, 4]:
-                                fplan_trip_iterator = (fplan_trip_iterator + 1)
-
-                                ## FPLAN - comment
-                                write_to_hrdf(to_folder, "fplan", close_fplan_line(
-                                    "% " + flexible_line_name + " " + service_journey_pattern_ref.rsplit(':', 1)[
-                                        -1] + " " + hrdf_stop_types[i]), True)
-                                write_to_hrdf(to_folder, "fplan", close_fplan_line(
-                                    "% " + availability_condition_from[:-3] + "-" + availability_condition_to[
-                                                                                    :-3] + " Uhr"), True)
-
-                                ## FPLAN - journey
-                                prefixed_iterator = prefix_with_zeros(fplan_trip_iterator, 6)
-                                time_difference = prefix_with_zeros(
-                                    time_difference_in_minutes(availability_condition_from, availability_condition_to),
-                                    4)
-                                write_to_hrdf(to_folder, "fplan", close_fplan_line(
-                                    "*T " + prefixed_iterator + " " + flexible_line_operator_betrieb_id + " " + str(
-                                        time_difference) + " " + "0060"), True)
-
-                                ## FPLAN - bitfield/cal
-                                bitfeld_reference = \
-                                    bitfields["bitfield_id"][bitfields["bitfield_bit"] ==
-                                                             availability_condition_bits].iloc[0]
-
-                                write_to_hrdf(to_folder, "fplan",
-                                              close_fplan_line("*A VE                 " + str(bitfeld_reference)), True)
-                                write_to_hrdf(to_folder, "fplan", close_fplan_line("*G TEL"), True)
-
-                                # FPLAN/ATTRIBUT - attributes
-                                for attribute_code in attribute_codes:
-                                    write_to_hrdf(to_folder, "fplan", close_fplan_line("*A " + attribute_code), True)
-
-                                # FPLAN/INFOTEXT - infotexts
-                                for info_text_id in infotext_ids:
-                                    write_to_hrdf(to_folder, "fplan", close_fplan_line(
-                                        "*I " + info_text_id[0] + "                        " + str(info_text_id[1])),
-                                                  True)
-
-                                # FPLAN - start/stop pseudo stop: only react to the starts and add also ends
-                                write_to_hrdf(to_folder, "fplan", close_fplan_line(
-                                    pseudo_stops["pseudo_stop_id"][pseudo_stops["pseudo_stop_type"] ==
-                                                                   hrdf_stop_types[i]].iloc[0] + " " + hrdf_stop_types[
-                                        i] + "                          " + time_to_compact_time(
-                                        availability_condition_from)), True)
-
-                                write_to_hrdf(to_folder, "fplan", close_fplan_line(pseudo_stops["pseudo_stop_id"][
-                                                                                       pseudo_stops[
-                                                                                           "pseudo_stop_type"] ==
-                                                                                       hrdf_stop_types[i + 1]].iloc[
-                                                                                       0] + " " +
-                                                                                   hrdf_stop_types[
-                                                                                       i + 1] + "                   " +
-                                                                                   time_to_compact_time(
-                                                                                       availability_condition_from)),
-                                              True)
-
-                                write_to_hrdf(to_folder, "fplan", "%", True)  # Newline
-        else:
-            print(f"Not loading: {flexible_line_name}")
+    worker_netex_index = netex_index
+    worker_stop_geometry = StopGeometry(stop_places)
+    worker_bitfields = bitfields
+    worker_resources = resources
+
+
+# converts the given flexible line in a worker process, starting with the ids of the given block. Returns the written
+# fragment, the trips of the FPLAN and the metrics of the flexible line
+def convert_flexible_line_in_worker(flexible_line: FlexibleLineRecord,
+                                    id_block: IdBlock) -> Tuple[HrdfFragmentWriter, FplanTable, RunMetrics]:
+    return convert_flexible_line_to_fragment(flexible_line, id_block, worker_netex_index, worker_stop_geometry,
+                                             worker_bitfields, worker_resources)
+
+
+# converts the given flexible line on its own, starting with the ids of the given block. Returns the written fragment,
+# the trips of the FPLAN and the metrics of the flexible line
+def convert_flexible_line_to_fragment(flexible_line: FlexibleLineRecord, id_block: IdBlock, netex_index: NetexIndex,
+                                      stop_geometry: StopGeometry, bitfields: dict[str, Bitfield],
+                                      resources: ConversionResources) -> Tuple[HrdfFragmentWriter, FplanTable,
+                                                                               RunMetrics]:
+    hrdf_fragment = HrdfFragmentWriter()
+
+    context = ConversionContext(hrdf_fragment, resources)
+    context.fplan_trip_iterator = id_block.fplan_trip_iterator
+    context.infotext_id = id_block.infotext_id
+    context.region_id = id_block.region_id
+    context.pseudo_stop_id = id_block.pseudo_stop_id
+
+    convert_flexible_line(flexible_line, netex_index, stop_geometry, bitfields, context)
+
+    return hrdf_fragment, context.fplan_table, context.metrics
 
 
 # get the flexible line's operator id, then get the private code of the operator then get the betrieb entry for the
 # corresponding operator id, write it to the betrieb file and return the id
-def extract_betrieb_for_flexible_line_operator(to_folder: str, flexible_line: Element, operators: list[Element]) -> str:
-    flexible_line_operator_ref = flexible_line.find('.//OperatorRef', namespaces=namespace).attrib.get('ref')
+def extract_betrieb_for_flexible_line_operator(context: ConversionContext, flexible_line: FlexibleLineRecord,
+                                               operators_by_id: dict[str, OperatorRecord]) -> str:
+    hrdf_writer = context.hrdf_writer
+    flexible_line_operator_ref = flexible_line.operator_ref
 
     # get the correct operator and its id
-    for operator in operators:
-        if flexible_line_operator_ref == operator.attrib.get('id'):
-            operator_id = operator.find('.//PrivateCode', namespaces=namespace).text
-            operator_id = ensure_width(operator_id, 6, "0", False)
-
-            # lookup the id in the betrieb data and extract the three corresponding lines
-            # lines in betrieb ar triples
-            i = 0
-            while i < len(betrieb_content):
-                betrieb_name = betrieb_content[i]
-                betrieb_sboid = betrieb_content[i + 1]
-                betrieb_id_line = betrieb_content[i + 2]
-                betrieb_id = betrieb_id_line.split(":")[1].strip()
-
-                if operator_id == betrieb_id:
-                    # if the operator is not yet in betrieb, write it there.
-                    if not operator_id in operators_added:
-                        write_to_hrdf(to_folder, "betrieb", betrieb_name.rstrip('\n'), True)
-                        write_to_hrdf(to_folder, "betrieb", betrieb_sboid.rstrip('\n'), True)
-                        write_to_hrdf(to_folder, "betrieb", betrieb_id_line.rstrip('\n'), True)
-                        operators_added.append(operator_id)
-
-                    return betrieb_id
-
-                i = (i + 3)
-
-            # if we did not find the operator in the betrieb file, it is not part of PT
-            # in that case we create the entry ourselves
-            # if the operator is not yet in betrieb, write it there.
-            if not operator_id in operators_added:
-                operator_short_name = operator.find('.//ShortName', namespaces=namespace).text
-                operator_long_name = operator.find('.//Name', namespaces=namespace).text
-                operator_description = operator.find('.//Description', namespaces=namespace).text
-                write_to_hrdf(to_folder, "betrieb",
-                              operator_id + " K " + "\"" + operator_short_name + "\"" " L " + "\"" + operator_long_name + "\"" " V " + "\"" + operator_description + "\"",
-                              True)
-                write_to_hrdf(to_folder, "betrieb", operator_id[1:] + " : " + operator_id, True)
-                operators_added.append(operator_id)
-
-            return operator_id
+    operator = operators_by_id.get(flexible_line_operator_ref)
 
-    return ""
+    if operator is None:
+        return ""
+
+    operator_id = operator.private_code
+    operator_id = ensure_width(operator_id, 6, "0", False)
+
+    # lookup the id in the betrieb data and extract the three corresponding lines
+    betrieb_entry = context.resources.betrieb_entries_by_id.get(operator_id)
+
+    if betrieb_entry is not None:
+        betrieb_name, betrieb_sboid, betrieb_id_line = betrieb_entry
+
+        # if the operator is not yet in betrieb, write it there.
+        write_once_to_hrdf(hrdf_writer, "betrieb", operator_id,
+                           [betrieb_name.rstrip('\n'), betrieb_sboid.rstrip('\n'), betrieb_id_line.rstrip('\n')])
+
+        return operator_id
+
+    # if we did not find the operator in the betrieb file, it is not part of PT
+    # in that case we create the entry ourselves
+    # if the operator is not yet in betrieb, write it there.
+    operator_short_name = operator.short_name
+    operator_long_name = operator.name
+    operator_description = operator.description
+    write_once_to_hrdf(hrdf_writer, "betrieb", operator_id,
+                       [operator_id + " K " + "\"" + operator_short_name + "\"" " L " + "\"" + operator_long_name + "\""
+                        " V " + "\"" + operator_description + "\"",
+                        operator_id[1:] + " : " + operator_id])
+
+    return operator_id
 
 
 # creates the eckdaten
-def create_eckdaten(root: ElementTree, to_folder: str):
-    validity_period = root.find('.//CompositeFrame//ValidBetween', namespaces=namespace)
+def create_eckdaten(netex_data: NetexData, context: ConversionContext):
+    hrdf_writer = context.hrdf_writer
 
-    from_date_netex = validity_period.find('.//FromDate', namespaces=namespace).text
+    from_date_netex = netex_data.from_date
     from_date = netex_date_to_hrdf_date(from_date_netex)
 
-    to_date_netex = validity_period.find('.//ToDate', namespaces=namespace).text
+    to_date_netex = netex_data.to_date
     to_date = netex_date_to_hrdf_date(to_date_netex)
 
     year = to_date[to_date.rfind(".") + 1:]
 
-    write_to_hrdf(to_folder, "eckdaten", from_date + " Fahrplanstart", True)
-    write_to_hrdf(to_folder, "eckdaten", to_date + " Fahrplanende", True)
-    write_to_hrdf(to_folder, "eckdaten", "\"Angebotsplan " + year + "\"", True)
+    write_to_hrdf(hrdf_writer, "eckdaten", from_date + " Fahrplanstart", True)
+    write_to_hrdf(hrdf_writer, "eckdaten", to_date + " Fahrplanende", True)
+    write_to_hrdf(hrdf_writer, "eckdaten", "\"Angebotsplan " + year + "\"", True)
 
 
-# creates the bitfield file and returns the dataframe containing it with its id, hex-, and bit-code
-def create_and_return_bitfields(root: ElementTree, to_folder: str) -> pd.DataFrame:
-    global bitfeld_starting_number  # Make the starting number accessible globally
+# creates the bitfield file and returns the bitfields (with their id, hex-, and bit-code) by their bit-code
+def create_and_return_bitfields(netex_data: NetexData, context: ConversionContext) -> dict[str, Bitfield]:
+    hrdf_writer = context.hrdf_writer
 
-    bitfields = pd.DataFrame(columns=["bitfield_id", "bitfield_hex", "bitfield_bit"])  # Initialize DataFrame
+    bitfields = {}  # Initialize the bitfields by bit-code
 
-    valid_day_bits = root.findall('.//ValidDayBits', namespaces=namespace)  # Find valid day bits
+    valid_day_bits = netex_data.valid_day_bits  # All valid day bits
 
     for validDayBit in valid_day_bits:
-        hex_of_bitfield = binary_to_hex(validDayBit.text)  # Convert to hex
+        # If the bitfield did not exist, create a new entry
+        if validDayBit not in bitfields:
+            hex_of_bitfield = binary_to_hex(validDayBit)  # Convert to hex
 
-        if len(bitfields) == 0:
-            # Write the new bitfield if none exist
-            write_to_hrdf(to_folder, "bitfeld", str(bitfeld_starting_number) + " " + hex_of_bitfield, True)
+            # the first bitfield gets the starting number itself
+            if len(bitfields) > 0:
+                context.bitfeld_starting_number += 1  # Increment the starting number
 
-            bitfields.loc[len(bitfields)] = [bitfeld_starting_number, hex_of_bitfield, validDayBit.text]
-        else:
-            # Check all bitfields' hex values
-            existed = False
-
-            for index, row in bitfields.iterrows():
-                if row['bitfield_bit'] == validDayBit.text:
-                    existed = True  # Mark as existing if found
-                    break
-
-            # If the bitfield did not exist, create a new entry
-            if not existed:
-                bitfeld_starting_number += 1  # Increment the starting number
-                bitfields.loc[len(bitfields)] = [bitfeld_starting_number, hex_of_bitfield, validDayBit.text]
-                write_to_hrdf(to_folder, "bitfeld", str(bitfeld_starting_number) + " " + hex_of_bitfield, True)
+            bitfields[validDayBit] = Bitfield(context.bitfeld_starting_number, hex_of_bitfield, validDayBit)
+            write_to_hrdf(hrdf_writer, "bitfeld", str(context.bitfeld_starting_number) + " " + hex_of_bitfield, True)
 
-    return bitfields  # Return the DataFrame of bitfields
+    return bitfields  # Return the bitfields
 
 
 # We extract only the ATTRIBUT code from the id of the booking arrangements
 # (see the FIXME mentioned above, this needs fixing using NeTEx "Notes")
-def extract_attribute_codes(booking_arrangements: list[Element]) -> list[str]:
+def extract_attribute_codes(booking_arrangements: list[BookingArrangementRecord],
+                            context: ConversionContext) -> list[str]:
     codes = []
 
     for booking_arrangement in booking_arrangements:
         # extract the attribut/hint code from the id
-        booking_arrangement_id = booking_arrangement.attrib.get('id')
+        booking_arrangement_id = booking_arrangement.id
 
         code = extract_attribute_code_from_id(booking_arrangement_id)
 
         if not is_nan_or_empty(code):
             # check if the attribute code exists in the known list of attributes.
-            code_exists = False
-
-            for attribut_line in attribut_content:
-                if attribut_line.startswith("*"):
-                    continue
-                elif attribut_line.startswith("#"):
-                    break
-                elif attribut_line.startswith(code):
-                    code_exists = True
-                    break
+            code_exists = is_known_attribute_code(code, context)
 
             # if code is new we add it to the attribut file
             if code_exists:
@@ -845,6 +3451,19 @@ def extract_attribute_codes(booking_arrangements: list[Element]) -> list[str]:
     return codes
 
 
+# checks if the given attribute code exists in the known list of attributes
+def is_known_attribute_code(code: str, context: ConversionContext) -> bool:
+    for attribut_line in context.resources.attribut_content:
+        if attribut_line.startswith("*"):
+            continue
+        elif attribut_line.startswith("#"):
+            break
+        elif attribut_line.startswith(code):
+            return True
+
+    return False
+
+
 # extract the attribute code from a given id string
 def extract_attribute_code_from_id(id: str) -> str:
     if not is_nan_or_empty(id):
@@ -861,302 +3480,1182 @@ def extract_attribute_code_from_id(id: str) -> str:
 
 # create the infotexts from the given booking arrangements and offer (flex_line_name).
 # return a list of tuples of strings, first the infotext type and second the number
-def create_and_return_infotexts(booking_arrangements: list[Element], flexible_line_name: str, to_folder: str) -> list[
-    (str, str)]:
-    global infotext_id  # Make the infotext ID accessible globally
+def create_and_return_infotexts(booking_arrangements: list[BookingArrangementRecord], flexible_line_name: str,
+                                context: ConversionContext) -> list[(str, str)]:
+    hrdf_writer = context.hrdf_writer
     infotext_ids = []  # Initialize list to store infotext IDs
 
-    write_to_hrdf(to_folder, "infotext", "% " + flexible_line_name, True)  # Write header for infotext
+    write_to_hrdf(hrdf_writer, "infotext", "% " + flexible_line_name, True)  # Write header for infotext
 
     # fixme: until further notice we write the flex line name as first infotext
-    write_to_hrdf(to_folder, "infotext", str(infotext_id) + " " + flexible_line_name, True)  # Write header for infotext
-    infotext_ids.append(("ZY", infotext_id))
-    infotext_id += 1  # Increment infotext ID
+    write_to_hrdf(hrdf_writer, "infotext", str(context.infotext_id) + " " + flexible_line_name,
+                  True)  # Write header for infotext
+    infotext_ids.append(("ZY", context.infotext_id))
+    context.infotext_id += 1  # Increment infotext ID
 
     for booking_arrangement in booking_arrangements:
         # fixme: after the attribut codes have been moved this check may no longer be required
         # extract the attribut/hint code from the id
-        booking_arrangement_id = booking_arrangement.attrib.get('id')
+        booking_arrangement_id = booking_arrangement.id
 
         code = extract_attribute_code_from_id(booking_arrangement_id)
 
         if not is_nan_or_empty(code):
             # check if the attribute code exists in the known list of attributes.
-            code_exists = False
-
-            for attribut_line in attribut_content:
-                if attribut_line.startswith("*"):
-                    continue
-                elif attribut_line.startswith("#"):
-                    break
-                elif attribut_line.startswith(code):
-                    code_exists = True
-                    break
+            code_exists = is_known_attribute_code(code, context)
 
             # if code is new we add it to the attribut file
             if not code_exists:
                 # get the booking note, i.e., description
-                booking_note = booking_arrangement.find('.//BookingNote', namespaces=namespace)
+                booking_note = booking_arrangement.booking_note
 
-                write_to_hrdf(to_folder, "infotext", str(infotext_id) + " " + booking_note.text, True)  # Write infotext
-                infotext_ids.append(("ZZ", infotext_id))  # Append ID to the list
-                infotext_id += 1  # Increment infotext ID
+                write_to_hrdf(hrdf_writer, "infotext", str(context.infotext_id) + " " + booking_note,
+                              True)  # Write infotext
+                infotext_ids.append(("ZZ", context.infotext_id))  # Append ID to the list
+                context.infotext_id += 1  # Increment infotext ID
 
-    write_to_hrdf(to_folder, "infotext", "", True)  # Newline
+    write_to_hrdf(hrdf_writer, "infotext", "", True)  # Newline
 
     return infotext_ids  # Return the list of infotext IDs
 
 
-def create_and_return_bahnhof(flexible_line_name, to_folder):
-    global pseudo_stop_id  # Make the pseudo stop ID accessible globally
+# the tag of the lines of the pseudo stops in the HRDF files, they share the ids of the BAHNHOF with the regular stops
+PSEUDO_STOP_TAG = "pseudo_stop"
+
 
-    pseudo_stops = pd.DataFrame(
-        columns=["flexible_line_name", "pseudo_stop_id", "pseudo_stop_type"])  # Initialize DataFrame
+# creates the pseudo stops of the given flexible line (name) and returns them by their type
+def create_and_return_bahnhof(flexible_line_name: str, context: ConversionContext) -> dict[str, PseudoStop]:
+    hrdf_writer = context.hrdf_writer
+
+    pseudo_stops = {}  # Initialize the pseudo stops by type
 
     for hrdf_stop_type in hrdf_stop_types:
         # Write the pseudo stop information to the bahnhof file
-        write_to_hrdf(to_folder, "bahnhof", str(pseudo_stop_id) + "     " + flexible_line_name + " " + hrdf_stop_type,
-                      True)
+        write_lines_to_hrdf(hrdf_writer, "bahnhof",
+                            [BahnhofRecord.render(str(context.pseudo_stop_id),
+                                                  flexible_line_name + " " + hrdf_stop_type)], PSEUDO_STOP_TAG)
 
-        pseudo_stops.loc[len(pseudo_stops)] = [flexible_line_name, str(pseudo_stop_id), hrdf_stop_type]
+        pseudo_stops[hrdf_stop_type] = PseudoStop(flexible_line_name, str(context.pseudo_stop_id), hrdf_stop_type)
 
-        pseudo_stop_id += 1  # Increment the pseudo stop ID
+        context.pseudo_stop_id += 1  # Increment the pseudo stop ID
 
-    return pseudo_stops  # Return the DataFrame of pseudo stops
+    return pseudo_stops  # Return the pseudo stops
 
 
-def create_region_and_bfkoord(service_journey_pattern_ref, pseudo_stops, stop_places, root, to_folder):
-    global region_id  # Make the region ID accessible globally
+def create_region_and_bfkoord(service_journey_pattern_ref, pseudo_stops, stop_geometry, netex_index, context):
+    hrdf_writer = context.hrdf_writer
 
     # Find the ServiceJourneyPattern for the given ref to use for joining with FlexibleStopAssignment
-    service_journey_patterns = root.findall('.//ServiceJourneyPattern', namespaces=namespace)
+    service_journey_patterns = netex_index.service_journey_patterns_by_id.get(service_journey_pattern_ref, [])
 
     for service_journey_pattern in service_journey_patterns:
-        if service_journey_pattern.attrib.get('id') == service_journey_pattern_ref:
-            scheduled_stop_point_ref = service_journey_pattern.find('.//ScheduledStopPointRef',
-                                                                    namespaces=namespace).attrib.get('ref')
-
-            flexible_stop_assignments = root.findall('.//FlexibleStopAssignment', namespaces=namespace)
+        scheduled_stop_point_ref = service_journey_pattern.scheduled_stop_point_ref
+
+        flexible_stop_assignments = (netex_index.flexible_stop_assignments_by_scheduled_stop_point_ref
+                                     .get(scheduled_stop_point_ref, []))
+
+        for flexible_stop_assignment in flexible_stop_assignments:
+            flexible_area_ref = flexible_stop_assignment.flexible_area_ref
+
+            flexible_areas = netex_index.flexible_areas_by_id.get(flexible_area_ref, [])
+
+            for flexible_area in flexible_areas:
+                name = flexible_area.name
+                coordinates = flexible_area.coordinates
+
+                if coordinates is not None:
+                    context.metrics.count("regions")
+                    context.metrics.count("polygon_vertices", len(coordinates))
+
+                    # the coordinate texts are split once and kept as given (the region and the bfkoord fill them up)
+                    coordinate_parts = [coordinate.split(" ") for coordinate in coordinates]
+                    polygon = [(float(longitude), float(latitude)) for longitude, latitude, *_ in coordinate_parts]
+
+                    region_lines = [RegionRecord.render(context.region_id, name), "*C 0", "*P +"]
+                    region_lines.extend(RegionCoordinateRecord.render(longitude, latitude)
+                                        for longitude, latitude, *_ in coordinate_parts)
+                    region_lines.append("")  # Newline
+                    write_lines_to_hrdf(hrdf_writer, "region", region_lines)
+                    context.region_id += 1  # Increment the region ID
+
+                    if coordinate_parts:
+                        longitude, latitude = coordinate_parts[0][0], coordinate_parts[0][1]
+                        pseudo_stop_names = [pseudo_stop.flexible_line_name + " " + pseudo_stop.type
+                                             for pseudo_stop in pseudo_stops.values()]
+
+                        print("    ## Creating BFKOORD")  # Log creation message
+                        bfkoord_lines = render_hrdf_records(
+                            [BfkoordRecord(pseudo_stop.id, longitude, latitude, pseudo_stop_name)
+                             for pseudo_stop, pseudo_stop_name in zip(pseudo_stops.values(), pseudo_stop_names)])
+                        bfkoord_lines.append("")  # Newline
+                        write_lines_to_hrdf(hrdf_writer, "bfkoord", bfkoord_lines, PSEUDO_STOP_TAG)
+
+                        print("    ## Creating BHFART")  # Log creation message
+                        bhfart_records = []
+                        for pseudo_stop, pseudo_stop_name in zip(pseudo_stops.values(), pseudo_stop_names):
+                            bhfart_records.append(BhfartTypeRecord(pseudo_stop.id, pseudo_stop_name))
+                            bhfart_records.append(BhfartPriorityRecord(pseudo_stop.id, pseudo_stop_name))
+                            bhfart_records.append(BhfartExclusionRecord(pseudo_stop.id, pseudo_stop_name))
+                        bhfart_lines = render_hrdf_records(bhfart_records)
+                        bhfart_lines.append("")  # Newline
+                        write_lines_to_hrdf(hrdf_writer, "bhfart", bhfart_lines, PSEUDO_STOP_TAG)
+
+                    for pseudo_stop in pseudo_stops.values():
+                        write_to_hrdf(hrdf_writer, "region", "*" + pseudo_stop.type, True)
+                        write_to_hrdf(hrdf_writer, "region", "*IS", True)
+                        if pseudo_stop.type != "SDS" and pseudo_stop.type != "SSD":
+                            write_to_hrdf(hrdf_writer, "region", "*BAS", True)
+                        write_lines_to_hrdf(hrdf_writer, "region",
+                                            [pseudo_stop.id + " " + "% " + pseudo_stop.flexible_line_name],
+                                            PSEUDO_STOP_TAG)
+
+                    write_to_hrdf(hrdf_writer, "region", "", True)  # Newline
+
+                    # To decide what to write in *AS and *AC, get the stops in the polygon (once for both)
+                    # fixme we write the exact same stops and do not differentiate yet between as, i.e.,
+                    # fixme stops that are regular stops and where the on-demand can hold, and ac, i.e.,
+                    # fixme stops that are intended to work as transfers between regular stops and the on-demand network
+                    tested_stops = stop_geometry.tested_stops
+                    stop_places_in_polygon = stop_geometry.get_stops_in_polygon(polygon)
+                    context.metrics.count("stops_tested", stop_geometry.tested_stops - tested_stops)
+                    context.metrics.count("stops_in_regions", len(stop_places_in_polygon))
+
+                    write_as_ac_stops(stop_places_in_polygon, "*AS", context, True)
+                    write_to_hrdf(hrdf_writer, "region", "", True)  # Newline
+
+                    write_as_ac_stops(stop_places_in_polygon, "*AC", context, False)
+                    write_to_hrdf(hrdf_writer, "region", "", True)  # Newline
+
+                    # BFKOORD and BHFART spacing
+                    write_to_hrdf(hrdf_writer, "bfkoord", "", True)  # Newline
+                    write_to_hrdf(hrdf_writer, "bfkoord", "", True)  # Newline
+
+                    write_to_hrdf(hrdf_writer, "bhfart", "", True)  # Newline
+
+                else:
+                    print(f"## {name} had no polygons")  # Log missing polygons message
 
-            for flexible_stop_assignment in flexible_stop_assignments:
-                scheduled_stop_point_ref_assignment = (
-                    flexible_stop_assignment.find('.//ScheduledStopPointRef', namespaces=namespace).attrib.get('ref'))
-                flexible_area_ref = flexible_stop_assignment.find('.//FlexibleAreaRef',
-                                                                  namespaces=namespace).attrib.get('ref')
 
-                if scheduled_stop_point_ref == scheduled_stop_point_ref_assignment:
-                    flexible_areas = root.findall('.//FlexibleArea', namespaces=namespace)
+# writes the *as or *ac lines depending on the given parameters
+# the given stop places are the (regular) stops in the polygon of the region
+def write_as_ac_stops(stop_places_in_polygon: list[StopPlaceRecord], as_or_ac: str, context: ConversionContext,
+                      amend_others: bool):
+    hrdf_writer = context.hrdf_writer
+    first_stop_place = True  # Flag to check if it's the first stop place
+    for stop_place in stop_places_in_polygon:
+        longitude = stop_place.longitude  # Get longitude
+        latitude = stop_place.latitude  # Get latitude
+        name = stop_place.name  # Get stop name
+        stop_id = stop_place.public_code  # Get stop ID
+
+        if first_stop_place:
+            write_to_hrdf(hrdf_writer, "region", as_or_ac, True)  # Write the header for AS or AC
+            first_stop_place = False  # Mark that the first stop place has been processed
+
+        # Write stop ID and name to the region, bhfart, bfkoord, and bahnhof file
+        write_to_hrdf(hrdf_writer, "region", stop_id, True)
+
+        if amend_others:
+            write_to_hrdf(hrdf_writer, "bhfart", BhfartPriorityRecord.render(stop_id, name), True)
+
+            # To ensure that stops to not occur multiple times in bahnhof and bfkoord
+            write_once_to_hrdf(hrdf_writer, "bahnhof", stop_id, [BahnhofRecord.render(stop_id, name)])
+
+            write_once_to_hrdf(hrdf_writer, "bfkoord", stop_id,
+                               [BfkoordRecord.render(stop_id, longitude, latitude, name)])
+
+
+######### Incremental conversion #############
+# The version of the fragments in the fragment cache, to be increased whenever the conversion of a flexible line changes
+FRAGMENT_CACHE_VERSION = 2
+
+
+# the converted parts of a flexible line: the lines it writes to the HRDF files (except the FPLAN), its trips of the
+# FPLAN, the ids it started with, the valid day bits of its availability conditions (in the order of the table) and its
+# counters
+@dataclass(slots=True)
+class FlexibleLineFragment:
+    flexible_line_id: str
+    id_block: IdBlock
+    hrdf_fragment: HrdfFragmentWriter
+    fplan_table: FplanTable
+    condition_bits: list[str]
+    counters: dict[str, int]
+
+    # move the fragment to the given ids (the fragment takes the given number of each) and bitfields: the numbers of
+    # the trips, the infotexts, the regions and the pseudo stops are shifted, also in the lines of the HRDF files, and
+    # the bitfields of the availability conditions are looked up by their bits. The pseudo stops share the ids of the
+    # BAHNHOF with the regular stops, thus only the lines written as the ones of the pseudo stops are shifted
+    def relocate(self, id_block: IdBlock, id_counts: IdBlock, bitfields: dict[str, Bitfield]):
+        trip_offset = id_block.fplan_trip_iterator - self.id_block.fplan_trip_iterator
+        infotext_offset = id_block.infotext_id - self.id_block.infotext_id
+        region_offset = id_block.region_id - self.id_block.region_id
+        pseudo_stop_offset = id_block.pseudo_stop_id - self.id_block.pseudo_stop_id
+
+        if trip_offset != 0:
+            self.fplan_table.trip_numbers = [trip_number + trip_offset for trip_number in self.fplan_table.trip_numbers]
+
+        if infotext_offset != 0:
+            self.hrdf_fragment.shift_line_ids("infotext", range(self.id_block.infotext_id, self.id_block.infotext_id +
+                                                                id_counts.infotext_id), infotext_offset)
+            self.fplan_table.line_infotext_ids = [[(code, infotext_id + infotext_offset)
+                                                   for code, infotext_id in infotext_ids]
+                                                  for infotext_ids in self.fplan_table.line_infotext_ids]
+
+        if region_offset != 0:
+            self.hrdf_fragment.shift_line_ids("region", range(self.id_block.region_id, self.id_block.region_id +
+                                                              id_counts.region_id), region_offset, "*R ", 8)
+
+        if pseudo_stop_offset != 0:
+            pseudo_stop_ids = range(self.id_block.pseudo_stop_id, self.id_block.pseudo_stop_id +
+                                    id_counts.pseudo_stop_id)
+
+            for hrdf_file in ["bahnhof", "bfkoord", "bhfart", "region"]:
+                self.hrdf_fragment.shift_line_ids(hrdf_file, pseudo_stop_ids, pseudo_stop_offset, tag=PSEUDO_STOP_TAG)
+
+            self.fplan_table.trip_departure_stop_ids = [str(int(stop_id) + pseudo_stop_offset) for stop_id in
+                                                        self.fplan_table.trip_departure_stop_ids]
+            self.fplan_table.trip_arrival_stop_ids = [str(int(stop_id) + pseudo_stop_offset) for stop_id in
+                                                      self.fplan_table.trip_arrival_stop_ids]
+
+        self.fplan_table.condition_bitfield_ids = [bitfields[bits].id for bits in self.condition_bits]
+        self.id_block = id_block
+
+
+# A cache of the converted flexible lines in a folder, by the fingerprint of each flexible line (see get_fingerprint).
+# A flexible line with the same fingerprint as in a previous conversion is taken from there instead of converted. The
+# fragments of the flexible lines of the last conversion are kept (and the ones of flexible lines not converted in it,
+# e.g., of other offers). The entries are pickled, thus the folder must be trusted
+class FragmentCache:
+    def __init__(self, folder: str, resources: ConversionResources):
+        self.path = os.path.join(folder, "flexible_lines.pickle")
+
+        os.makedirs(folder, exist_ok=True)
+
+        # the version and the resources are part of every fingerprint (the resources are read in the output format,
+        # thus the fragments of one output format are not used for another one)
+        sha256 = hashlib.sha256(str(FRAGMENT_CACHE_VERSION).encode('utf-8'))
+        for attribut_line in resources.attribut_content:
+            sha256.update(attribut_line.encode('utf-8'))
+        sha256.update(repr(sorted(resources.betrieb_entries_by_id.items())).encode('utf-8'))
+        self.resources_sha256 = sha256.hexdigest()
+
+        self.stop_keys = None  # the fields of each stop of the stop geometry, in its order (see get_fingerprint)
+
+    # the fingerprint of the given flexible line: the SHA-256 of the records its conversion reads, i.e., the flexible
+    # line, its operator and service journeys, their availability conditions and service journey patterns with the
+    # flexible stop assignments and areas, and the stops that may be in the regions (the ones in the grid cells of the
+    # stop geometry covering the polygons)
+    def get_fingerprint(self, flexible_line: FlexibleLineRecord, netex_index: NetexIndex,
+                        stop_geometry: StopGeometry) -> str:
+        parts = [self.resources_sha256, repr(flexible_line),
+                 repr(netex_index.operators_by_id.get(flexible_line.operator_ref))]
+        availability_condition_refs = {}
+        service_journey_pattern_refs = {}
+
+        for service_journey in netex_index.service_journeys_by_flexible_line_ref.get(flexible_line.id, []):
+            parts.append(repr(service_journey))
+            availability_condition_refs[service_journey.availability_condition_ref] = None
+            service_journey_pattern_refs[service_journey.service_journey_pattern_ref] = None
+
+        for availability_condition_ref in availability_condition_refs:
+            parts.append(repr(netex_index.availability_conditions_by_id.get(availability_condition_ref, [])))
+
+        for service_journey_pattern_ref in service_journey_pattern_refs:
+            service_journey_patterns = netex_index.service_journey_patterns_by_id.get(service_journey_pattern_ref, [])
+            parts.append(repr(service_journey_patterns))
+
+            for service_journey_pattern in service_journey_patterns:
+                flexible_stop_assignments = netex_index.flexible_stop_assignments_by_scheduled_stop_point_ref.get(
+                    service_journey_pattern.scheduled_stop_point_ref, [])
+                parts.append(repr(flexible_stop_assignments))
+
+                for flexible_stop_assignment in flexible_stop_assignments:
+                    flexible_areas = netex_index.flexible_areas_by_id.get(flexible_stop_assignment.flexible_area_ref,
+                                                                          [])
+                    parts.append(repr(flexible_areas))
 
                     for flexible_area in flexible_areas:
-                        if flexible_area.attrib.get('id') == flexible_area_ref:
-                            name = flexible_area.find('.//Name', namespaces=namespace)
-                            polygon_element = flexible_area.find('.//gml:Polygon', namespaces=namespace)
-                            polygon = []  # To store coordinates as a list of coordinate tuples
-
-                            if polygon_element is not None:
-                                coordinates = polygon_element.findall('.//gml:pos', namespaces=namespace)
-
-                                write_to_hrdf(to_folder, "region",
-                                              "*R " + prefix_with_zeros(region_id, 8) + " " + name.text, True)
-                                write_to_hrdf(to_folder, "region", "*C 0", True)
-                                write_to_hrdf(to_folder, "region", "*P +", True)
-                                region_id += 1  # Increment the region ID
-
-                                first_coordinate = True
-
-                                for coordinate in coordinates:
-                                    coordinate_parts = coordinate.text.split(" ")
-                                    polygon.append(
-                                        (float(coordinate_parts[0]), float(coordinate_parts[1])))  # Add to polygon
-
-                                    if first_coordinate:
-                                        print("    ## Creating BFKOORD")  # Log creation message
-
-                                        for index, row in pseudo_stops.iterrows():
-                                            write_to_hrdf(to_folder, "bfkoord", row["pseudo_stop_id"] + " " +
-                                                          ensure_width(coordinate_parts[0], 11, "0", True) + " " +
-                                                          ensure_width(coordinate_parts[1], 11, "0",
-                                                                       True) + "        " +
-                                                          "% " + row["flexible_line_name"] + " " + row[
-                                                              "pseudo_stop_type"],
-                                                          True)
-
-                                        write_to_hrdf(to_folder, "bfkoord", "", True)  # Newline
-
-                                        print("    ## Creating BHFART")  # Log creation message
-                                        for index, row in pseudo_stops.iterrows():
-                                            write_to_hrdf(to_folder, "bhfart", row["pseudo_stop_id"] + " " +
-                                                          "B" + "  " + "7" + "  " + "0" + " " +
-                                                          row["flexible_line_name"] + " " + row["pseudo_stop_type"],
-                                                          True)
-                                            write_to_hrdf(to_folder, "bhfart", row["pseudo_stop_id"] + " " +
-                                                          "P" + " " + "% " + row["flexible_line_name"] + " " +
-                                                          row["pseudo_stop_type"], True)
-                                            write_to_hrdf(to_folder, "bhfart", row["pseudo_stop_id"] + " " +
-                                                          "E" + " " + "T" + " " + "% " + row["flexible_line_name"] + " "
-                                                          + row["pseudo_stop_type"], True)
-                                        write_to_hrdf(to_folder, "bhfart", "", True)  # Newline
-
-                                        first_coordinate = False
-
-                                    write_to_hrdf(to_folder, "region",
-                                                  ensure_width(coordinate_parts[0], 10, "0", True) + " " +
-                                                  ensure_width(coordinate_parts[1], 10, "0", True),
-                                                  True)  # Write coordinate to region file
-
-                                write_to_hrdf(to_folder, "region", "", True)  # Newline
-
-                                for index, row in pseudo_stops.iterrows():
-                                    write_to_hrdf(to_folder, "region", "*" + row["pseudo_stop_type"], True)
-                                    write_to_hrdf(to_folder, "region", "*IS", True)
-                                    if row["pseudo_stop_type"] != "SDS" and row["pseudo_stop_type"] != "SSD":
-                                        write_to_hrdf(to_folder, "region", "*BAS", True)
-                                    write_to_hrdf(to_folder, "region",
-                                                  row["pseudo_stop_id"] + " " + "% " + row["flexible_line_name"], True)
-
-                                write_to_hrdf(to_folder, "region", "", True)  # Newline
-
-                                # To decide what to write in *AS and *AC, iterate the stops and do a point-in-polygon test
-                                # todo this may need improvement, as we call the same method with as and ac
-                                # fixme also we write the exact same stops and do not differentiate yet between as, i.e.,
-                                # fixme stops that are regular stops and where the on-demand can hold, and ac, i.e.,
-                                # fixme stops that are intended to work as transfers between regular stops and the on-demand network
-                                write_as_ac_stops(stop_places, polygon, "*AS", to_folder, True)
-                                write_to_hrdf(to_folder, "region", "", True)  # Newline
-
-                                write_as_ac_stops(stop_places, polygon, "*AC", to_folder, False)
-                                write_to_hrdf(to_folder, "region", "", True)  # Newline
-
-                                # BFKOORD and BHFART spacing
-                                write_to_hrdf(to_folder, "bfkoord", "", True)  # Newline
-                                write_to_hrdf(to_folder, "bfkoord", "", True)  # Newline
-
-                                write_to_hrdf(to_folder, "bhfart", "", True)  # Newline
-
-                            else:
-                                print(f"## {name.text} had no polygons")  # Log missing polygons message
+                        if flexible_area.coordinates is not None:
+                            polygon = [(float(longitude), float(latitude)) for longitude, latitude, *_ in
+                                       (coordinate.split(" ") for coordinate in flexible_area.coordinates)]
+                            parts.extend(self.get_stop_keys(stop_geometry)[index] for index in
+                                         stop_geometry.get_candidate_indices_of_polygon(polygon))
 
+        return hashlib.sha256("\n".join(parts).encode('utf-8')).hexdigest()
 
-# writes the *as or *ac lines depending on the given parameters
-def write_as_ac_stops(stop_places: list[Element], polygon: list[(float, float)], as_or_ac: str, to_folder: str,
-                      amend_others: bool):
-    first_stop_place = True  # Flag to check if it's the first stop place
-    for stop_place in stop_places:
-        # Get the reference type of the stop place
-        type_of_place_ref = stop_place.find('.//TypeOfPlaceRef', namespaces=namespace).attrib.get('ref')
+    # the fields of each stop of the given stop geometry as a single string (the stops of many regions are part of the
+    # fingerprints, a repr of the records would take longer than finding the stops in the polygons)
+    def get_stop_keys(self, stop_geometry: StopGeometry) -> list[str]:
+        if self.stop_keys is None:
+            self.stop_keys = [f"{stop_place.public_code}\t{stop_place.name}\t{stop_place.longitude}\t"
+                              f"{stop_place.latitude}" for stop_place in stop_geometry.stop_places]
 
-        if "regularStop" in type_of_place_ref:  # Check if it's a regular stop
-            longitude = stop_place.find('.//Longitude', namespaces=namespace).text  # Get longitude
-            latitude = stop_place.find('.//Latitude', namespaces=namespace).text  # Get latitude
-            name = stop_place.find('.//Name', namespaces=namespace).text  # Get stop name
-            stop_id = stop_place.find('.//PublicCode', namespaces=namespace).text  # Get stop ID
+        return self.stop_keys
 
-            point = (float(longitude), float(latitude))  # Create a point from coordinates
+    # the fragments of the previous conversion by fingerprint, none if there was none (or the cache is unreadable)
+    def load(self) -> dict[str, FlexibleLineFragment]:
+        import pickle
 
-            is_in_polygon = is_point_in_polygon(point, polygon)  # Check if the point is in the polygon
+        try:
+            with open(self.path, 'rb') as file:
+                fragments = pickle.load(file)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            # e.g., a truncated file, all flexible lines are converted and the cache replaced
+            print(f"WARNING: Could not load the fragment cache {self.path}: {str(e) or type(e).__name__}")
+            return {}
 
-            if is_in_polygon:
-                if first_stop_place:
-                    write_to_hrdf(to_folder, "region", as_or_ac, True)  # Write the header for AS or AC
-                    first_stop_place = False  # Mark that the first stop place has been processed
+        return fragments if isinstance(fragments, dict) else {}
 
-                # Write stop ID and name to the region, bhfart, bfkoord, and bahnhof file
-                write_to_hrdf(to_folder, "region", stop_id, True)
+    # store the given fragments by fingerprint (replacing the cache at once). The conversion does not fail if the cache
+    # cannot be written
+    def store(self, fragments: dict[str, FlexibleLineFragment]):
+        import pickle
+        import threading
 
-                if amend_others:
-                    write_to_hrdf(to_folder, "bhfart", stop_id + " " + "P" + " " + "% " + name, True)
+        temporary_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"  # unique per thread
 
-                    global bahnhof_bfkoord_stop_ids
+        try:
+            with open(temporary_path, 'wb') as file:
+                pickle.dump(fragments, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            print(f"WARNING: Could not store the fragment cache {self.path}: {str(e) or type(e).__name__}")
+
+            if os.path.isfile(temporary_path):
+                os.remove(temporary_path)
+
+
+# convert the flexible lines incrementally: a flexible line with the same fingerprint as in the previous conversion is
+# taken from the fragment cache (see FragmentCache), only the others are converted (with the given number of worker
+# processes). Every flexible line gets the ids it would get in a full conversion and the fragments are written in the
+# order of the flexible lines, thus the output is the same as the one of a full conversion
+def convert_flexible_lines_incrementally(flexible_lines: list[FlexibleLineRecord], netex_data: NetexData,
+                                         netex_index: NetexIndex, bitfields: dict[str, Bitfield],
+                                         context: ConversionContext, workers: int, fragment_cache_folder: str):
+    run_metrics = context.metrics
+    fragment_cache = FragmentCache(fragment_cache_folder, context.resources)
+    cached_fragments = fragment_cache.load()
+
+    # the ids each flexible line starts with, and the number of ids it takes (up to the ids the next one starts with)
+    id_blocks = get_id_blocks(flexible_lines, netex_index, context)
+    id_block_ends = id_blocks[1:] + [IdBlock(context.fplan_trip_iterator, context.infotext_id, context.region_id,
+                                             context.pseudo_stop_id)]
+
+    # The coordinates of all (regular) StopPlaces, to find the stops in the regions
+    stop_geometry = StopGeometry(netex_data.stop_places)
+
+    # the cached fragment of each flexible line, None if the flexible line is converted
+    fingerprints = []
+    fragments = []
+    moved_lines = 0  # the cached fragments with other ids than before
+
+    for flexible_line, id_block, id_block_end in zip(flexible_lines, id_blocks, id_block_ends):
+        fingerprint = fragment_cache.get_fingerprint(flexible_line, netex_index, stop_geometry)
+        fragment = cached_fragments.pop(fingerprint, None)
+
+        if fragment is not None:
+            if fragment.id_block != id_block:
+                moved_lines += 1
+
+            # the same records take the same number of ids
+            id_counts = IdBlock(id_block_end.fplan_trip_iterator - id_block.fplan_trip_iterator,
+                                id_block_end.infotext_id - id_block.infotext_id,
+                                id_block_end.region_id - id_block.region_id,
+                                id_block_end.pseudo_stop_id - id_block.pseudo_stop_id)
+            fragment.relocate(id_block, id_counts, bitfields)
+
+        fingerprints.append(fingerprint)
+        fragments.append(fragment)
+
+    changed_lines = [index for index, fragment in enumerate(fragments) if fragment is None]
+    run_metrics.count("flexible_lines_reused", len(flexible_lines) - len(changed_lines))
+
+    print(f"  # Reusing {len(flexible_lines) - len(changed_lines)} flexible lines, converting {len(changed_lines)}")
+
+    if workers > 1 and len(changed_lines) > 1:
+        converted_lines = convert_flexible_lines_in_workers(
+            [flexible_lines[index] for index in changed_lines], [id_blocks[index] for index in changed_lines],
+            netex_data.stop_places, netex_index, bitfields, context.resources, min(workers, len(changed_lines)))
+    else:
+        converted_lines = (convert_flexible_line_to_fragment(flexible_lines[index], id_blocks[index], netex_index,
+                                                             stop_geometry, bitfields, context.resources)
+                           for index in changed_lines)
+
+    bits_by_bitfield_id = {bitfield.id: bits for bits, bitfield in bitfields.items()}
+
+    # the cached and converted fragments in the order of the flexible lines (the converted ones arrive in that order)
+    for index, flexible_line in enumerate(flexible_lines):
+        fragment = fragments[index]
+
+        if fragment is None:
+            hrdf_fragment, fplan_table, line_metrics = next(converted_lines)
+            fragment = FlexibleLineFragment(flexible_line.id, id_blocks[index], hrdf_fragment, fplan_table,
+                                            [bits_by_bitfield_id[bitfield_id] for bitfield_id in
+                                             fplan_table.condition_bitfield_ids],
+                                            line_metrics.counters)
+            fragments[index] = fragment
+            run_metrics.merge(line_metrics)
+        else:
+            print(f"--- Reusing flexible line: {flexible_line.name}")
+
+            for name, value in fragment.counters.items():
+                run_metrics.count(name, value)
+
+        fragment.hrdf_fragment.write_to(context.hrdf_writer)
+        context.fplan_table.extend(fragment.fplan_table)
+
+    # keep the fragments of this conversion and the ones of the flexible lines not converted in it
+    flexible_line_ids = {flexible_line.id for flexible_line in flexible_lines}
+    kept_fragments = {fingerprint: fragment for fingerprint, fragment in cached_fragments.items()
+                      if fragment.flexible_line_id not in flexible_line_ids}
+    kept_fragments.update(zip(fingerprints, fragments))
+
+    # the cache only changes if a flexible line was converted or got other ids (the bitfields are always looked up)
+    if changed_lines or moved_lines > 0:
+        fragment_cache.store(kept_fragments)
+
+
+######### Conversion service #############
+# sets up a process of the conversion service: the resources are loaded once per process
+def init_service_worker(output_format: str):
+    global worker_resources, service_worker_output_format
+
+    worker_resources = ConversionResources(output_format)
+    service_worker_output_format = output_format
+
+
+# converts the NeTEx file (XML or ZIP) in a process of the conversion service and writes the HRDF files into the given
+# zip. Returns the time the conversion started at (epoch, to get the time it was queued) and the seconds per stage
+def convert_in_service_worker(netex_file_path: str, zip_file_path: str, offers: list[str], netex_parser: str,
+                              zip_compression_level: int,
+                              netex_cache_folder: Optional[str] = None) -> Tuple[float, dict[str, float]]:
+    import contextlib
+
+    started = time.time()
+
+    # the log of the conversion is not needed, the service logs one line per request
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with HrdfWriter(None, service_worker_output_format) as hrdf_writer:
+            context = ConversionContext(hrdf_writer, worker_resources)
+            init_hrdf(context)
+            convert_from_netex(offers, netex_file_path, context, netex_parser,
+                               netex_cache_folder=netex_cache_folder)
+
+            with context.metrics.stage("zip"):
+                hrdf_writer.write_to_zip(zip_file_path, zip_compression_level)
+
+    return started, dict(context.metrics.stage_seconds)
+
+
+# Converts NeTEx files posted over HTTP and answers with the zip of the HRDF files:
+#
+#   POST /convert?offers=Offer%20A,Offer%20B  (body: the NeTEx XML or ZIP, with a Content-Length)
+#   GET /health
+#
+# The conversions run in a pool of worker processes (the resources are loaded once per process). At most workers
+# conversions run at the same time and queue_size more wait for a free worker, further requests are rejected with 503
+# (and a Retry-After) instead of piling up. The answer tells how long the request was queued and each stage took in the
+# Server-Timing header
+class ConversionService:
+    def __init__(self, output_format: str = "utf-8", netex_parser: str = "stream", workers: int = 2,
+                 queue_size: int = 8, timeout: float = 600.0, max_upload_size: int = 1 << 30,
+                 zip_compression_level: int = 6, netex_cache_folder: Optional[str] = None):
+        import threading
+
+        # check the NeTEx parser
+        if netex_parser not in ["stream", "dom"]:
+            raise ValueError(f"Unsupported NeTEx parser: {netex_parser}")
+
+        # check the size of the pool and the queue
+        if workers < 1:
+            raise ValueError(f"!ERROR! The number of service workers must be at least 1, not {workers}.")
+        if queue_size < 0:
+            raise ValueError(f"!ERROR! The service queue must not be negative, not {queue_size}.")
+
+        self.output_format = output_format  # the encoding of the HRDF files (utf-8 or cp1252)
+        self.netex_parser = netex_parser
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout  # the seconds a request waits for its conversion (including the queue)
+        self.max_upload_size = max_upload_size  # the bytes of the largest NeTEx file accepted
+        self.zip_compression_level = zip_compression_level
+        self.netex_cache_folder = netex_cache_folder  # the records of the NeTEx files posted before, see NetexCache
+
+        # a slot is taken by every accepted conversion until it is done (also if its request timed out)
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.lock = threading.Lock()
+        self.accepted = 0  # the conversions holding a slot
+        self.executor = self.create_executor()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def create_executor(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # the workers are started from the threads of the server, which must not be forked
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=init_service_worker, initargs=(self.output_format,))
+
+    # takes a slot for a conversion, False if all workers are busy and the queue is full
+    def try_accept(self) -> bool:
+        if not self.slots.acquire(blocking=False):
+            return False
+
+        with self.lock:
+            self.accepted += 1
+
+        return True
+
+    def release(self):
+        with self.lock:
+            self.accepted -= 1
+
+        self.slots.release()
+
+    # the number of conversions running and waiting for a worker
+    def get_health(self) -> dict:
+        with self.lock:
+            accepted = self.accepted
+
+        return {
+            'status': "ok",
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'running': min(accepted, self.workers),
+            'queued': max(0, accepted - self.workers)
+        }
 
-                    if not stop_id in bahnhof_bfkoord_stop_ids:
-                        write_to_hrdf(to_folder, "bahnhof", stop_id + "     " + name, True)
+    # converts the NeTEx file in the pool (the slot must have been taken with try_accept, it is released once the
+    # conversion is done) and returns the seconds it was queued and each stage took. Raises TimeoutError if the
+    # conversion does not finish in time
+    def convert(self, netex_file_path: str, zip_file_path: str, offers: list[str]) -> dict[str, float]:
+        from concurrent.futures import TimeoutError as FutureTimeoutError
+        from concurrent.futures.process import BrokenProcessPool
 
-                        write_to_hrdf(to_folder, "bfkoord", stop_id + " " +
-                                      ensure_width(longitude, 11, "0", True) + " " +
-                                      ensure_width(latitude, 11, "0", True) + "        % " + name,
-                                      True)
+        submitted = time.time()
 
-                        bahnhof_bfkoord_stop_ids.append(stop_id)
+        try:
+            with self.lock:
+                executor = self.executor
 
+            future = executor.submit(convert_in_service_worker, netex_file_path, zip_file_path, offers,
+                                     self.netex_parser, self.zip_compression_level, self.netex_cache_folder)
+        except BaseException:
+            self.release()
+            raise
 
-# ensures appropriate flplan line width and closure with %
-def close_fplan_line(line_to_close: str) -> str:
-    # If the line is shorter than 60 characters, pad it with spaces
-    if len(line_to_close) < 60:
-        line_to_close = line_to_close.ljust(60)  # Pad with spaces on the right
+        future.add_done_callback(lambda done_future: self.release())
 
-    # Insert '%' at position 60
-    return line_to_close[:59] + '%' + line_to_close[59:]
+        try:
+            started, stage_seconds = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # a waiting conversion is dropped, a running one keeps its worker until it is done
+            future.cancel()
+            raise TimeoutError(f"!ERROR! The conversion did not finish within {self.timeout} seconds.")
+        except BrokenProcessPool:
+            # a worker died (e.g., out of memory), the conversions after it get a new pool
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = self.create_executor()
+            raise
 
+        seconds = {'queue': max(0.0, started - submitted)}
+        seconds.update(stage_seconds)
+        seconds['total'] = time.time() - submitted
 
-######### MAIN functions #############
-def main(offers: list[str], from_folder: str, to_folder: str, ftp: dict[str, str], keep_output_folder: bool):
-    # Initialize HRDF files
-    init_hrdf(to_folder)
+        return seconds
 
-    # if existent get the previous netex file, otherwise only create the "previous folder"
-    previous_netex_file_name = get_previous_file_name()
+    # serves the conversions at the given address until SIGTERM or Ctrl+C
+    def serve(self, host: str, port: int):
+        import threading
 
-    # extract the netex file from the given folder
-    netex_file_path = None
-    netex_file_name = None
+        server = ThreadingHTTPServer((host, port), ConversionRequestHandler)
+        server.daemon_threads = True
+        server.service = self
 
-    # Ensure only one Netex file is present in the folder
-    if len(os.listdir(from_folder)) > 1:
-        raise ValueError("!ERROR! More than one NeTEx file delivered.")
+        # stop on SIGTERM (signals can only be handled in the main thread, shutdown must be called from another one)
+        if threading.current_thread() is threading.main_thread():
+            import signal
 
-    # Iterate through the files in the specified folder (to actually get the single netex file path
-    for netex_file_name in os.listdir(from_folder):
-        netex_file_path = os.path.join(from_folder, netex_file_name)  # Get the full file path
+            signal.signal(signal.SIGTERM, lambda signal_number, frame: threading.Thread(target=server.shutdown).start())
 
-    if netex_file_path is not None and netex_file_name is not None:
-        if previous_netex_file_name != netex_file_name:
-            # Convert based on the specified format
-            convert_from_netex(offers, netex_file_path, to_folder)
+        print(f"Serving conversions on http://{host}:{server.server_address[1]} with {self.workers} workers "
+              f"(queue of {self.queue_size})")
 
-            # remove the netex file from the output/to_folder folder.
-            if os.path.isfile(netex_file_path):
-                # move the new file to the previous folder, and, if given, delete the old previous
-                if previous_netex_file_name is not None:
-                    os.remove(os.path.join(os.path.join(os.getcwd(), PREVIOUS_FOLDER_NAME), previous_netex_file_name))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+        print("Stopped serving")
+
+
+# The requests of the ConversionService (see there)
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    server_version = "NetexToHrdf"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        from urllib.parse import urlsplit
+
+        if urlsplit(self.path).path != "/health":
+            self.send_error_json(404, "Not found")
+            return
+
+        self.send_json(200, self.server.service.get_health())
+
+    def do_POST(self):
+        import tempfile
+        import zipfile
+        from concurrent.futures.process import BrokenProcessPool
+        from urllib.parse import parse_qs, urlsplit
+
+        service = self.server.service
+        url = urlsplit(self.path)
+
+        if url.path != "/convert":
+            self.send_error_json(404, "Not found")
+            return
+
+        # the offers to limit the conversion to, separated with "," (the parameter may be given several times)
+        offers = [offer.strip() for value in parse_qs(url.query).get("offers", []) for offer in value.split(",")
+                  if offer.strip() != ""]
+
+        content_length = self.headers.get("Content-Length")
+        if content_length is None or not content_length.isdigit():
+            self.send_error_json(411, "The NeTEx file must be sent with a Content-Length")
+            return
+
+        content_length = int(content_length)
+        if content_length == 0:
+            self.send_error_json(400, "No NeTEx file was sent")
+            return
+        if content_length > service.max_upload_size:
+            self.send_error_json(413, f"The NeTEx file is larger than {service.max_upload_size} bytes")
+            return
+
+        # reject the request before reading the NeTEx file if the queue is full
+        if not service.try_accept():
+            self.send_error_json(503, "All workers are busy and the queue is full", {'Retry-After': "5"})
+            return
+
+        with tempfile.TemporaryDirectory(prefix="netex_to_hrdf_") as temporary_folder:
+            netex_file_path = os.path.join(temporary_folder, "netex")
+            zip_file_path = os.path.join(temporary_folder, str(date.today()) + "_hrdf_odv.zip")
+
+            try:
+                self.receive_file(netex_file_path, content_length)
+            except Exception:
+                service.release()
+                raise
+
+            try:
+                seconds = service.convert(netex_file_path, zip_file_path, offers)
+            except TimeoutError as e:
+                self.send_error_json(504, str(e))
+                return
+            except (ValueError, SyntaxError, zipfile.BadZipFile) as e:
+                # SyntaxError covers the xml ParseError
+                self.send_error_json(422, f"The NeTEx file could not be converted: {str(e) or type(e).__name__}")
+                return
+            except BrokenProcessPool:
+                self.send_error_json(500, "The worker converting the NeTEx file died")
+                return
+            except Exception as e:
+                self.send_error_json(500, f"The conversion failed: {str(e) or type(e).__name__}")
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(zip_file_path)}"')
+            self.send_header("Content-Length", str(os.path.getsize(zip_file_path)))
+            self.send_header("Server-Timing", ", ".join(f"{stage};dur={seconds * 1000:.1f}"
+                                                        for stage, seconds in seconds.items()))
+            self.send_header("X-Queue-Seconds", f"{seconds['queue']:.3f}")
+            self.send_header("X-Conversion-Seconds", f"{seconds['total'] - seconds['queue']:.3f}")
+            self.end_headers()
+
+            with open(zip_file_path, "rb") as zip_file:
+                shutil.copyfileobj(zip_file, self.wfile, 1 << 20)
+
+    # writes the body of the request to the given file
+    def receive_file(self, file_path: str, content_length: int, chunk_size: int = 1 << 20):
+        with open(file_path, "wb") as file:
+            remaining = content_length
+
+            while remaining > 0:
+                chunk = self.rfile.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise EOFError(f"!ERROR! The NeTEx file ended after {content_length - remaining} of "
+                                   f"{content_length} bytes.")
+                file.write(chunk)
+                remaining -= len(chunk)
 
-                move_file(netex_file_path, os.path.join(os.getcwd(), PREVIOUS_FOLDER_NAME))
-            else:
-                raise FileNotFoundError(f"!ERROR! Was not a file path: {netex_file_path}")
-
-            # zip the results to a file
-            zip_file_name = str(date.today()) + "_hrdf_odv.zip"
-            zip_file_path = os.path.join(os.getcwd(), zip_file_name)
-            zip_folder(to_folder, zip_file_path)
-
-            # upload to ftp
-            if ftp:
-                upload_to_ftp(zip_file_path, ftp)
-
-            # Clean up
-            if not keep_output_folder:
-                remove_directory(to_folder)
-                print("Removed the to_folder (and its files)")
-            if input_folder is not None:
-                remove_directory(input_folder)
-                print("Removed the tmp folder (and its files)")
-            if ftp is not None and os.path.isfile(zip_file_path):
-                os.remove(zip_file_path)
-                print("Removed zip file")
+    def send_json(self, status: int, content: dict, headers: Optional[dict[str, str]] = None):
+        body = json.dumps(content).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status >= 400:
+            # the body of the request may not have been read
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+
+        self.wfile.write(body)
+
+    def send_error_json(self, status: int, message: str, headers: Optional[dict[str, str]] = None):
+        self.send_json(status, {'error': message}, headers)
+
+
+######### MAIN functions #############
+# Converts NeTEx files to HRDF. The converter loads the resources once and every conversion gets its own
+# ConversionContext, thus one converter can be kept (e.g., in a long-lived process) to run several conversions, also
+# concurrently in threads: each conversion can be given its own working folder (the input and previous folder, the
+# state file and the zip), the conversions of the same working folder run one after the other, and the downloads
+# share the connections of the converter one at a time. Concurrent conversions need different to_folders
+class Converter:
+    def __init__(self, output_format: str = "utf-8", netex_parser: str = "stream", workers: int = 1,
+                 working_folder: Optional[str] = None, netex_member: Optional[str] = None,
+                 zip_compression_level: int = 6, zip_threads: int = 1, report_path: Optional[str] = None,
+                 prometheus_textfile: Optional[str] = None, profile: Optional[str] = None,
+                 profile_path: Optional[str] = None, netex_cache_folder: Optional[str] = None,
+                 fragment_cache_folder: Optional[str] = None):
+        import threading
+
+        # check the NeTEx parser
+        if netex_parser not in ["stream", "dom"]:
+            raise ValueError(f"Unsupported NeTEx parser: {netex_parser}")
+
+        # check the number of workers
+        if workers < 1:
+            raise ValueError(f"!ERROR! The number of workers must be at least 1, not {workers}.")
+
+        # check the packaging of the zip
+        if zip_compression_level < 0 or zip_compression_level > 9:
+            raise ValueError(f"!ERROR! The zip compression level must be between 0 and 9, not {zip_compression_level}.")
+        if zip_threads < 1:
+            raise ValueError(f"!ERROR! The number of zip threads must be at least 1, not {zip_threads}.")
+
+        # check the profile
+        if profile not in [None, "cpu", "memory"]:
+            raise ValueError(f"!ERROR! Unsupported profile: {profile}. Please use 'cpu' or 'memory'.")
+
+        self.output_format = output_format  # the encoding of the HRDF files (utf-8 or cp1252)
+        self.netex_parser = netex_parser
+        self.workers = workers
+        self.netex_member = netex_member  # the XML to read if the NeTEx file is a ZIP with several of them
+        self.netex_cache_folder = netex_cache_folder  # the records of the NeTEx files read before, see NetexCache
+        self.fragment_cache_folder = fragment_cache_folder  # the flexible lines converted before, see FragmentCache
+        self.zip_compression_level = zip_compression_level  # 0 (stored) to 9
+        self.zip_threads = zip_threads  # the threads compressing the HRDF files into the zip
+        self.report_path = report_path  # the JSON report of each run (see RunMetrics), if given
+        self.prometheus_textfile = prometheus_textfile  # the metrics of each run in the Prometheus format, if given
+
+        # run the conversions under cProfile ("cpu") or tracemalloc ("memory"), see profiling
+        self.profile = profile
+        self.profile_path = profile_path
+        self.profile_stats = None  # the CPU profiles of all conversions so far (pstats.Stats)
+        self.profile_lock = threading.Lock()  # the profiled conversions run one at a time
+        self.profiling_state = threading.local()  # whether the conversion of the thread is profiled (see profiling)
+
+        # the folder containing the previous folder and the zip file, by default the current working directory
+        self.working_folder = os.getcwd() if working_folder is None else working_folder
+
+        self.resources = ConversionResources(output_format)
+
+        self.downloader = None  # created with the first download
+        self.uploader = None  # created with the first upload (it can be used by several threads at once)
+
+        self.lock = threading.Lock()  # for the state shared by the conversions (e.g., the uploader, the reports)
+        self.download_lock = threading.Lock()  # the downloader is used by one conversion at a time
+        self.working_folder_locks = {}  # working folder -> the lock of its conversions
+
+    # close the connections of the downloader and uploader
+    def close(self):
+        with self.download_lock:
+            if self.downloader is not None:
+                self.downloader.close()
+                self.downloader = None
+        with self.lock:
+            if self.uploader is not None:
+                self.uploader.close()
+                self.uploader = None
+
+    # the lock of the conversions of the given working folder (they share the input and previous folder, the state file
+    # and the zip)
+    def get_working_folder_lock(self, working_folder: str):
+        import threading
+
+        with self.lock:
+            return self.working_folder_locks.setdefault(os.path.abspath(working_folder), threading.RLock())
+
+    # write the report (and Prometheus textfile) of the run, if configured
+    def write_run_report(self, run_metrics: RunMetrics):
+        with self.lock:
+            if self.report_path:
+                run_metrics.write_report(self.report_path)
+            if self.prometheus_textfile:
+                run_metrics.write_prometheus_textfile(self.prometheus_textfile)
+            if self.profile == "memory" and run_metrics.allocations:
+                run_metrics.write_memory_profile(self.profile_path or "profile_memory.txt")
+
+    # profile the block (if a profile is given). With "cpu" it runs under cProfile, the statistics (of all runs of the
+    # converter so far) are dumped to a pstats file and the top functions of the converter are printed. With "memory"
+    # the allocations are traced, and the peak and top allocation sites per stage are reported (see RunMetrics.stage).
+    # Only the outermost block of a thread profiles, e.g., convert within convert_from_url is part of its profile. The
+    # profilers (and tracemalloc) trace the whole process, thus the profiled conversions run one after the other
+    @contextmanager
+    def profiling(self):
+        if self.profile is None or getattr(self.profiling_state, "active", False):
+            yield
+            return
+
+        import tracemalloc
+
+        with self.profile_lock:
+            self.profiling_state.active = True
+            started_tracing = False
+            profiler = None
+
+            if self.profile == "cpu":
+                import cProfile
+
+                profiler = cProfile.Profile()
+                profiler.enable()
+            elif not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+
+            try:
+                yield
+            finally:
+                self.profiling_state.active = False
+
+                if profiler is not None:
+                    profiler.disable()
+                    self.write_cpu_profile(profiler)
+                elif started_tracing:
+                    tracemalloc.stop()
+
+    # add the statistics of the given profiler to the ones of the earlier runs, dump them and print the top functions
+    # of the converter (by cumulative time)
+    def write_cpu_profile(self, profiler, top: int = 25):
+        import pstats
+
+        if self.profile_stats is None:
+            self.profile_stats = pstats.Stats(profiler, stream=sys.stdout)
         else:
-            print("WARNING: Already loaded the given NeTEx file")
+            self.profile_stats.add(profiler)
+
+        profile_path = self.profile_path or "profile.pstats"
+        self.profile_stats.dump_stats(profile_path)
+        print(f"CPU profile written to '{profile_path}' (e.g., python -m pstats {profile_path}).")
+
+        if self.workers > 1:
+            print("WARNING: Only the main process is profiled, the flexible lines converted by the workers are not.")
+
+        # only the functions of the converter itself
+        self.profile_stats.sort_stats("cumulative").print_stats(os.path.basename(__file__).replace(".", "\\."), top)
+
+    # convert the NeTEx file in from_folder to HRDF files in to_folder, unless its content was already converted (see
+    # the state file), zip them and upload the zip to the ftp(s) (if given). Several NeTEx files in from_folder are
+    # converted into one set of HRDF files (see merge_netex_data). The input_folder (if given) is removed
+    # afterwards. The validators of the download (if given) are kept in the state file for the next download. If the
+    # records of the NeTEx file were already read (see convert_from_url), they are given as netex_data. The metrics of
+    # the run (see RunMetrics) are reported at the end, also if it fails. The previous folder, the state file and the
+    # zip are in the given working folder (by default the one of the converter)
+    def convert(self, offers: list[str], from_folder: str, to_folder: str,
+                ftp: Union[dict[str, str], list[dict[str, str]], None],
+                keep_output_folder: bool, input_folder: Optional[str] = None,
+                download_validators: Optional[dict] = None, netex_data: Optional[NetexData] = None,
+                run_metrics: Optional[RunMetrics] = None, working_folder: Optional[str] = None):
+        run_metrics = RunMetrics() if run_metrics is None else run_metrics
+        working_folder = self.working_folder if working_folder is None else working_folder
+
+        with self.profiling(), self.get_working_folder_lock(working_folder):
+            try:
+                status = self.convert_netex_file(offers, from_folder, to_folder, ftp, keep_output_folder,
+                                                 input_folder, download_validators, netex_data, run_metrics,
+                                                 working_folder)
+                run_metrics.finish(status)
+            except Exception as e:
+                run_metrics.finish("failed", e)
+                raise
+            finally:
+                self.write_run_report(run_metrics)
+
+    # see convert, returns the status of the run
+    def convert_netex_file(self, offers: list[str], from_folder: str, to_folder: str,
+                           ftp: Union[dict[str, str], list[dict[str, str]], None], keep_output_folder: bool,
+                           input_folder: Optional[str], download_validators: Optional[dict],
+                           netex_data: Optional[NetexData], run_metrics: RunMetrics, working_folder: str) -> str:
+        # All HRDF files are written through the writer, which is closed when leaving the block (also on failure). They
+        # are only written to the to_folder if it is kept, otherwise they are spooled and only written into the zip
+        with HrdfWriter(to_folder if keep_output_folder else None, self.output_format) as hrdf_writer:
+            context = ConversionContext(hrdf_writer, self.resources, run_metrics)
+
+            # Initialize HRDF files
+            init_hrdf(context)
+
+            # if existent get the previous netex file(s), otherwise only create the "previous folder"
+            previous_netex_file_names = get_previous_file_names(working_folder)
+
+            # the state of the last conversion, i.e., the content hash of the previous netex file
+            conversion_state = read_conversion_state(working_folder)
+
+            # the netex files in the given folder, several files (e.g., the deliveries of several operators or
+            # regions) are converted into one set of HRDF files. The files of a partial download are skipped
+            netex_file_names = sorted(file_name for file_name in os.listdir(from_folder)
+                                      if not is_partial_download_file(file_name))
+            netex_file_paths = [os.path.join(from_folder, netex_file_name) for netex_file_name in netex_file_names]
+
+            if netex_file_paths:
+                run_metrics.netex_file_name = ", ".join(netex_file_names)
+
+                # the content hash decides whether the file(s) changed. If there is no state file yet (e.g., the
+                # previous file was converted by an older version) we hash the previous file(s)
+                netex_file_sha256 = get_files_sha256(netex_file_paths)
+                previous_netex_file_sha256 = conversion_state.get("sha256")
+
+                if previous_netex_file_sha256 is None and previous_netex_file_names:
+                    previous_netex_file_sha256 = get_files_sha256(
+                        [os.path.join(working_folder, PREVIOUS_FOLDER_NAME, previous_netex_file_name)
+                         for previous_netex_file_name in previous_netex_file_names])
+
+                # the options the HRDF files depend on, thus the same file is converted again with other offers or
+                # another output format (a state without them was written by an older version and is kept as is)
+                conversion_options = {'offers': sorted(offers), 'output_format': self.output_format}
+                previous_conversion_options = conversion_state.get("options", conversion_options)
+
+                # the state after this run, the download validators are kept for the next (conditional) download
+                conversion_state = {
+                    'file_name': ", ".join(netex_file_names),
+                    'sha256': netex_file_sha256,
+                    'options': conversion_options,
+                    'download': download_validators or conversion_state.get("download")
+                }
+
+                if previous_netex_file_sha256 != netex_file_sha256 or previous_conversion_options != conversion_options:
+                    # Convert based on the specified format
+                    convert_from_netex(offers, netex_file_paths[0] if len(netex_file_paths) == 1 else netex_file_paths,
+                                       context, self.netex_parser, self.workers, self.netex_member, netex_data,
+                                       self.netex_cache_folder, self.fragment_cache_folder)
+
+                    # zip the results to a file, directly from the HRDF files of the writer
+                    zip_file_name = str(date.today()) + "_hrdf_odv.zip"
+                    zip_file_path = os.path.join(working_folder, zip_file_name)
+                    run_metrics.hrdf_files = hrdf_writer.get_file_statistics()
+
+                    with run_metrics.stage("zip"):
+                        hrdf_writer.write_to_zip(zip_file_path, self.zip_compression_level, self.zip_threads)
+
+                    # flush and close the HRDF files
+                    hrdf_writer.close()
+
+                    # remove the netex file(s) from the output/to_folder folder.
+                    for netex_file_path in netex_file_paths:
+                        if not os.path.isfile(netex_file_path):
+                            raise FileNotFoundError(f"!ERROR! Was not a file path: {netex_file_path}")
+
+                    # upload to ftp (raises if it fails, then the new file(s) stay where they are and the state is
+                    # not written, thus the next run converts and uploads again)
+                    if ftp:
+                        # the uploader (and its connections) is kept for the next conversions
+                        with self.lock:
+                            if self.uploader is None:
+                                self.uploader = Uploader()
+
+                        with run_metrics.stage("upload"):
+                            run_metrics.uploads = upload_to_ftp(zip_file_path, ftp, self.uploader)
+
+                    # move the new file(s) to the previous folder, and, if given, delete the old previous
+                    for previous_netex_file_name in previous_netex_file_names:
+                        os.remove(os.path.join(os.path.join(working_folder, PREVIOUS_FOLDER_NAME),
+                                               previous_netex_file_name))
+
+                    for netex_file_path in netex_file_paths:
+                        move_file(netex_file_path, os.path.join(working_folder, PREVIOUS_FOLDER_NAME))
+
+                    write_conversion_state(working_folder, conversion_state)
+
+                    # Clean up
+                    if not keep_output_folder and os.path.isdir(to_folder):
+                        remove_directory(to_folder)
+                        print("Removed the to_folder (and its files)")
+                    if input_folder is not None:
+                        remove_directory(input_folder)
+                        print("Removed the tmp folder (and its files)")
+                    if ftp is not None and os.path.isfile(zip_file_path):
+                        os.remove(zip_file_path)
+                        print("Removed zip file")
+
+                    return "converted"
+                else:
+                    print("WARNING: Already loaded the given NeTEx file")
+
+                    write_conversion_state(working_folder, conversion_state)
+
+                    # flush and close the HRDF files before cleaning up
+                    hrdf_writer.close()
+
+                    # Clean up
+                    if not keep_output_folder and os.path.isdir(to_folder):
+                        remove_directory(to_folder)
+                        print("Removed the to_folder (and its files)")
+                    if input_folder is not None:
+                        remove_directory(input_folder)
+                        print("Removed the tmp folder (and its files)")
+
+                    return "unchanged"
+
+        return "no_file"
+
+    # download the NeTEx file from the url (conditionally, see Downloader.open) and convert it like Converter.convert.
+    # With pipeline the NeTEx file is read while it is downloading, otherwise after the download. The input folder of
+    # the download (in the given working folder, by default the one of the converter) is removed afterwards
+    def convert_from_url(self, offers: list[str], url: str, to_folder: str,
+                         ftp: Union[dict[str, str], list[dict[str, str]], None],
+                         keep_output_folder: bool, pipeline: bool = True, working_folder: Optional[str] = None):
+        working_folder = self.working_folder if working_folder is None else working_folder
+
+        with self.profiling(), self.get_working_folder_lock(working_folder):
+            last_download_validators = read_conversion_state(working_folder).get("download")
+            run_metrics = RunMetrics()
+
+            try:
+                # the downloader (and its connections) is kept for the next conversions, one download at a time
+                with self.download_lock:
+                    if self.downloader is None:
+                        self.downloader = Downloader()
+
+                    download_count = len(self.downloader.metrics)
+
+                    # with pipeline the download includes reading the NeTEx file (while it is downloading)
+                    with run_metrics.stage("download"):
+                        if pipeline:
+                            input_folder, netex_data, download_validators = load_and_read_from_url(
+                                url, self.netex_parser, self.netex_member, last_download_validators, self.downloader,
+                                working_folder)
+                        else:
+                            input_folder, download_validators = load_from_url(url, last_download_validators,
+                                                                              self.downloader, working_folder)
+                            netex_data = None
+
+                    if len(self.downloader.metrics) > download_count:
+                        run_metrics.download = self.downloader.metrics[-1]
+            except Exception as e:
+                run_metrics.finish("failed", e)
+                self.write_run_report(run_metrics)
+                raise
+
+            if input_folder is None:
+                print("WARNING: The NeTEx file was not modified since the last conversion")
+                run_metrics.finish("not_modified")
+                self.write_run_report(run_metrics)
+                return
+
+            self.convert(offers, input_folder, to_folder, ftp, keep_output_folder, input_folder, download_validators,
+                         netex_data, run_metrics, working_folder)
+
+
+    # convert every interval seconds until stopped (by the stop event, SIGTERM or Ctrl+C), either from the url (the
+    # download is conditional, thus an unchanged export costs a single request) or from the folder (an unchanged file
+    # is only hashed). The converter, i.e., its resources and connections, stays warm between the cycles, while the
+    # state of each run is created anew. A failing cycle is logged and the connections are reset, the daemon goes on
+    def watch(self, offers: list[str], url: Optional[str], from_folder: str, to_folder: str,
+              ftp: Union[dict[str, str], list[dict[str, str]], None], keep_output_folder: bool, interval: float,
+              stop_event=None, max_cycles: Optional[int] = None):
+        import threading
+        import traceback
+
+        if interval <= 0:
+            raise ValueError(f"!ERROR! The watch interval must be positive, not {interval}.")
+
+        if stop_event is None:
+            stop_event = threading.Event()
+
+            # stop after the current cycle on SIGTERM (signals can only be handled in the main thread)
+            if threading.current_thread() is threading.main_thread():
+                import signal
+
+                signal.signal(signal.SIGTERM, lambda signal_number, frame: stop_event.set())
+
+        cycle = 0
+
+        while not stop_event.is_set() and (max_cycles is None or cycle < max_cycles):
+            cycle += 1
+            started = time.monotonic()
+            print(f"=== Watch cycle {cycle} ({datetime.now().isoformat(timespec='seconds')})")
+
+            # only the metrics of the current cycle are kept
+            if self.downloader is not None:
+                self.downloader.metrics.clear()
+            if self.uploader is not None:
+                self.uploader.metrics.clear()
+
+            try:
+                if url is not None:
+                    self.convert_from_url(offers, url, to_folder, ftp, keep_output_folder)
+                else:
+                    self.convert(offers, from_folder, to_folder, ftp, keep_output_folder)
+            except Exception:
+                traceback.print_exc()
+                print(f"ERROR: Watch cycle {cycle} failed, the next one starts as planned")
+
+                # the connections may be broken, they are opened anew in the next cycle
+                self.close()
+
+            seconds = time.monotonic() - started
+            print(f"=== Watch cycle {cycle} took {seconds:.2f} s")
+
+            if max_cycles is None or cycle < max_cycles:
+                stop_event.wait(max(0.0, interval - seconds))
+
+        print("Stopped watching")
+
+
+# convert with a new converter, see Converter.convert (and Converter.convert_from_url if the url is given, and
+# Converter.watch if the watch interval is given). The options of the converter are given as keyword arguments
+def main(offers: list[str], from_folder: str, to_folder: str, ftp: Union[dict[str, str], list[dict[str, str]], None],
+         keep_output_folder: bool, *, from_url: Optional[str] = None, pipeline: bool = False,
+         watch_interval: Optional[float] = None, **converter_options):
+    converter = Converter(**converter_options)
 
-            # Clean up
-            if not keep_output_folder:
-                remove_directory(to_folder)
-                print("Removed the to_folder (and its files)")
-            if input_folder is not None:
-                remove_directory(input_folder)
-                print("Removed the tmp folder (and its files)")
+    try:
+        if watch_interval is not None:
+            converter.watch(offers, from_url, from_folder, to_folder, ftp, keep_output_folder, watch_interval)
+        elif from_url is not None:
+            converter.convert_from_url(offers, from_url, to_folder, ftp, keep_output_folder, pipeline)
+        else:
+            converter.convert(offers, from_folder, to_folder, ftp, keep_output_folder)
+    finally:
+        converter.close()
 
 
 if __name__ == '__main__':
     import argparse  # Import argparse for command-line argument parsing
+    import multiprocessing
+
+    # the worker processes of --workers must not run main again when started from the exe (pyinstaller)
+    multiprocessing.freeze_support()
 
     # Set up the argument parser
     parser = argparse.ArgumentParser(
@@ -1170,7 +4669,7 @@ if __name__ == '__main__':
                         help='The URL to load the NeTEx data from (can handle ZIPs). Will create folder input!',
                         default="https://data.opentransportdata.swiss/dataset/netex_tt_odv/permalink")
     parser.add_argument('--from_folder', type=str,
-                        help='Folder containing the NeTEx data (unzipped!). If empty use URL (with input folder). '
+                        help='Folder containing the NeTEx data (XML or ZIP). If empty use URL (with input folder). '
                              'Delete folder if created automatically (file can be found in previous). Default: empty.',
                         default="")
     parser.add_argument('--to_folder', type=str,
@@ -1179,14 +4678,111 @@ if __name__ == '__main__':
     parser.add_argument('--keep_output', type=str,
                         help='Whether or not to keep the output folder and its files after the process. Previous is always kept',
                         default="True")
-    parser.add_argument('--ftp', type=str,
-                        help='The FTP to upload the zipped HRDF files to, a quadruple of url,user,password,path')
+    parser.add_argument('--ftp', type=str, action='append',
+                        help='The FTP to upload the zipped HRDF files to, a quadruple of url,user,password,path, or '
+                             'file://<folder> to copy them to a local folder. Can be given several times')
     parser.add_argument('--output_format', type=str,
                         help='The output format of the files (ansi=cp1252): "utf-8" or "ansi"')
+    parser.add_argument('--netex_parser', type=str,
+                        help='How to read the NeTEx file: "stream" (iterparse, bounded memory) or "dom" (whole file in '
+                             'memory). Default: stream',
+                        default="stream")
+    parser.add_argument('--workers', type=int,
+                        help='The number of processes to convert the flexible lines with, the output is the same as with '
+                             'a single one. Default: 1',
+                        default=1)
+    parser.add_argument('--netex_member', type=str,
+                        help='The XML file to read if the NeTEx ZIP contains several of them. Default: the single XML '
+                             'file in the ZIP')
+
+    parser.add_argument('--netex_cache', type=str,
+                        help='The folder to keep the records read from the NeTEx files in (by content hash), a file '
+                             'read before is loaded from there instead of parsed. Default: none',
+                        default="")
+
+    parser.add_argument('--fragment_cache', type=str,
+                        help='The folder to keep the converted flexible lines in, a flexible line whose records did '
+                             'not change since the previous conversion is taken from there instead of converted. '
+                             'Default: none',
+                        default="")
+
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Read the NeTEx file from the URL while it is downloading (also out of a ZIP, if its layout '
+                             'allows it) instead of after the download. Default: off')
+
+    parser.add_argument('--zip_level', type=int,
+                        help='The compression level of the zip, from 0 (stored) to 9 (smallest). Default: 6',
+                        default=6)
+    parser.add_argument('--zip_threads', type=int,
+                        help='The number of threads compressing the HRDF files into the zip. Default: 1',
+                        default=1)
+
+    parser.add_argument('--report', type=str,
+                        help='The JSON file to write the report of the run to (seconds per stage, counters, lines and '
+                             'bytes per HRDF file, peak memory). Default: none')
+    parser.add_argument('--prometheus_textfile', type=str,
+                        help='The file to write the metrics of the run to in the Prometheus text format (e.g., for the '
+                             'textfile collector of the node exporter). Default: none')
+
+    parser.add_argument('--profile', type=str, choices=["cpu", "memory"],
+                        help='Profile the conversion: "cpu" runs it under cProfile (dumps a pstats file and prints the '
+                             'top functions), "memory" traces the allocations (writes the top allocation sites per '
+                             'stage). Default: none')
+    parser.add_argument('--profile_output', type=str,
+                        help='The file to write the profile to. Default: profile.pstats (cpu) or profile_memory.txt '
+                             '(memory)')
+
+    parser.add_argument('--watch', type=float,
+                        help='Keep running and convert every WATCH seconds (only if the NeTEx file changed), until '
+                             'SIGTERM or Ctrl+C. The url is read while downloading (like --pipeline). Default: once')
+
+    parser.add_argument('--serve', type=str,
+                        help='Serve conversions over HTTP at HOST:PORT instead of converting once: POST the NeTEx XML '
+                             'or ZIP to /convert (?offers=A,B) and get the zip of the HRDF files. Default: off')
+    parser.add_argument('--serve_workers', type=int,
+                        help='The number of processes converting the posted NeTEx files. Default: 2',
+                        default=2)
+    parser.add_argument('--serve_queue', type=int,
+                        help='The number of posted NeTEx files waiting for a free process, further ones are '
+                             'rejected with 503. Default: 8',
+                        default=8)
+    parser.add_argument('--serve_timeout', type=float,
+                        help='The seconds a posted NeTEx file may wait and be converted. Default: 600',
+                        default=600.0)
+    parser.add_argument('--serve_max_upload_mb', type=int,
+                        help='The size of the largest NeTEx file accepted, in MB. Default: 1024',
+                        default=1024)
 
     print('Parsing arguments')
     args = parser.parse_args()
 
+    # get the output format
+    if args.output_format is None or args.output_format == "":
+        print("No output_format given, using utf-8")
+        output_format = 'utf-8'
+    else:
+        output_format = args.output_format
+
+        # Determine encoding based on output_format
+        if output_format.lower() == 'ansi':
+            output_format = 'cp1252'
+        elif output_format.lower() == 'utf-8':
+            output_format = 'utf-8'
+        else:
+            raise ValueError("Unsupported encoding format")
+
+    # serve conversions over HTTP instead of converting a NeTEx file
+    if args.serve:
+        host, _, port = args.serve.rpartition(":")
+        if not port.isdigit():
+            raise ValueError(f"!ERROR! The address to serve at must be HOST:PORT, not {args.serve}.")
+
+        with ConversionService(output_format, args.netex_parser, args.serve_workers, args.serve_queue,
+                               args.serve_timeout, args.serve_max_upload_mb << 20, args.zip_level,
+                               args.netex_cache or None) as service:
+            service.serve(host or "127.0.0.1", int(port))
+        sys.exit(0)
+
     # make sure the to_folder exists
     if not (os.path.exists(args.to_folder) and os.path.isdir(args.to_folder)):
         print(f"to_folder {args.to_folder} does not exist, will create it")
@@ -1194,11 +4790,15 @@ if __name__ == '__main__':
         os.makedirs(temporary_to_folder, exist_ok=True)
         args.to_folder = temporary_to_folder
 
-    # handle from_folder vs from_url
-    input_folder = None
+    # handle from_folder vs from_url, the download (conditional on the validators of the last converted download) is
+    # done by the converter within main (in every cycle if watching)
+    from_url = None
     if args.from_folder == "":
-        print(f'Downloading NeTEx file from URL: {args.from_url}')
-        input_folder = args.from_folder = load_and_unzip_from_url(args.from_url)
+        if args.pipeline or args.watch is not None:
+            print(f'Downloading and reading NeTEx file from URL: {args.from_url}')
+        else:
+            print(f'Downloading NeTEx file from URL: {args.from_url}')
+        from_url = args.from_url
 
     # parse the offers into a list of strings
     if args.offers == "":
@@ -1212,70 +4812,29 @@ if __name__ == '__main__':
         else:
             raise TypeError(f"Expected string for offers, got {type(args.offers).__name__}")
 
-    # parse the ftp data
-    if isinstance(args.ftp, str):
-        ftp_params = args.ftp.split(",")
-        ftp_url = ftp_params[0]
-        ftp_user = ftp_params[1]
-        ftp_password = ftp_params[2]
-        ftp_path = ftp_params[3]
-
-        # make sure the path ends with "/"
-        if not ftp_path.endswith("/"):
-            ftp_path = (ftp_path + "/")
-
-        # parse protocol and port (if given)
-        ftp_url_components = ftp_url.split(":")
-        ftp_protocol = ftp_url_components[0]
-        if ftp_protocol.lower() == "sftp":
-            ftp_port = "22"
-        elif ftp_protocol.lower() == "ftps":
-            ftp_port = "21"
-        else:
-            raise TypeError(f"Unsupported protocol: {ftp_protocol}")
-
-        if len(ftp_url_components) == 3:
-            ftp_port = ftp_url_components[2]
-            ftp_url = ftp_url_components[1].split("//")[1]
-        else:
-            ftp_url = ftp_url_components[1].split("//")[1]
-
-        args.ftp = {
-            'url': ftp_url.strip(),
-            'user': ftp_user.strip(),
-            'password': ftp_password.strip(),
-            'path': ftp_path.strip(),
-            'protocol': ftp_protocol.strip(),
-            'port': ftp_port.strip()
-        }
+    # parse the ftp data (each --ftp is a destination)
+    if args.ftp:
+        args.ftp = [parse_ftp(ftp_parameter) for ftp_parameter in args.ftp]
+        print(f"Uploading to {len(args.ftp)} destination(s): {', '.join(get_ftp_name(ftp) for ftp in args.ftp)}")
     else:
+        args.ftp = None
         print("No FTP was given, will leave the result-ZIP locally.")
 
-    keep_output = True
+    # only write the HRDF files to the to_folder if it is kept, e.g., "True", otherwise (e.g., "" or "False") they are
+    # only written into the zip
+    keep_output = args.keep_output.strip().lower() in ["true", "yes", "1"]
 
-    if args.keep_output == "":
+    if not keep_output:
         print('Not keeping output')
-    else:
-        keep_output = bool(args.keep_output)
-
-    # get the output format
-    if args.output_format is None or args.output_format == "":
-        print("No output_format given, using utf-8")
-        output_format = 'utf-8'
-    else:
-        output_format = args.output_format
-
-        # Determine encoding based on output_format
-        if output_format.lower() == 'ansi':
-            output_format = 'cp1252'
-        elif output_format.lower() == 'utf-8':
-            output_format = 'utf-8'
-        else:
-            raise ValueError("Unsupported encoding format")
 
     try:
         # Call main function with arguments
-        main(args.offers, args.from_folder, args.to_folder, args.ftp, keep_output)
+        main(args.offers, args.from_folder, args.to_folder, args.ftp, keep_output, from_url=from_url,
+             pipeline=args.pipeline, watch_interval=args.watch, output_format=output_format,
+             netex_parser=args.netex_parser, workers=args.workers, netex_member=args.netex_member,
+             zip_compression_level=args.zip_level, zip_threads=args.zip_threads, report_path=args.report or None,
+             prometheus_textfile=args.prometheus_textfile, profile=args.profile, profile_path=args.profile_output,
+             netex_cache_folder=args.netex_cache or None, fragment_cache_folder=args.fragment_cache or None)
     except Exception as e:
         # Raise any exceptions encountered during execution
         raise e
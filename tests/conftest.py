@@ -0,0 +1,87 @@
+import os
+import sys
+
+import pytest
+
+# the tests import main.py from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import generate_netex
+
+
+# a small synthetic NeTEx file (see benchmark.generate_netex)
+@pytest.fixture(scope="session")
+def netex_file(tmp_path_factory) -> str:
+    netex_file_path = str(tmp_path_factory.mktemp("netex") / "netex.xml")
+    generate_netex(netex_file_path, flexible_lines=6, service_journeys=6, polygon_vertices=12, stop_places=500)
+
+    return netex_file_path
+
+
+# a local HTTP server serving one file like the download server of the NeTEx data: with a file name, an ETag, a
+# Content-Length, conditional and Range requests. The first cut_transfers transfers are cut after cut_at bytes
+class StubHttpServer:
+    def __init__(self, data: bytes, file_name: str = "netex.xml", etag: str = '"1"'):
+        self.data = data
+        self.file_name = file_name
+        self.etag = etag
+        self.cut_transfers = 0
+        self.cut_at = 0
+        self.requests = []  # the headers of the requests received
+
+    def handle(self, handler):
+        headers = dict(handler.headers.items())
+        self.requests.append(headers)
+
+        if headers.get("If-None-Match") == self.etag:
+            handler.send_response(304)
+            handler.end_headers()
+            return
+
+        offset = 0
+
+        if "Range" in headers and headers.get("If-Range") == self.etag:
+            offset = int(headers["Range"].split("=")[1].split("-")[0])
+            handler.send_response(206)
+            handler.send_header("Content-Range", f"bytes {offset}-{len(self.data) - 1}/{len(self.data)}")
+        else:
+            handler.send_response(200)
+
+        handler.send_header("Content-Disposition", f"attachment; filename={self.file_name}")
+        handler.send_header("ETag", self.etag)
+        handler.send_header("Content-Length", str(len(self.data) - offset))
+        handler.end_headers()
+
+        if self.cut_transfers > 0:
+            self.cut_transfers -= 1
+            handler.wfile.write(self.data[offset:max(offset, self.cut_at)])
+            handler.close_connection = True
+            return
+
+        handler.wfile.write(self.data[offset:])
+
+
+# serve a StubHttpServer on a free local port, its url is the attribute url
+@pytest.fixture
+def http_server():
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    stub = StubHttpServer(b"".join(b"<Line id='%d'/>\n" % i for i in range(20000)))
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            stub.handle(self)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stub.url = f"http://127.0.0.1:{server.server_address[1]}/netex"
+
+    yield stub
+
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,96 @@
+import os
+import shutil
+
+import pytest
+
+from main import Converter, PREVIOUS_FOLDER_NAME, STATE_FILE_NAME, main
+
+
+def file_ftp(folder) -> dict[str, str]:
+    return {'protocol': 'file', 'url': '', 'port': '0', 'user': '', 'password': '', 'path': str(folder) + "/"}
+
+
+def test_failed_upload_keeps_the_netex_file_for_the_next_run(netex_file, tmp_path):
+    input_folder = tmp_path / "input"
+    input_folder.mkdir()
+    shutil.copy(netex_file, input_folder / "netex.xml")
+    upload_folder = tmp_path / "upload"
+
+    converter = Converter(working_folder=str(tmp_path))
+
+    # the upload folder does not exist yet, the upload fails
+    with pytest.raises(ConnectionError):
+        converter.convert([], str(input_folder), str(tmp_path / "output"), file_ftp(upload_folder), False)
+
+    assert os.listdir(input_folder) == ["netex.xml"]
+    assert not (tmp_path / STATE_FILE_NAME).exists()
+
+    upload_folder.mkdir()
+    converter.convert([], str(input_folder), str(tmp_path / "output"), file_ftp(upload_folder), False)
+
+    assert os.listdir(input_folder) == []
+    assert os.listdir(tmp_path / PREVIOUS_FOLDER_NAME) == ["netex.xml"]
+    assert (tmp_path / STATE_FILE_NAME).exists()
+    assert len(os.listdir(upload_folder)) == 1
+
+
+# the url is downloaded by the converter, a second run only asks whether the data was modified
+@pytest.mark.parametrize("pipeline", [False, True])
+def test_main_converts_from_the_url(http_server, netex_file, tmp_path, monkeypatch, pipeline):
+    import json
+
+    monkeypatch.chdir(tmp_path)
+    with open(netex_file, 'rb') as file:
+        http_server.data = file.read()
+    report_path = str(tmp_path / "report.json")
+    upload_folder = tmp_path / "upload"
+    upload_folder.mkdir()
+
+    for status in ["converted", "not_modified"]:
+        main([], "", "output", file_ftp(upload_folder), False, from_url=http_server.url, pipeline=pipeline,
+             report_path=report_path)
+
+        with open(report_path, 'r', encoding='utf-8') as file:
+            assert json.load(file)["status"] == status
+
+    assert http_server.requests[-1]["If-None-Match"] == http_server.etag
+    assert os.listdir(tmp_path / PREVIOUS_FOLDER_NAME) == ["netex.xml"]
+    assert len(os.listdir(upload_folder)) == 1
+
+
+# two conversions at once on one converter (each with its own working folder) give the zips of serial conversions
+def test_concurrent_conversions_on_one_converter(netex_file, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from benchmark import generate_netex
+
+    netex_file_paths = [netex_file, str(tmp_path / "other.xml")]
+    generate_netex(netex_file_paths[1], flexible_lines=8, service_journeys=4, polygon_vertices=20, stop_places=300,
+                   seed=2)
+
+    converter = Converter(working_folder=str(tmp_path / "unused"))
+
+    # convert the NeTEx file with the given index in the given folder, return the zip
+    def convert(index: int, folder) -> bytes:
+        input_folder = folder / f"input_{index}"
+        input_folder.mkdir(parents=True)
+        shutil.copy(netex_file_paths[index], input_folder / "netex.xml")
+        working_folder = folder / f"working_{index}"
+        working_folder.mkdir()
+
+        converter.convert([], str(input_folder), str(folder / f"output_{index}"), None, False,
+                          working_folder=str(working_folder))
+
+        zip_file_names = [file_name for file_name in os.listdir(working_folder) if file_name.endswith(".zip")]
+        assert len(zip_file_names) == 1
+
+        return (working_folder / zip_file_names[0]).read_bytes()
+
+    serial_zips = [convert(index, tmp_path / "serial") for index in range(2)]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        concurrent_zips = list(executor.map(convert, range(2), [tmp_path / "concurrent"] * 2))
+
+    assert serial_zips[0] != serial_zips[1]
+    assert concurrent_zips == serial_zips
+    assert not (tmp_path / "unused" / STATE_FILE_NAME).exists()
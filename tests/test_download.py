@@ -0,0 +1,116 @@
+import os
+
+import pytest
+
+from main import (Downloader, INPUT_FOLDER_NAME, PARTIAL_DOWNLOAD_FILE_NAME, load_and_read_from_url, load_from_url,
+                  read_netex_file)
+
+
+def test_download_into_the_working_folder(http_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path / "..")
+
+    input_folder, download_validators = load_from_url(http_server.url, working_folder=str(tmp_path))
+
+    assert input_folder == os.path.join(str(tmp_path), INPUT_FOLDER_NAME)
+    with open(os.path.join(input_folder, http_server.file_name), 'rb') as file:
+        assert file.read() == http_server.data
+    assert not os.path.exists(os.path.join(input_folder, PARTIAL_DOWNLOAD_FILE_NAME))
+    assert not os.path.exists(os.path.join(str(tmp_path / ".."), INPUT_FOLDER_NAME))
+
+    # not modified since the last download
+    assert load_from_url(http_server.url, download_validators, working_folder=str(tmp_path))[0] is None
+
+
+def test_interrupted_transfer_is_resumed_with_a_range_request(http_server, tmp_path):
+    http_server.cut_transfers = 1
+    http_server.cut_at = 1 << 17
+
+    downloader = Downloader(backoff=0)
+    try:
+        input_folder, _ = load_from_url(http_server.url, downloader=downloader, working_folder=str(tmp_path))
+    finally:
+        downloader.close()
+
+    with open(os.path.join(input_folder, http_server.file_name), 'rb') as file:
+        assert file.read() == http_server.data
+    assert http_server.requests[1]["Range"] == "bytes=131072-"
+    assert http_server.requests[1]["If-Range"] == http_server.etag
+    assert downloader.metrics[-1]["retries"] == 1
+
+
+def test_partial_download_of_an_earlier_run_is_resumed(http_server, tmp_path):
+    http_server.cut_transfers = 1
+    http_server.cut_at = 1 << 17
+
+    downloader = Downloader(retries=0, backoff=0)
+    try:
+        with pytest.raises(ConnectionError):
+            load_from_url(http_server.url, downloader=downloader, working_folder=str(tmp_path))
+    finally:
+        downloader.close()
+
+    input_folder = os.path.join(str(tmp_path), INPUT_FOLDER_NAME)
+    assert os.path.getsize(os.path.join(input_folder, http_server.file_name + ".part")) == 1 << 17
+
+    downloader = Downloader(retries=0, backoff=0)
+    try:
+        load_from_url(http_server.url, downloader=downloader, working_folder=str(tmp_path))
+    finally:
+        downloader.close()
+
+    with open(os.path.join(input_folder, http_server.file_name), 'rb') as file:
+        assert file.read() == http_server.data
+    assert http_server.requests[-1]["Range"] == "bytes=131072-"
+    assert downloader.metrics[-1]["resumed_bytes"] == 1 << 17
+
+
+@pytest.mark.parametrize("file_name", ["netex.xml", "netex_2.xml"])
+def test_changed_data_restarts_the_partial_download(http_server, tmp_path, file_name):
+    http_server.cut_transfers = 1
+    http_server.cut_at = 1 << 17
+
+    downloader = Downloader(retries=0, backoff=0)
+    try:
+        with pytest.raises(ConnectionError):
+            load_from_url(http_server.url, downloader=downloader, working_folder=str(tmp_path))
+    finally:
+        downloader.close()
+
+    # a new version of the data (possibly with another file name), the If-Range does not match anymore
+    http_server.data = http_server.data[::-1]
+    http_server.etag = '"2"'
+    http_server.file_name = file_name
+
+    input_folder, download_validators = load_from_url(http_server.url, working_folder=str(tmp_path))
+
+    with open(os.path.join(input_folder, file_name), 'rb') as file:
+        assert file.read() == http_server.data
+    assert download_validators["etag"] == '"2"'
+
+    # the partial download of the old version is removed, it would be converted as a second NeTEx file
+    assert os.listdir(input_folder) == [file_name]
+
+
+# the NeTEx records read while downloading (through ZipMemberStream) are the ones read from the file afterwards
+@pytest.mark.parametrize("zipped", [False, True])
+def test_read_while_downloading(http_server, netex_file, tmp_path, zipped):
+    import pickle
+    import zipfile
+
+    with open(netex_file, 'rb') as file:
+        http_server.data = file.read()
+
+    if zipped:
+        zip_file_path = str(tmp_path / "netex.zip")
+
+        with zipfile.ZipFile(zip_file_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.write(netex_file, "netex.xml")
+
+        with open(zip_file_path, 'rb') as file:
+            http_server.data = file.read()
+        http_server.file_name = "netex.zip"
+
+    input_folder, netex_data, _ = load_and_read_from_url(http_server.url, "stream", working_folder=str(tmp_path))
+
+    assert os.listdir(input_folder) == [http_server.file_name]
+    assert pickle.dumps(netex_data) == pickle.dumps(read_netex_file(netex_file, "stream"))
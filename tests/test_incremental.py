@@ -0,0 +1,103 @@
+import copy
+import os
+import zipfile
+
+import pytest
+
+from main import (BookingArrangementRecord, ConversionContext, ConversionResources, HrdfWriter, ServiceJourneyRecord,
+                  convert_from_netex, init_hrdf, read_netex_file)
+
+
+@pytest.fixture(scope="module")
+def resources() -> ConversionResources:
+    return ConversionResources("utf-8")
+
+
+@pytest.fixture
+def netex_data(netex_file):
+    return read_netex_file(netex_file, "stream")
+
+
+# convert the records and return the content of the HRDF files and the counters of the run
+def convert(netex_data, resources, zip_file_path, fragment_cache_folder=None, workers=1):
+    with HrdfWriter(None, "utf-8") as hrdf_writer:
+        context = ConversionContext(hrdf_writer, resources)
+        init_hrdf(context)
+        convert_from_netex([], "netex.xml", context, workers=workers, netex_data=copy.deepcopy(netex_data),
+                           fragment_cache_folder=fragment_cache_folder)
+        hrdf_writer.write_to_zip(str(zip_file_path))
+
+    with zipfile.ZipFile(zip_file_path) as zip_file:
+        return {name: zip_file.read(name) for name in zip_file.namelist()}, context.metrics.counters
+
+
+# new service journeys (with a service journey pattern of another flexible line, thus with new pseudo stops and
+# regions) and a new infotext for the first two flexible lines, all the following ids change
+def edit(netex_data):
+    for flexible_line in netex_data.flexible_lines[:2]:
+        netex_data.service_journeys.append(ServiceJourneyRecord(flexible_line.id, "ch:1:AvailabilityCondition:0",
+                                                                "ch:1:ServiceJourneyPattern:5_0"))
+        flexible_line.booking_arrangements.append(BookingArrangementRecord("ch:1:BookingArrangement:XQ_9", "New"))
+
+
+def test_unchanged_flexible_lines_are_reused(netex_data, resources, tmp_path):
+    fragment_cache_folder = str(tmp_path / "fragments")
+
+    hrdf_files, counters = convert(netex_data, resources, tmp_path / "first.zip", fragment_cache_folder)
+    assert counters["flexible_lines_reused"] == 0
+
+    cache_path = os.path.join(fragment_cache_folder, "flexible_lines.pickle")
+    cache_modified = os.path.getmtime(cache_path)
+
+    # the cache is not written again if nothing changed
+    assert convert(netex_data, resources, tmp_path / "second.zip", fragment_cache_folder) == (hrdf_files, counters |
+                                                                                              {"flexible_lines_reused": 6})
+    assert os.path.getmtime(cache_path) == cache_modified
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_incremental_conversion_equals_the_full_conversion(netex_data, resources, tmp_path, workers):
+    fragment_cache_folder = str(tmp_path / "fragments")
+    convert(netex_data, resources, tmp_path / "first.zip", fragment_cache_folder)
+
+    edit(netex_data)
+    hrdf_files, counters = convert(netex_data, resources, tmp_path / "incremental.zip", fragment_cache_folder, workers)
+
+    # only the edited flexible lines are converted, the others are moved to their new ids
+    assert counters["flexible_lines_reused"] == 4
+    assert hrdf_files == convert(netex_data, resources, tmp_path / "full.zip")[0]
+
+    # and the moved fragments are kept with their new ids
+    hrdf_files, counters = convert(netex_data, resources, tmp_path / "again.zip", fragment_cache_folder)
+    assert counters["flexible_lines_reused"] == 6
+    assert hrdf_files == convert(netex_data, resources, tmp_path / "full.zip")[0]
+
+
+# an unreadable cache is ignored and replaced
+def test_corrupt_fragment_cache(netex_data, resources, tmp_path):
+    fragment_cache_folder = tmp_path / "fragments"
+    fragment_cache_folder.mkdir()
+    (fragment_cache_folder / "flexible_lines.pickle").write_bytes(b"not a pickle")
+
+    hrdf_files, counters = convert(netex_data, resources, tmp_path / "first.zip", str(fragment_cache_folder))
+
+    assert counters["flexible_lines_reused"] == 0
+    assert hrdf_files == convert(netex_data, resources, tmp_path / "full.zip")[0]
+    assert convert(netex_data, resources, tmp_path / "second.zip",
+                   str(fragment_cache_folder))[1]["flexible_lines_reused"] == 6
+
+
+# the regular stops share the ids of the BAHNHOF with the pseudo stops, the ones with an id in the range of the pseudo
+# stops of a moved flexible line keep their id
+def test_regular_stops_with_ids_of_pseudo_stops_are_not_moved(netex_data, resources, tmp_path):
+    for index, stop_place in enumerate(netex_data.stop_places):
+        stop_place.public_code = str(9500000 + index)
+
+    fragment_cache_folder = str(tmp_path / "fragments")
+    convert(netex_data, resources, tmp_path / "first.zip", fragment_cache_folder)
+
+    edit(netex_data)
+    hrdf_files, counters = convert(netex_data, resources, tmp_path / "incremental.zip", fragment_cache_folder)
+
+    assert counters["flexible_lines_reused"] == 4
+    assert hrdf_files == convert(netex_data, resources, tmp_path / "full.zip")[0]
@@ -0,0 +1,44 @@
+import copy
+
+from main import AvailabilityConditionRecord, NetexData, merge_netex_data
+
+
+def make_netex_data(from_date: str, to_date: str, condition_id: str, valid_day_bits: str) -> NetexData:
+    return NetexData(from_date=from_date, to_date=to_date, valid_day_bits=[valid_day_bits],
+                     availability_conditions=[AvailabilityConditionRecord(condition_id, "08:00:00", "18:00:00",
+                                                                          valid_day_bits)])
+
+
+def test_merge_shifts_the_valid_day_bits_of_a_later_file():
+    first = make_netex_data("2024-12-15T00:00:00", "2024-12-24T00:00:00", "ac:1", "1111100000")
+    second = make_netex_data("2024-12-20T00:00:00", "2024-12-29T00:00:00", "ac:2", "1010101010")
+
+    merged_netex_data = merge_netex_data([first, second])
+
+    assert merged_netex_data.from_date == "2024-12-15T00:00:00"
+    assert merged_netex_data.to_date == "2024-12-29T00:00:00"
+    assert merged_netex_data.valid_day_bits == ["1111100000", "000001010101010"]
+    assert [availability_condition.valid_day_bits
+            for availability_condition in merged_netex_data.availability_conditions] == merged_netex_data.valid_day_bits
+
+
+# the bits shifted beyond the end of the merged period are cut
+def test_merge_cuts_the_valid_day_bits_at_the_end_of_the_period():
+    first = make_netex_data("2024-12-15T00:00:00", "2024-12-24T00:00:00", "ac:1", "1111111111")
+    second = make_netex_data("2024-12-17T00:00:00", "2024-12-24T00:00:00", "ac:2", "1111111111")
+
+    merged_netex_data = merge_netex_data([first, second])
+
+    assert merged_netex_data.valid_day_bits == ["1111111111", "0011111111"]
+    assert merged_netex_data.availability_conditions[1].valid_day_bits == "0011111111"
+
+
+# the records of the files (e.g., kept in the NeTEx cache) are not changed by the merge
+def test_merge_does_not_change_the_given_records():
+    netex_datas = [make_netex_data("2024-12-15T00:00:00", "2024-12-24T00:00:00", "ac:1", "1111100000"),
+                   make_netex_data("2024-12-20T00:00:00", "2024-12-29T00:00:00", "ac:2", "1010101010")]
+    original_netex_datas = copy.deepcopy(netex_datas)
+
+    merge_netex_data(netex_datas)
+
+    assert netex_datas == original_netex_datas
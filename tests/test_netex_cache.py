@@ -0,0 +1,49 @@
+import os
+import shutil
+
+import main
+from main import NetexCache, read_netex_file
+
+
+def test_netex_records_are_loaded_from_the_cache(netex_file, tmp_path, monkeypatch):
+    netex_cache_folder = str(tmp_path / "netex_cache")
+    netex_data = read_netex_file(netex_file, "stream", netex_cache_folder=netex_cache_folder)
+
+    assert len(os.listdir(netex_cache_folder)) == 1
+
+    # the same content under another name is not parsed again
+    copied_netex_file = str(tmp_path / "copy.xml")
+    shutil.copy(netex_file, copied_netex_file)
+    monkeypatch.setattr(main, "read_netex", lambda netex_source, netex_parser: None)
+
+    assert read_netex_file(copied_netex_file, "stream", netex_cache_folder=netex_cache_folder) == netex_data
+
+
+# a truncated entry is read anew and replaced
+def test_corrupt_netex_cache_entry(netex_file, tmp_path):
+    netex_cache_folder = str(tmp_path / "netex_cache")
+    netex_data = read_netex_file(netex_file, "stream", netex_cache_folder=netex_cache_folder)
+
+    netex_cache = NetexCache(netex_cache_folder)
+    path = netex_cache.get_path(netex_cache.get_key(netex_file))
+    with open(path, 'r+b') as file:
+        file.truncate(100)
+
+    assert read_netex_file(netex_file, "stream", netex_cache_folder=netex_cache_folder) == netex_data
+    assert netex_cache.load(netex_cache.get_key(netex_file)) == netex_data
+
+
+def test_netex_cache_keeps_the_recently_used_entries(netex_file, tmp_path):
+    netex_cache = NetexCache(str(tmp_path / "netex_cache"), max_entries=2)
+    netex_data = read_netex_file(netex_file, "stream")
+
+    for key, modified in [("a", 1), ("b", 2), ("c", 3)]:
+        netex_cache.store(key, netex_data)
+        os.utime(netex_cache.get_path(key), (modified, modified))
+
+    assert netex_cache.load("a") is None
+    assert netex_cache.load("b") == netex_data  # now the most recently used one
+
+    netex_cache.store("d", netex_data)
+
+    assert sorted(os.listdir(netex_cache.folder)) == ["b.pickle", "d.pickle"]
@@ -0,0 +1,73 @@
+import random
+import sys
+
+import pytest
+
+from main import StopGeometry, StopPlaceRecord, is_point_in_polygon
+
+
+# stops on a coarse lattice (thus on vertices and edges of the polygons, too) and randomly placed ones, and some
+# without proper coordinates
+def make_stop_places(seed: int) -> list[StopPlaceRecord]:
+    rng = random.Random(seed)
+    coordinates = [(f"{7 + column * 0.025:.3f}", f"{46 + row * 0.025:.3f}") for column in range(20) for row in range(20)]
+    coordinates.extend((f"{rng.uniform(6.9, 7.6):.6f}", f"{rng.uniform(45.9, 46.6):.6f}") for _ in range(2000))
+    coordinates.extend([("nan", "46.1"), ("7.1", "inf")])
+
+    return [StopPlaceRecord(f"85{index:05d}", f"Stop {index}", longitude, latitude)
+            for index, (longitude, latitude) in enumerate(coordinates)]
+
+
+def make_polygons(seed: int) -> list[list[tuple[float, float]]]:
+    rng = random.Random(seed)
+    polygons = [
+        # axis-parallel edges through the lattice points
+        [(7.05, 46.05), (7.2, 46.05), (7.2, 46.2), (7.05, 46.2)],
+        # concave, with vertices on lattice points
+        [(7.0, 46.0), (7.3, 46.0), (7.3, 46.3), (7.15, 46.1), (7.0, 46.3)],
+        # a triangle covering most of the stops (more cells than are occupied)
+        [(6.0, 45.0), (9.0, 45.0), (7.5, 48.0)]
+    ]
+
+    # star shaped polygons around random centers
+    for _ in range(20):
+        center_longitude, center_latitude = rng.uniform(7.0, 7.5), rng.uniform(46.0, 46.5)
+        vertices = rng.randint(3, 16)
+        polygons.append([(center_longitude + radius * rng.choice([-1, 1]) * abs(rng.gauss(0, 1)),
+                          center_latitude + radius * rng.choice([-1, 1]) * abs(rng.gauss(0, 1)))
+                         for radius in [rng.uniform(0.01, 0.2)] for _ in range(vertices)])
+
+    return polygons
+
+
+@pytest.mark.parametrize("with_numpy", [True, False])
+def test_stops_in_polygon_are_the_ones_of_is_point_in_polygon(monkeypatch, with_numpy):
+    if with_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setitem(sys.modules, "numpy", None)
+
+    stop_places = make_stop_places(1)
+    stop_geometry = StopGeometry(stop_places)
+    assert (stop_geometry.numpy is not None) == with_numpy
+
+    for polygon in make_polygons(2):
+        expected_stop_places = [stop_place for stop_place in stop_places if
+                                is_point_in_polygon((float(stop_place.longitude), float(stop_place.latitude)),
+                                                    polygon)]
+
+        assert stop_geometry.get_stops_in_polygon(polygon) == expected_stop_places
+        # and again from the cache
+        assert stop_geometry.get_stops_in_polygon(list(polygon)) == expected_stop_places
+
+
+def test_candidates_of_a_polygon_cover_its_stops():
+    stop_places = make_stop_places(3)
+    stop_geometry = StopGeometry(stop_places, cell_size=0.01)
+
+    for polygon in make_polygons(4):
+        candidate_indices = set(stop_geometry.get_candidate_indices_of_polygon(polygon))
+
+        assert candidate_indices >= set(stop_geometry.get_indices_in_polygon(polygon))
+
+    assert stop_geometry.get_stops_in_polygon([]) == []
@@ -0,0 +1,251 @@
+import hashlib
+from ftplib import error_perm
+
+import pytest
+
+from main import Uploader
+
+DATA = bytes(range(256)) * 20  # 5120 bytes
+
+
+# a file on the stub SFTP server
+class StubRemoteFile:
+    def __init__(self, server, path: str, mode: str):
+        self.server = server
+        self.path = path
+        self.position = 0
+        self.writes = 0
+
+        if mode == 'wb':
+            server.files[path] = bytearray()
+        elif path not in server.files:
+            raise FileNotFoundError(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # the acknowledgements of the pipelined writes arrive, one of them is an error
+        if self.writes > 0 and self.server.lost_writes:
+            self.server.lost_writes = set()
+            raise OSError("connection lost")
+
+    def seek(self, offset: int):
+        self.position = offset
+
+    def set_pipelined(self, pipelined: bool):
+        pass
+
+    def prefetch(self, file_size=None):
+        pass
+
+    def check(self, hash_algorithm: str, offset: int = 0, length: int = 0, block_size: int = 0) -> bytes:
+        if not self.server.check_file:
+            raise IOError("Operation unsupported")
+
+        self.server.checks += 1
+        content = self.server.files[self.path]
+        return hashlib.new(hash_algorithm, bytes(content[offset:offset + length if length else None])).digest()
+
+    def read(self, size: int) -> bytes:
+        content = self.server.files[self.path]
+        chunk = bytes(content[self.position:self.position + size])
+        self.position += len(chunk)
+        return chunk
+
+    def write(self, chunk: bytes):
+        content = self.server.files[self.path]
+        lost = self.writes in self.server.lost_writes
+        self.writes += 1
+
+        if len(content) < self.position + len(chunk):
+            content.extend(bytes(self.position + len(chunk) - len(content)))
+        if not lost:
+            content[self.position:self.position + len(chunk)] = chunk
+        self.position += len(chunk)
+
+
+class StubStat:
+    def __init__(self, st_size: int):
+        self.st_size = st_size
+
+
+# an SFTP server keeping the files in memory, writes with the given indices are lost (leaving a gap)
+class StubSftp:
+    def __init__(self, check_file: bool = False, lost_writes=()):
+        self.files = {}
+        self.check_file = check_file
+        self.checks = 0
+        self.lost_writes = set(lost_writes)
+
+    def stat(self, path: str) -> StubStat:
+        if path not in self.files:
+            raise FileNotFoundError(path)
+
+        return StubStat(len(self.files[path]))
+
+    def open(self, path: str, mode: str) -> StubRemoteFile:
+        return StubRemoteFile(self, path, mode)
+
+    def posix_rename(self, old_path: str, new_path: str):
+        self.files[new_path] = self.files.pop(old_path)
+
+    def get_channel(self):
+        raise OSError("no channel")
+
+
+@pytest.fixture
+def zip_file(tmp_path):
+    path = tmp_path / "hrdf.zip"
+    path.write_bytes(DATA)
+    return path
+
+
+def upload_with_sftp(sftp: StubSftp, zip_file) -> int:
+    with open(zip_file, 'rb') as file:
+        return Uploader(chunk_size=100).upload_with_sftp(sftp, file, len(DATA), "out/hrdf.zip", "out/hrdf.zip.part")
+
+
+def test_sftp_upload_resumes_from_matching_partial_file(zip_file):
+    sftp = StubSftp()
+    sftp.files["out/hrdf.zip.part"] = bytearray(DATA[:3000])
+
+    assert upload_with_sftp(sftp, zip_file) == 3000
+    assert sftp.files == {"out/hrdf.zip": bytearray(DATA)}
+
+
+@pytest.mark.parametrize("check_file", [False, True])
+def test_sftp_upload_restarts_if_partial_file_has_a_gap(zip_file, check_file):
+    partial = bytearray(DATA[:3000])
+    partial[100:200] = bytes(100)  # a lost pipelined write, the end of the file still matches
+    sftp = StubSftp(check_file=check_file)
+    sftp.files["out/hrdf.zip.part"] = partial
+
+    assert upload_with_sftp(sftp, zip_file) == 0
+    assert sftp.files == {"out/hrdf.zip": bytearray(DATA)}
+    assert sftp.checks == (1 if check_file else 0)
+
+
+def test_sftp_upload_retries_an_upload_with_a_lost_write(zip_file, monkeypatch):
+    sftp = StubSftp(lost_writes={3})
+    monkeypatch.setattr(Uploader, "connect", lambda self, ftp: sftp)
+
+    uploader = Uploader(backoff=0.0, chunk_size=100)
+    metrics = uploader.upload(str(zip_file), {'protocol': 'sftp', 'url': 'stub', 'port': '22', 'user': 'user',
+                                              'password': 'password', 'path': 'out/'})
+
+    assert metrics['retries'] == 1
+    assert metrics['resumed_bytes'] == 0  # the partial file had a gap, thus it was uploaded anew
+    assert sftp.files == {"out/hrdf.zip": bytearray(DATA)}
+
+
+def test_copy_to_folder(zip_file, tmp_path):
+    target = tmp_path / "target"
+    target.mkdir()
+
+    metrics = Uploader().upload(str(zip_file), {'protocol': 'file', 'url': '', 'port': '0', 'user': '',
+                                                'password': '', 'path': str(target) + "/"})
+
+    assert metrics['bytes'] == len(DATA)
+    assert (target / "hrdf.zip").read_bytes() == DATA
+    assert not (target / "hrdf.zip.part").exists()
+
+
+# an FTPS server keeping the files in memory, hashes the files with HASH if hash_command is set
+class StubFtps:
+    def __init__(self, hash_command: bool = False, replaces_files: bool = True):
+        self.files = {}
+        self.hash_command = hash_command
+        self.replaces_files = replaces_files
+        self.commands = []
+
+    def size(self, path: str) -> int:
+        if path not in self.files:
+            raise error_perm(f"550 {path}: No such file")
+
+        return len(self.files[path])
+
+    def sendcmd(self, command: str) -> str:
+        self.commands.append(command)
+
+        if not self.hash_command:
+            raise error_perm("500 Unknown command")
+        if command.startswith("OPTS"):
+            return "200 SHA-256"
+
+        path = command.split(" ", 1)[1]
+        content = bytes(self.files[path])
+        return f"213 SHA-256 0-{len(content) - 1} {hashlib.sha256(content).hexdigest()} {path}"
+
+    def retrbinary(self, command: str, callback, blocksize: int = 8192):
+        self.commands.append(command)
+        content = bytes(self.files[command.split(" ", 1)[1]])
+        for start in range(0, len(content), blocksize):
+            callback(content[start:start + blocksize])
+
+    def storbinary(self, command: str, file, blocksize: int = 8192, rest=None):
+        path = command.split(" ", 1)[1]
+        content = self.files[path][:rest] if rest else bytearray()
+        for chunk in iter(lambda: file.read(blocksize), b""):
+            content.extend(chunk)
+        self.files[path] = content
+
+    def rename(self, old_path: str, new_path: str):
+        if old_path not in self.files:
+            raise error_perm(f"550 {old_path}: No such file")
+        if new_path in self.files and not self.replaces_files:
+            raise error_perm(f"553 {new_path}: File exists")
+
+        self.files[new_path] = self.files.pop(old_path)
+
+    def delete(self, path: str):
+        del self.files[path]
+
+
+def upload_with_ftps(ftps: StubFtps, zip_file) -> int:
+    with open(zip_file, 'rb') as file:
+        return Uploader(chunk_size=100).upload_with_ftps(ftps, file, len(DATA), "out/hrdf.zip", "out/hrdf.zip.part")
+
+
+@pytest.mark.parametrize("hash_command", [False, True])
+def test_ftps_upload_resumes_from_matching_partial_file(zip_file, hash_command):
+    ftps = StubFtps(hash_command=hash_command)
+    ftps.files["out/hrdf.zip.part"] = bytearray(DATA[:3000])
+
+    assert upload_with_ftps(ftps, zip_file) == 3000
+    assert ftps.files == {"out/hrdf.zip": bytearray(DATA)}
+    assert ("RETR out/hrdf.zip.part" in ftps.commands) != hash_command
+
+
+@pytest.mark.parametrize("hash_command", [False, True])
+def test_ftps_upload_restarts_if_partial_file_differs(zip_file, hash_command):
+    ftps = StubFtps(hash_command=hash_command)
+    ftps.files["out/hrdf.zip.part"] = bytearray(DATA[1000:4000])  # left by the upload of another file
+
+    assert upload_with_ftps(ftps, zip_file) == 0
+    assert ftps.files == {"out/hrdf.zip": bytearray(DATA)}
+
+
+def test_ftps_upload_replaces_an_existing_file(zip_file):
+    ftps = StubFtps(replaces_files=False)
+    ftps.files["out/hrdf.zip"] = bytearray(b"old")
+
+    assert upload_with_ftps(ftps, zip_file) == 0
+    assert ftps.files == {"out/hrdf.zip": bytearray(DATA)}
+
+
+def test_ftps_upload_keeps_the_temporary_file_if_the_rename_fails(zip_file):
+    def rename(old_path: str, new_path: str):
+        raise error_perm("550 Permission denied")
+
+    ftps = StubFtps()
+    ftps.rename = rename
+    ftps.delete = lambda path: pytest.fail(f"deleted {path}, which does not exist")
+
+    with pytest.raises(error_perm):
+        upload_with_ftps(ftps, zip_file)
+
+    assert ftps.files == {"out/hrdf.zip.part": bytearray(DATA)}
@@ -0,0 +1,156 @@
+import io
+import zipfile
+
+import pytest
+
+from main import HrdfWriter, ZipMemberStream, ZipNotStreamableError, compress_zip_member, write_zip
+
+
+MEMBERS = {
+    "FPLAN": b"*Z 000001 000001   101\r\n" * 5000,
+    "BAHNHOF": "8500001  Zürich HB\r\n".encode("iso-8859-1"),
+    "EMPTY": b""
+}
+
+
+# write the members with write_zip and read them back with zipfile
+@pytest.mark.parametrize("compression_level", [0, 1, 9])
+def test_zip_round_trip(compression_level):
+    zip_members = [compress_zip_member(name, io.BytesIO(content), compression_level, chunk_size=1000)
+                   for name, content in sorted(MEMBERS.items())]
+
+    zip_file = io.BytesIO()
+    write_zip(zip_file, zip_members)
+
+    with zipfile.ZipFile(io.BytesIO(zip_file.getvalue())) as reader:
+        assert reader.testzip() is None
+        assert reader.namelist() == sorted(MEMBERS)
+
+        for info in reader.infolist():
+            assert reader.read(info.filename) == MEMBERS[info.filename]
+            assert info.date_time == (1980, 1, 1, 0, 0, 0)
+            assert info.compress_type == (zipfile.ZIP_STORED if compression_level == 0 else zipfile.ZIP_DEFLATED)
+
+
+# the handle is read from the start and left at its end to append further lines
+def test_compress_zip_member_keeps_the_handle_at_its_end():
+    handle = io.BytesIO(MEMBERS["FPLAN"])
+
+    zip_member = compress_zip_member("FPLAN", handle, 6)
+
+    assert handle.tell() == len(MEMBERS["FPLAN"])
+    assert zip_member.size == len(MEMBERS["FPLAN"])
+
+
+# the same HRDF content gives the same zip, whatever the number of threads and the order of writing
+def test_write_to_zip_is_deterministic(tmp_path):
+    zip_file_paths = []
+
+    for threads, names in [(1, sorted(MEMBERS)), (3, sorted(MEMBERS, reverse=True))]:
+        with HrdfWriter(None, "iso-8859-1") as writer:
+            for name in names:
+                writer.truncate(name)
+                writer.write_lines(name, MEMBERS[name].decode("iso-8859-1").split("\r\n")[:-1])
+
+            zip_file_path = str(tmp_path / f"hrdf_{threads}.zip")
+            writer.write_to_zip(zip_file_path, threads=threads)
+            zip_file_paths.append(zip_file_path)
+
+    with open(zip_file_paths[0], 'rb') as first, open(zip_file_paths[1], 'rb') as second:
+        assert first.read() == second.read()
+
+    with zipfile.ZipFile(zip_file_paths[0]) as reader:
+        assert {name: reader.read(name) for name in reader.namelist()} == MEMBERS
+
+
+# a source returning at most a few bytes per read, like a download arriving in small chunks
+class TrickleSource:
+    def __init__(self, data: bytes, chunk_size: int = 7):
+        self.data = io.BytesIO(data)
+        self.chunk_size = chunk_size
+
+    def read(self, size: int = -1) -> bytes:
+        return self.data.read(self.chunk_size if size is None or size < 0 else min(size, self.chunk_size))
+
+
+# a file without seek, thus zipfile writes the sizes of the members in data descriptors after their data
+class UnseekableFile(io.RawIOBase):
+    def __init__(self):
+        self.data = io.BytesIO()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        return self.data.write(data)
+
+
+XML = b"<PublicationDelivery>" + b"<Line id='1'/>" * 20000 + b"</PublicationDelivery>"
+
+
+def make_zip(members: list[tuple[str, bytes, int]], seekable: bool = True) -> bytes:
+    zip_file = io.BytesIO() if seekable else UnseekableFile()
+
+    with zipfile.ZipFile(zip_file, 'w') as writer:
+        for name, content, compress_type in members:
+            if seekable:
+                writer.writestr(name, content, compress_type)
+            else:
+                zip_info = zipfile.ZipInfo(name)
+                zip_info.compress_type = compress_type
+
+                with writer.open(zip_info, 'w') as member:
+                    member.write(content)
+
+    return zip_file.getvalue() if seekable else zip_file.data.getvalue()
+
+
+def read_all(stream, size: int) -> bytes:
+    return b"".join(iter(lambda: stream.read(size), b""))
+
+
+@pytest.mark.parametrize("compress_type", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED])
+@pytest.mark.parametrize("size", [-1, 1000])
+def test_zip_member_stream_reads_the_xml_member(compress_type, size):
+    data = make_zip([("readme.txt", b"not the NeTEx" * 100, zipfile.ZIP_DEFLATED), ("netex.xml", XML, compress_type),
+                     ("other.txt", b"after the NeTEx", zipfile.ZIP_STORED)])
+
+    stream = ZipMemberStream(TrickleSource(data, 1000), chunk_size=100)
+
+    assert stream.member == "netex.xml"
+    assert read_all(stream, size) == XML
+
+
+def test_zip_member_stream_reads_the_given_member():
+    data = make_zip([("a.xml", b"<a/>", zipfile.ZIP_DEFLATED), ("b.xml", XML, zipfile.ZIP_DEFLATED)])
+
+    assert read_all(ZipMemberStream(TrickleSource(data), "b.xml"), 4096) == XML
+
+
+# a deflated member knows its end, even if its size is only in the data descriptor
+def test_zip_member_stream_reads_a_member_with_a_data_descriptor():
+    data = make_zip([("netex.xml", XML, zipfile.ZIP_DEFLATED)], seekable=False)
+
+    assert read_all(ZipMemberStream(TrickleSource(data, 4096)), 4096) == XML
+
+
+# the data of a member before the XML cannot be skipped without its size
+def test_zip_member_stream_is_not_streamable_after_a_data_descriptor():
+    data = make_zip([("readme.txt", b"not the NeTEx", zipfile.ZIP_DEFLATED), ("netex.xml", XML, zipfile.ZIP_DEFLATED)],
+                    seekable=False)
+
+    with pytest.raises(ZipNotStreamableError):
+        ZipMemberStream(TrickleSource(data))
+
+
+def test_zip_member_stream_without_an_xml_member():
+    with pytest.raises(ZipNotStreamableError):
+        ZipMemberStream(io.BytesIO(make_zip([("readme.txt", b"no NeTEx", zipfile.ZIP_STORED)])))
+
+
+def test_zip_member_stream_of_a_truncated_zip():
+    data = make_zip([("netex.xml", XML, zipfile.ZIP_DEFLATED)])
+    stream = ZipMemberStream(io.BytesIO(data[:len(data) // 2]))
+
+    with pytest.raises(ValueError):
+        read_all(stream, 4096)